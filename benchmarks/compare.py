@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""Compares benchmark results of two revisions and flags regressions.
+
+Exits with status 1 if any benchmark of the head revision is slower than
+the base revision by more than the threshold.
+"""
+
+from __future__ import print_function
+
+import argparse
+import sys
+
+from history import compare, current_revision, DEFAULT_HISTORY, load_results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('base', help="Revision to compare against.")
+    parser.add_argument(
+        'head', nargs='?', default=None,
+        help="Revision to compare (default: current revision).")
+    parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help="Relative slow down counting as regression (default: 0.1).")
+    parser.add_argument('--history', default=DEFAULT_HISTORY)
+    args = parser.parse_args(argv)
+
+    head = current_revision() if args.head is None else args.head
+    comparison = compare(
+        load_results(args.history), args.base, head, args.threshold)
+    if len(comparison) == 0:
+        print("No benchmarks measured in both revisions.", file=sys.stderr)
+        return 2
+
+    regressions = 0
+    for name, base_seconds, head_seconds, ratio, regression in comparison:
+        print(
+            '{flag} {name:<45} {base:10.4f} s {head:10.4f} s {r:6.2f}x'.format(
+                flag='!' if regression else ' ', name=name,
+                base=base_seconds, head=head_seconds, r=ratio))
+        regressions += regression
+    if regressions > 0:
+        print("{} regression(s) above {:.0%}.".format(
+            regressions, args.threshold), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""Generates synthetic data sets for benchmarks.
+
+The content is deterministic for a given seed, so results of different
+revisions are comparable.
+"""
+
+import errno
+import os.path
+import random
+
+
+BLOCK_SIZE = 1024 * 1024
+
+
+class Scale(object):
+    """Shape of a generated tree.
+
+    Parameters
+    ----------
+    num_files : int
+        Number of tiny files.
+    file_size : int
+        Size of the tiny files in bytes.
+    depth : int
+        Nesting depth of the directories holding the tiny files.
+    fanout : int
+        Number of subdirectories per directory.
+    huge_files : int
+        Number of huge files.
+    huge_size : int
+        Size of the huge files in bytes.
+    """
+    def __init__(self, num_files, file_size=64, depth=3, fanout=10,
+                 huge_files=0, huge_size=0):
+        self.num_files = num_files
+        self.file_size = file_size
+        self.depth = depth
+        self.fanout = fanout
+        self.huge_files = huge_files
+        self.huge_size = huge_size
+
+
+SCALES = {
+    'tiny': Scale(100, depth=2, fanout=4, huge_files=1, huge_size=BLOCK_SIZE),
+    'small': Scale(10 ** 4, huge_files=2, huge_size=16 * BLOCK_SIZE),
+    'medium': Scale(10 ** 5, depth=4, huge_files=2, huge_size=256 * BLOCK_SIZE),
+    'large': Scale(
+        10 ** 6, depth=5, huge_files=4, huge_size=1024 * BLOCK_SIZE),
+}
+
+
+def tiny_file_path(root, i, scale):
+    """Returns the path of the `i`-th tiny file."""
+    parts = []
+    for _ in range(scale.depth):
+        parts.append('d{}'.format(i % scale.fanout))
+        i //= scale.fanout
+    return os.path.join(root, *(parts + ['f{}'.format(i)]))
+
+
+def _makedirs(fs, path, created):
+    if path in created:
+        return
+    try:
+        fs.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    created.add(path)
+
+
+def _tiny_content(i, size, generation=0):
+    line = u'file {} generation {}\n'.format(i, generation).encode('ascii')
+    return (line * (size // len(line) + 1))[:size]
+
+
+def generate_tree(fs, root, scale, seed=42):
+    """Writes a tree of tiny files and a few huge files.
+
+    Parameters
+    ----------
+    fs : obj
+        Object providing file system functions.
+    root : str
+        Directory to write the tree to.
+    scale : :class:`Scale`
+        Shape of the tree.
+    seed : int, optional
+        Seed of the generated content.
+
+    Returns
+    -------
+    int
+        Total number of bytes written.
+    """
+    created = set()
+    total = 0
+    for i in range(scale.num_files):
+        path = tiny_file_path(root, i, scale)
+        _makedirs(fs, os.path.dirname(path), created)
+        with fs.open(path, 'wb') as f:
+            f.write(_tiny_content(i, scale.file_size))
+        total += scale.file_size
+
+    rng = random.Random(seed)
+    block = bytearray(rng.randint(0, 255) for _ in range(BLOCK_SIZE))
+    _makedirs(fs, os.path.join(root, 'huge'), created)
+    for i in range(scale.huge_files):
+        path = os.path.join(root, 'huge', 'h{}'.format(i))
+        with fs.open(path, 'wb') as f:
+            remaining = scale.huge_size
+            while remaining > 0:
+                # Distinct prefixes avoid identical content across files.
+                chunk = (u'{} {}'.format(i, remaining).encode('ascii') +
+                         bytes(block))[:min(remaining, BLOCK_SIZE)]
+                f.write(chunk)
+                remaining -= len(chunk)
+        total += scale.huge_size
+    return total
+
+
+def modify_tree(fs, root, scale, fraction, generation, seed=42):
+    """Rewrites a fraction of the tiny files as in append-mostly histories.
+
+    Parameters
+    ----------
+    fs : obj
+        Object providing file system functions.
+    root : str
+        Directory containing the tree.
+    scale : :class:`Scale`
+        Shape of the tree.
+    fraction : float
+        Fraction of tiny files to modify.
+    generation : int
+        Number of the modification, changing the written content.
+    seed : int, optional
+        Seed for the selection of files.
+
+    Returns
+    -------
+    int
+        Number of modified files.
+    """
+    rng = random.Random(seed + generation)
+    count = max(1, int(fraction * scale.num_files))
+    for i in rng.sample(range(scale.num_files), count):
+        with fs.open(tiny_file_path(root, i, scale), 'ab') as f:
+            f.write(_tiny_content(i, scale.file_size, generation))
+    return count
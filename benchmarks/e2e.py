@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""End-to-end benchmarks of fridge operations on synthetic trees.
+
+Each run generates a tree, then measures ``init``, the initial ``commit``,
+a re-commit without changes, ``diff`` and a re-commit after changing 1% of
+the files, ``log`` after an append-mostly history and a ``checkout`` of the
+first commit. The results are appended to a history file.
+"""
+
+from __future__ import print_function
+
+import argparse
+import shutil
+import sys
+import tempfile
+import timeit
+
+from fridge.core import Fridge, FridgeCore, NothingToCommitError
+import fridge.fs
+from fridge.memoryfs import MemoryFS
+
+from datagen import generate_tree, modify_tree, SCALES
+from history import append_results, DEFAULT_HISTORY
+
+
+def commit(fridge_obj, message):
+    try:
+        fridge_obj.commit(message)
+    except NothingToCommitError:
+        pass
+
+
+def run_scenario(fs, root, scale, commits):
+    """Runs the benchmark scenario.
+
+    Parameters
+    ----------
+    fs : obj
+        Object providing file system functions.
+    root : str
+        Empty directory to create the repository in.
+    scale : :class:`datagen.Scale`
+        Shape of the generated tree.
+    commits : int
+        Length of the history for the ``log`` and ``checkout`` benchmarks.
+
+    Returns
+    -------
+    list
+        Tuples of operation names and durations in seconds.
+    """
+    timings = []
+
+    def measure(operation, func, *args):
+        start = timeit.default_timer()
+        func(*args)
+        timings.append((operation, timeit.default_timer() - start))
+
+    generate_tree(fs, root, scale)
+    measure('init', FridgeCore.init, root, fs)
+    core = FridgeCore(root, fs)
+    fridge_obj = Fridge(core, fs)
+    measure('commit', commit, fridge_obj, u'Initial commit.')
+    first = core.get_head_key()
+    measure('recommit-unchanged', commit, fridge_obj, u'No changes.')
+
+    modify_tree(fs, root, scale, 0.01, 1)
+    measure('diff', fridge_obj.diff)
+    measure('recommit-1%', commit, fridge_obj, u'Changed 1%.')
+    for generation in range(2, commits):
+        modify_tree(fs, root, scale, 0.01, generation)
+        commit(fridge_obj, u'Generation {}.'.format(generation))
+    measure('log', fridge_obj.log)
+    measure('checkout', fridge_obj.checkout, first)
+    return timings
+
+
+def run(fs_name, scale_name, commits):
+    """Runs the scenario on a fresh file system.
+
+    Parameters
+    ----------
+    fs_name : str
+        ``'memory'`` for :class:`fridge.memoryfs.MemoryFS` or ``'real'``
+        for a temporary directory.
+    scale_name : str
+        Key of :data:`datagen.SCALES`.
+    commits : int
+        Length of the history.
+
+    Returns
+    -------
+    list
+        Results to store in the history.
+    """
+    scale = SCALES[scale_name]
+    if fs_name == 'memory':
+        fs, root, tmpdir = MemoryFS(), 'repo', None
+        fs.mkdir(root)
+    else:
+        fs = fridge.fs
+        root = tmpdir = tempfile.mkdtemp(prefix='fridge-bench-')
+    try:
+        timings = run_scenario(fs, root, scale, commits)
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+    return [{
+        'benchmark': 'e2e.{op}[{fs},{scale}]'.format(
+            op=operation, fs=fs_name, scale=scale_name),
+        'seconds': seconds,
+        'files': scale.num_files + scale.huge_files,
+    } for operation, seconds in timings]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--fs', choices=['memory', 'real', 'both'], default='both')
+    parser.add_argument(
+        '--scale', choices=sorted(SCALES.keys()), default='small')
+    parser.add_argument(
+        '--commits', type=int, default=10,
+        help="Length of the generated history.")
+    parser.add_argument('--history', default=DEFAULT_HISTORY)
+    parser.add_argument(
+        '--no-save', action='store_true',
+        help="Do not append the results to the history.")
+    args = parser.parse_args(argv)
+
+    fs_names = ['memory', 'real'] if args.fs == 'both' else [args.fs]
+    results = []
+    for fs_name in fs_names:
+        results.extend(run(fs_name, args.scale, args.commits))
+    for result in results:
+        print('{benchmark:<45} {seconds:10.4f} s'.format(**result))
+    if not args.no_save:
+        append_results(args.history, results)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Stores benchmark results in a history file for comparison across
+revisions.
+
+The history is a JSON lines file with one result per line. Each result has
+at least the keys ``revision``, ``timestamp``, ``benchmark`` and
+``seconds``.
+"""
+
+import json
+import os.path
+import subprocess
+import time
+
+
+DEFAULT_HISTORY = os.path.join(os.path.dirname(__file__), 'results.jsonl')
+
+
+def current_revision():
+    """Returns the abbreviated git commit of the working tree.
+
+    Returns
+    -------
+    str
+        The commit or ``'unknown'`` if it cannot be determined.
+    """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def append_results(path, results, revision=None):
+    """Appends results to a history file.
+
+    Parameters
+    ----------
+    path : str
+        Path of the history file.
+    results : sequence of dict
+        Results with at least the keys ``benchmark`` and ``seconds``.
+    revision : str, optional
+        Revision the results belong to. Defaults to
+        :func:`current_revision`.
+    """
+    if revision is None:
+        revision = current_revision()
+    timestamp = time.time()
+    with open(path, 'a') as f:
+        for result in results:
+            record = dict(result, revision=revision, timestamp=timestamp)
+            f.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def load_results(path):
+    """Loads all results from a history file.
+
+    Parameters
+    ----------
+    path : str
+        Path of the history file.
+
+    Returns
+    -------
+    list
+        The results in the order they were stored.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def best_times(results, revision):
+    """Returns the fastest duration of each benchmark of a revision.
+
+    Parameters
+    ----------
+    results : sequence of dict
+        Results as returned by :func:`load_results`.
+    revision : str
+        Revision to select. A prefix of the stored revision suffices.
+
+    Returns
+    -------
+    dict
+        Durations in seconds by benchmark name.
+    """
+    best = {}
+    for result in results:
+        if result['revision'].startswith(revision) or revision.startswith(
+                result['revision']):
+            name = result['benchmark']
+            best[name] = min(best.get(name, result['seconds']),
+                             result['seconds'])
+    return best
+
+
+def compare(results, base, head, threshold=0.1):
+    """Compares the benchmark durations of two revisions.
+
+    Parameters
+    ----------
+    results : sequence of dict
+        Results as returned by :func:`load_results`.
+    base : str
+        Revision to compare against.
+    head : str
+        Revision to compare.
+    threshold : float, optional
+        Relative slow down above which a benchmark counts as regression.
+
+    Returns
+    -------
+    list
+        Tuples ``(benchmark, base_seconds, head_seconds, ratio,
+        is_regression)`` for all benchmarks measured in both revisions.
+    """
+    base_times = best_times(results, base)
+    head_times = best_times(results, head)
+    comparison = []
+    for name in sorted(set(base_times) & set(head_times)):
+        ratio = head_times[name] / max(base_times[name], 1e-9)
+        comparison.append((
+            name, base_times[name], head_times[name], ratio,
+            ratio > 1. + threshold))
+    return comparison
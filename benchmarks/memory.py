@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+"""Peak memory benchmarks of operations materializing whole snapshots or
+histories.
+
+For each number of files, a repository with a synthetic snapshot of that
+size and a history of ``--commits`` commits is created. The worktree is left
+empty, so ``diff`` reports every file as removed. Each operation then runs in
+a fresh process that reports the peak Python heap allocated during the
+operation (measured with :mod:`tracemalloc`) and the peak resident set size
+of the process.
+
+With ``--check``, the peak heap is compared against a budget of a fixed
+allowance plus a number of bytes per file (or per commit for ``log``). With
+several numbers of files, the growth of the peak heap per added file between
+consecutive numbers must also stay within the budget per file, which the
+fixed allowance cannot hide. The exit status is 1 if any budget is exceeded.
+The results are appended to a history file. Their durations include the
+overhead of :mod:`tracemalloc` and are not comparable to those of the other
+benchmarks.
+"""
+
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os.path
+import resource
+import shutil
+import stat
+import sys
+import tempfile
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from fridge.core import Fridge, FridgeCore, SnapshotItem, Stat
+
+from history import append_results, DEFAULT_HISTORY
+
+
+BASE_ALLOWANCE = 4 * 1024 * 1024
+
+# Peak heap budgets in bytes per file (per commit for log) on top of
+# BASE_ALLOWANCE.
+BUDGETS = {
+    'snapshot.read': 1024,
+    'snapshot.add': 512,
+    'diff': 1024,
+    'log': 1024,
+}
+
+
+def create_snapshot(num_files):
+    status = Stat(
+        st_mode=stat.S_IFREG | 0o644, st_size=1234, st_atime=1.5e9,
+        st_mtime=1.5e9)
+    return [SnapshotItem(
+        '{:064x}'.format(i),
+        os.path.join(os.curdir, 'd{}'.format(i // 1000), 'f{}'.format(i)),
+        status) for i in range(num_files)]
+
+
+def create_repository(root, num_files, commits):
+    """Creates a repository without blobs and an empty worktree.
+
+    Parameters
+    ----------
+    root : str
+        Empty directory to create the repository in.
+    num_files : int
+        Number of files in the snapshot of the head commit.
+    commits : int
+        Number of commits in the history of the head.
+    """
+    core = FridgeCore.init(root)
+    small = core.add_snapshot(create_snapshot(1))
+    for _ in range(commits - 1):
+        core.advance_head(core.add_commit(small, u'Commit.'))
+    key = core.add_snapshot(create_snapshot(num_files))
+    core.advance_head(core.add_commit(key, u'Commit.'))
+
+
+def setup_snapshot_read(root, num_files):
+    core = FridgeCore(root)
+    key = core.read_commit(core.get_head_key()).snapshot
+    return lambda: core.read_snapshot(key)
+
+
+def setup_snapshot_add(root, num_files):
+    core = FridgeCore(root)
+    snapshot = create_snapshot(num_files)
+    return lambda: core.add_snapshot(snapshot)
+
+
+def setup_diff(root, num_files):
+    return Fridge(FridgeCore(root)).diff
+
+
+def setup_log(root, num_files):
+    return Fridge(FridgeCore(root)).log
+
+
+OPERATIONS = [
+    ('snapshot.read', setup_snapshot_read),
+    ('snapshot.add', setup_snapshot_add),
+    ('diff', setup_diff),
+    ('log', setup_log),
+]
+
+
+def max_rss():
+    """Returns the peak resident set size of the process in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kibibytes and macOS bytes.
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def measure(setup, root, num_files):
+    """Measures an operation in the calling process.
+
+    Parameters
+    ----------
+    setup : callable
+        Function taking `root` and `num_files` and returning the operation
+        as function without arguments. Memory allocated by `setup` does not
+        count towards the peak heap.
+    root : str
+        Path of the repository.
+    num_files : int
+        Number of files in the snapshot of the head commit.
+
+    Returns
+    -------
+    dict
+        The keys ``seconds``, ``peak_bytes`` for the Python heap and
+        ``rss_bytes`` for the resident set size.
+    """
+    func = setup(root, num_files)
+    tracemalloc.start()
+    try:
+        start = timeit.default_timer()
+        func()
+        seconds = timeit.default_timer() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': seconds, 'peak_bytes': peak, 'rss_bytes': max_rss()}
+
+
+def run(file_counts, commits, selected=None):
+    """Runs the memory benchmarks.
+
+    Parameters
+    ----------
+    file_counts : sequence of int
+        Numbers of files to run the benchmarks with.
+    commits : int
+        Length of the history for the ``log`` benchmark.
+    selected : sequence of str, optional
+        Names of the operations to run. By default all are run.
+
+    Returns
+    -------
+    list
+        Results to store in the history.
+    """
+    results = []
+    for num_files in file_counts:
+        tmpdir = tempfile.mkdtemp(prefix='fridge-memory-')
+        try:
+            create_repository(tmpdir, num_files, commits)
+            for name, setup in OPERATIONS:
+                if selected and name not in selected:
+                    continue
+                # A fresh process per operation keeps the peak RSS of one
+                # operation from hiding that of the next.
+                pool = multiprocessing.Pool(1)
+                try:
+                    result = pool.apply(measure, (setup, tmpdir, num_files))
+                finally:
+                    pool.close()
+                    pool.join()
+                result.update(
+                    benchmark='memory.{name}[files={n}]'.format(
+                        name=name, n=num_files),
+                    operation=name, files=num_files, commits=commits)
+                results.append(result)
+        finally:
+            shutil.rmtree(tmpdir)
+    return results
+
+
+def budget_items(result):
+    """Returns the number of items a result is budgeted by."""
+    return result['commits'] if result['operation'] == 'log' else (
+        result['files'])
+
+
+def budget(result):
+    """Returns the peak heap budget of a result in bytes."""
+    return BASE_ALLOWANCE + BUDGETS[result['operation']] * budget_items(
+        result)
+
+
+def growth(result, previous):
+    """Returns the growth of the peak heap per item in bytes.
+
+    Parameters
+    ----------
+    result : dict
+        Result of an operation.
+    previous : dict
+        Result of the same operation with fewer items.
+
+    Returns
+    -------
+    float or None
+        Growth per added item or ``None`` if the number of items is equal.
+    """
+    added = budget_items(result) - budget_items(previous)
+    if added <= 0:
+        return None
+    return (result['peak_bytes'] - previous['peak_bytes']) / float(added)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--files', type=int, nargs='+', default=[10 ** 4],
+        help="Numbers of files to measure, e.g. 10000 100000 1000000.")
+    parser.add_argument('--commits', type=int, default=1000)
+    parser.add_argument(
+        '--check', action='store_true',
+        help="Exit with status 1 if a peak heap exceeds its budget.")
+    parser.add_argument(
+        'operations', nargs='*', metavar='operation',
+        help="Operations to measure (default: all).")
+    parser.add_argument('--history', default=DEFAULT_HISTORY)
+    parser.add_argument(
+        '--no-save', action='store_true',
+        help="Do not append the results to the history.")
+    args = parser.parse_args(argv)
+    if tracemalloc is None:
+        parser.error("tracemalloc is not available.")
+
+    results = run(args.files, args.commits, args.operations)
+    exceeded = False
+    previous = {}
+    for result in results:
+        flag = ''
+        if result['peak_bytes'] > budget(result):
+            flag = '  OVER BUDGET'
+        per_item = None
+        if result['operation'] in previous:
+            per_item = growth(result, previous[result['operation']])
+        if per_item is not None and per_item > BUDGETS[result['operation']]:
+            flag += '  GROWTH {:.0f} B/ITEM OVER BUDGET'.format(per_item)
+        previous[result['operation']] = result
+        exceeded = exceeded or flag != ''
+        print('{benchmark:<35} {seconds:8.4f} s  heap {heap:8.1f} MiB  '
+              'rss {rss:8.1f} MiB{flag}'.format(
+                  heap=result['peak_bytes'] / 2. ** 20,
+                  rss=result['rss_bytes'] / 2. ** 20, flag=flag, **result))
+    if not args.no_save:
+        append_results(args.history, results)
+    return 1 if args.check and exceeded else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""Micro-benchmarks of the serialization and time conversion hot paths.
+
+Each benchmark runs an operation once per item of a workload and reports
+the best total duration of several repetitions. The results are appended to
+a history file.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os.path
+import stat
+import sys
+import timeit
+
+from fridge.core import Commit, SnapshotItem, Stat
+from fridge.time import timestamp2utc, utc2timestamp, utc_time
+
+from history import append_results, DEFAULT_HISTORY
+
+
+def create_items(n):
+    status = Stat(
+        st_mode=stat.S_IFREG | 0o644, st_size=1234, st_atime=1.5e9,
+        st_mtime=1.5e9)
+    return [SnapshotItem(
+        '{:040x}'.format(i), os.path.join(os.curdir, 'dir', 'file{}'.format(i)),
+        status) for i in range(n)]
+
+
+def create_commits(n):
+    return [Commit(1.5e9 + i, '{:040x}'.format(i), u'Commit message.',
+                   '{:040x}'.format(i + 1)) for i in range(n)]
+
+
+def bench_snapshot_item_parse(n):
+    lines = [item.serialize() for item in create_items(n)]
+    return lambda: [SnapshotItem.parse(line) for line in lines]
+
+
+def bench_snapshot_item_serialize(n):
+    items = create_items(n)
+    return lambda: [item.serialize() for item in items]
+
+
+def bench_commit_parse(n):
+    serialized = [c.serialize() for c in create_commits(n)]
+    return lambda: [Commit.parse(s) for s in serialized]
+
+
+def bench_commit_serialize(n):
+    commits = create_commits(n)
+    return lambda: [c.serialize() for c in commits]
+
+
+# SnapshotItem adds nothing to the DataObject methods.
+def bench_data_object_init(n):
+    args = [('{:040x}'.format(i), 'path', None) for i in range(n)]
+    return lambda: [SnapshotItem(*a) for a in args]
+
+
+def bench_data_object_eq(n):
+    a = create_items(n)
+    b = create_items(n)
+    return lambda: [x == y for x, y in zip(a, b)]
+
+
+def bench_timestamp2utc(n):
+    timestamps = [1.5e9 + i for i in range(n)]
+    return lambda: [timestamp2utc(t) for t in timestamps]
+
+
+def bench_utc2timestamp(n):
+    timestamps = [1.5e9 + i for i in range(n)]
+    return lambda: [utc2timestamp(t) for t in timestamps]
+
+
+def bench_utc_time(n):
+    return lambda: [utc_time() for _ in range(n)]
+
+
+BENCHMARKS = [
+    ('snapshot_item.parse', bench_snapshot_item_parse),
+    ('snapshot_item.serialize', bench_snapshot_item_serialize),
+    ('commit.parse', bench_commit_parse),
+    ('commit.serialize', bench_commit_serialize),
+    ('data_object.init', bench_data_object_init),
+    ('data_object.eq', bench_data_object_eq),
+    ('time.timestamp2utc', bench_timestamp2utc),
+    ('time.utc2timestamp', bench_utc2timestamp),
+    ('time.utc_time', bench_utc_time),
+]
+
+
+def run(items, repeat, selected=None):
+    """Runs the micro-benchmarks.
+
+    Parameters
+    ----------
+    items : int
+        Number of items per workload.
+    repeat : int
+        Number of repetitions of which the fastest is reported.
+    selected : sequence of str, optional
+        Names of the benchmarks to run. By default all are run.
+
+    Returns
+    -------
+    list
+        Results to store in the history.
+    """
+    results = []
+    for name, setup in BENCHMARKS:
+        if selected and name not in selected:
+            continue
+        func = setup(items)
+        seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+        results.append({
+            'benchmark': 'micro.{name}[{n}]'.format(name=name, n=items),
+            'seconds': seconds,
+            'items': items,
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=10 ** 6)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument(
+        'benchmarks', nargs='*', metavar='benchmark',
+        help="Benchmarks to run (default: all).")
+    parser.add_argument('--history', default=DEFAULT_HISTORY)
+    parser.add_argument(
+        '--no-save', action='store_true',
+        help="Do not append the results to the history.")
+    args = parser.parse_args(argv)
+
+    results = run(args.items, args.repeat, args.benchmarks)
+    for result in results:
+        print('{benchmark:<45} {seconds:10.4f} s'.format(**result))
+    if not args.no_save:
+        append_results(args.history, results)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
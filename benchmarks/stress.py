@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""Stress test with several processes writing to one repository.
+
+Each process works in its own worktree and randomly commits, creates
+branches, checks out branches and reads the log. Afterwards, the repository
+is verified. The throughput, the latency percentiles per operation and the
+time spent waiting for the repository lock are reported. The exit status is
+1 if the repository is inconsistent.
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import multiprocessing
+import os.path
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+from fridge.core import Fridge, FridgeCore, FridgeError
+from fridge import trace
+from fridge.verify import verify
+
+from history import append_results, DEFAULT_HISTORY
+
+
+OPERATIONS = ['commit', 'commit', 'branch', 'checkout', 'log']
+
+
+def work(worktree, index, operations, num_files, seed, queue):
+    """Runs random operations in a worktree and reports to a queue."""
+    sink = trace.MemorySink()
+    trace.set_sink(sink)
+    fridge_obj = Fridge(FridgeCore(worktree))
+    rng = random.Random(seed + index)
+    branches = ['w{}'.format(index)]
+    latencies = []
+    errors = collections.Counter()
+    for i in range(operations):
+        op = rng.choice(OPERATIONS)
+        start = timeit.default_timer()
+        try:
+            if op == 'commit':
+                path = os.path.join(
+                    worktree, 'f{}'.format(rng.randrange(num_files)))
+                with open(path, 'w') as f:
+                    f.write(u'process {} operation {}\n'.format(index, i))
+                fridge_obj.commit(u'Operation {}.'.format(i))
+            elif op == 'branch':
+                name = 'w{}-{}'.format(index, i)
+                fridge_obj.branch(name)
+                branches.append(name)
+            elif op == 'checkout':
+                fridge_obj.checkout(rng.choice(branches))
+            else:
+                fridge_obj.log()
+        except FridgeError as e:
+            errors[type(e).__name__] += 1
+        latencies.append((op, timeit.default_timer() - start))
+
+    locks = [r for r in sink.records if r['name'] == 'core.lock']
+    queue.put({
+        'latencies': latencies,
+        'errors': dict(errors),
+        'lock_acquisitions': len(locks),
+        'lock_retries': sum(r.get('retries', 0) for r in locks),
+        'lock_wait': sum(r['duration'] for r in locks),
+    })
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[int(round(q * (len(values) - 1)))]
+
+
+def run(processes, operations, num_files, seed=42):
+    """Runs the stress test in a temporary directory.
+
+    Parameters
+    ----------
+    processes : int
+        Number of concurrent processes.
+    operations : int
+        Number of operations per process.
+    num_files : int
+        Number of files per worktree.
+    seed : int, optional
+        Seed of the random operations.
+
+    Returns
+    -------
+    tuple
+        The elapsed time in seconds, the reports of the processes and the
+        problems found by :func:`fridge.verify.verify`.
+    """
+    tmpdir = tempfile.mkdtemp(prefix='fridge-stress-')
+    try:
+        root = os.path.join(tmpdir, 'repo')
+        os.mkdir(root)
+        core = FridgeCore.init(root)
+        for i in range(num_files):
+            with open(os.path.join(root, 'f{}'.format(i)), 'w') as f:
+                f.write(u'initial\n')
+        fridge_obj = Fridge(core)
+        fridge_obj.commit(u'Initial commit.')
+
+        worktrees = []
+        for i in range(processes):
+            core.set_branch('w{}'.format(i), core.get_head_key())
+            worktree = os.path.join(tmpdir, 'wt{}'.format(i))
+            fridge_obj.add_worktree(worktree, 'w{}'.format(i))
+            worktrees.append(worktree)
+
+        queue = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=work, args=(
+            worktree, i, operations, num_files, seed, queue))
+                   for i, worktree in enumerate(worktrees)]
+        start = timeit.default_timer()
+        for worker in workers:
+            worker.start()
+        reports = [queue.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        elapsed = timeit.default_timer() - start
+
+        problems = verify(FridgeCore(root))
+    finally:
+        shutil.rmtree(tmpdir)
+    return elapsed, reports, problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--processes', type=int, default=8)
+    parser.add_argument(
+        '--operations', type=int, default=50,
+        help="Number of operations per process.")
+    parser.add_argument(
+        '--files', type=int, default=20,
+        help="Number of files per worktree.")
+    parser.add_argument('--history', default=DEFAULT_HISTORY)
+    parser.add_argument(
+        '--no-save', action='store_true',
+        help="Do not append the results to the history.")
+    args = parser.parse_args(argv)
+
+    elapsed, reports, problems = run(
+        args.processes, args.operations, args.files)
+
+    suffix = '[processes={}]'.format(args.processes)
+    by_op = collections.defaultdict(list)
+    for report in reports:
+        for op, seconds in report['latencies']:
+            by_op[op].append(seconds)
+    total_ops = sum(len(v) for v in by_op.values())
+    print("Throughput: {:.1f} operations/s".format(total_ops / elapsed))
+    results = [{
+        'benchmark': 'stress.seconds_per_operation' + suffix,
+        'seconds': elapsed / total_ops}]
+    for op in sorted(by_op):
+        stats = [(q, percentile(by_op[op], q)) for q in (0.5, 0.95, 0.99)]
+        print("{op:<10} {stats} max {m:.4f} s".format(
+            op=op, m=max(by_op[op]), stats=' '.join(
+                'p{:.0f} {:.4f} s'.format(100 * q, v) for q, v in stats)))
+        results.extend({
+            'benchmark': 'stress.{op}.p{q:.0f}{s}'.format(
+                op=op, q=100 * q, s=suffix),
+            'seconds': v} for q, v in stats)
+
+    lock_wait = sum(r['lock_wait'] for r in reports)
+    print("Lock: {a} acquisitions, {r} retries, {w:.4f} s waiting".format(
+        a=sum(r['lock_acquisitions'] for r in reports),
+        r=sum(r['lock_retries'] for r in reports), w=lock_wait))
+    results.append(
+        {'benchmark': 'stress.lock_wait' + suffix, 'seconds': lock_wait})
+    errors = collections.Counter()
+    for report in reports:
+        errors.update(report['errors'])
+    for name, count in sorted(errors.items()):
+        print("Error {}: {}".format(name, count))
+
+    for problem in problems:
+        print("Inconsistency:", problem)
+    if not args.no_save:
+        append_results(args.history, results)
+    return 1 if len(problems) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""Provides the export of snapshots as tar archives and their import.
+
+Archives can be restored with any tar implementation, so the data stays
+accessible without fridge.
+"""
+
+import os.path
+import stat
+import tarfile
+
+from fridge.core import BranchCheckedOutError, FridgeError, SnapshotItem, Stat
+import fridge.fs
+
+
+def write_archive(core, commit_key, fileobj, compress=False, fs=fridge.fs):
+    """Streams the snapshot of a commit as tar archive.
+
+    The archive is created directly from the stored blobs without touching
+    the working tree. The blobs are read in the order of their location on
+    disk. Paths with the same content are added as separate regular members
+    to keep their modes and times, and their blob is read again while it is
+    still cached.
+
+    Parameters
+    ----------
+    core : :class:`fridge.core.FridgeCore`
+        Repository containing the commit.
+    commit_key : str
+        Key of the commit to archive.
+    fileobj : :term:`file object`
+        Binary stream to write the archive to. It does not need to be
+        seekable.
+    compress : bool, optional
+        Whether to gzip compress the archive.
+    fs : obj, optional
+        Object providing file system functions.
+    """
+    snapshot = core.read_snapshot(core.read_commit(commit_key).snapshot)
+    by_key = {}
+    for item in snapshot:
+        by_key.setdefault(item.checksum, []).append(item)
+    core.prefetch_blobs(by_key.keys())
+
+    blobs = []
+    for key in by_key:
+        path = core.get_blob_path(key)
+        blobs.append((getattr(fs.stat(path), 'st_ino', 0), key, path))
+    blobs.sort()
+
+    mode = 'w|gz' if compress else 'w|'
+    with tarfile.open(
+            fileobj=fileobj, mode=mode, format=tarfile.PAX_FORMAT) as tar:
+        for _, key, path in blobs:
+            for item in by_key[key]:
+                with fs.open(path, 'rb') as f:
+                    tar.addfile(_create_tarinfo(item), f)
+
+
+def _create_tarinfo(item):
+    info = tarfile.TarInfo(archive_name(item.path))
+    info.size = item.status.st_size
+    info.mode = stat.S_IMODE(item.status.st_mode)
+    info.mtime = item.status.st_mtime
+    info.pax_headers = {u'atime': u'{:.3f}'.format(item.status.st_atime)}
+    return info
+
+
+def archive_name(path):
+    """Converts a snapshot path to a member name in an archive.
+
+    Parameters
+    ----------
+    path : str
+        Path as stored in a snapshot.
+
+    Returns
+    -------
+    str
+        Relative path with ``/`` as separator.
+    """
+    return '/'.join(os.path.normpath(path).split(os.sep))
+
+
+def import_archive(core, fileobj, branch, message=u''):
+    """Commits the content of a tar archive to a branch.
+
+    The archive is read in a single pass and each member is hashed while it
+    is streamed into the object store. The snapshot is built from the member
+    headers, so no working copy is written. Only regular files and hard
+    links are imported.
+
+    Parameters
+    ----------
+    core : :class:`fridge.core.FridgeCore`
+        Repository to import into.
+    fileobj : :term:`file object`
+        Binary stream to read the archive from. It does not need to be
+        seekable and may be gzip, bzip2 or xz compressed.
+    branch : str
+        Name of the branch to commit to. The commit will be a child of the
+        branch's tip or the root of a new history if the branch does not
+        exist.
+    message : str, optional
+        Commit message.
+
+    Returns
+    -------
+    str
+        Key of the created commit.
+    """
+    # Updating the branch would leave the working tree outdated.
+    if core.is_checked_out(branch):
+        raise BranchCheckedOutError()
+
+    items = {}
+    with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+        for member in tar:
+            if member.isreg():
+                key = core.add_blob_from_stream(
+                    tar.extractfile(member), stat.S_IMODE(member.mode))
+                size = member.size
+            elif member.islnk():
+                target = items.get(snapshot_path(member.linkname))
+                if target is None:
+                    raise InvalidArchiveError(
+                        "Hard link to unknown member {!r}.".format(
+                            member.linkname))
+                key = target.checksum
+                size = target.status.st_size
+            else:
+                continue
+            path = snapshot_path(member.name)
+            items[path] = SnapshotItem(key, path, _create_stat(member, size))
+
+    snapshot_key = core.add_snapshot([items[path] for path in sorted(items)])
+    with core.lock():
+        parent = u''
+        if core.is_branch(branch):
+            parent = core.resolve_branch(branch)
+        commit = core.add_commit(snapshot_key, message, parent)
+        core.set_branch(branch, commit)
+    return commit
+
+
+def _create_stat(member, size):
+    mtime = float(member.mtime)
+    atime = float(member.pax_headers.get(u'atime', mtime))
+    return Stat(
+        st_mode=stat.S_IFREG | stat.S_IMODE(member.mode), st_size=size,
+        st_atime=atime, st_mtime=mtime)
+
+
+def snapshot_path(name):
+    """Converts a member name in an archive to a snapshot path.
+
+    Parameters
+    ----------
+    name : str
+        Member name with ``/`` as separator. Leading slashes are ignored.
+
+    Returns
+    -------
+    str
+        Path as stored in a snapshot.
+
+    Raises
+    ------
+    :class:`InvalidArchiveError`
+        If the name refers to a location outside of the archive root.
+    """
+    parts = [p for p in name.split('/') if p not in ('', '.')]
+    if len(parts) == 0 or '..' in parts:
+        raise InvalidArchiveError("Invalid member name {!r}.".format(name))
+    return os.path.join(os.curdir, *parts)
+
+
+class InvalidArchiveError(FridgeError):
+    pass
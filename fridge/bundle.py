@@ -0,0 +1,235 @@
+"""Provides bundles to transfer history without a connection between
+repositories.
+
+A bundle is a single file written and read in one sequential pass. It
+starts with the line ``fridge-bundle 1 <compression>`` followed by the
+(optionally gzip compressed) body. The body lists the prerequisite commits
+(``base <key>``) and the branches (``branch <key> <name>``) terminated by an
+empty line. The objects follow as ``<kind> <key> <size>`` lines, each
+followed by the raw content of the object: blobs first, then snapshots and
+finally the commits, oldest first. The bundle ends with an ``end`` line.
+"""
+
+import gzip
+
+from fridge.core import (
+    BranchCheckedOutError, CorruptObjectError, FridgeError,
+    NonFastForwardError, UnknownReferenceError)
+import fridge.fs
+from fridge.remote import find_missing_objects, is_ancestor
+
+
+MAGIC = b'fridge-bundle'
+VERSION = b'1'
+NO_COMPRESSION = b'none'
+GZIP = b'gzip'
+
+BLOB = b'blob'
+SNAPSHOT = b'snapshot'
+COMMIT = b'commit'
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def create_bundle(
+        core, fileobj, branches, bases=(), compress=False, fs=fridge.fs):
+    """Writes a bundle with the history of branches.
+
+    Parameters
+    ----------
+    core : :class:`fridge.core.FridgeCore`
+        Repository containing the branches.
+    fileobj : :term:`file object`
+        Binary stream to write the bundle to.
+    branches : sequence of str
+        Names of the branches to include.
+    bases : sequence of str, optional
+        Keys of commits the receiving repository already has. These
+        commits and their history are excluded from the bundle.
+    compress : bool, optional
+        Whether to gzip compress the bundle.
+    fs : obj, optional
+        Object providing file system functions.
+    """
+    tips = []
+    for name in branches:
+        if not core.is_branch(name):
+            raise UnknownReferenceError(name)
+        tips.append((name, core.resolve_branch(name)))
+
+    known = set()
+    for base in bases:
+        key = base
+        while key and key not in known:
+            known.add(key)
+            key = core.read_commit(key).parent
+
+    commits = []
+    snapshots = []
+    blobs = []
+    seen_blobs = set()
+    for _, tip in tips:
+        missing = find_missing_objects(core, tip, known.__contains__)
+        commits.extend(reversed(missing.commits))
+        snapshots.extend(missing.snapshots)
+        known.update(missing.commits)
+        for key in missing.blobs:
+            if key not in seen_blobs:
+                seen_blobs.add(key)
+                blobs.append(key)
+
+    fileobj.write(b' '.join(
+        [MAGIC, VERSION, GZIP if compress else NO_COMPRESSION]) + b'\n')
+    body = fileobj
+    if compress:
+        body = gzip.GzipFile(fileobj=fileobj, mode='wb')
+    try:
+        for base in bases:
+            body.write(b'base ' + base.encode('ascii') + b'\n')
+        for name, tip in tips:
+            body.write(u'branch {k} {n}\n'.format(k=tip, n=name).encode(
+                'utf-8'))
+        body.write(b'\n')
+
+        for kind, storage, keys in [
+                (BLOB, core.blobs, blobs),
+                (SNAPSHOT, core.snapshots, snapshots),
+                (COMMIT, core.commits, commits)]:
+            if kind == BLOB:
+                core.prefetch_blobs(keys)
+            for key in keys:
+                _write_object(fs, body, kind, storage.get_path(key), key)
+        body.write(b'end\n')
+    finally:
+        if compress:
+            body.close()
+
+
+def _write_object(fs, body, kind, path, key):
+    size = fs.stat(path).st_size
+    body.write(b' '.join([kind, key.encode('ascii'), str(size).encode(
+        'ascii')]) + b'\n')
+    with fs.open(path, 'rb') as f:
+        buf = f.read(CHUNK_SIZE)
+        while len(buf) > 0:
+            body.write(buf)
+            buf = f.read(CHUNK_SIZE)
+
+
+def unbundle(core, fileobj, fs=fridge.fs):
+    """Reads a bundle into a repository.
+
+    The branches in the bundle will be created or fast-forwarded after all
+    objects were stored. Branches checked out in a worktree are refused
+    before anything is stored.
+
+    Parameters
+    ----------
+    core : :class:`fridge.core.FridgeCore`
+        Repository to read the bundle into.
+    fileobj : :term:`file object`
+        Binary stream to read the bundle from.
+    fs : obj, optional
+        Object providing file system functions.
+
+    Returns
+    -------
+    list
+        Tuples of the names and commit keys of the branches in the bundle.
+    """
+    header = fileobj.readline().split()
+    if len(header) != 3 or header[0] != MAGIC or header[1] != VERSION:
+        raise InvalidBundleError("Not a fridge bundle.")
+    body = fileobj
+    if header[2] == GZIP:
+        body = gzip.GzipFile(fileobj=fileobj, mode='rb')
+    elif header[2] != NO_COMPRESSION:
+        raise InvalidBundleError("Unknown compression.")
+
+    branches = []
+    line = body.readline()
+    while line.strip() != b'':
+        fields = line.decode('utf-8').rstrip('\n').split(' ', 2)
+        if fields[0] == u'base':
+            if not core.is_commit(fields[1]):
+                raise MissingPrerequisiteError(fields[1])
+        elif fields[0] == u'branch':
+            if len(fields) < 3 or not core.is_valid_branch_name(fields[2]):
+                raise InvalidBundleError("Invalid branch name.")
+            branches.append((fields[2], fields[1]))
+        else:
+            raise InvalidBundleError("Invalid header line.")
+        line = body.readline()
+    _check_not_checked_out(core, branches)
+
+    storages = {
+        BLOB: core.blobs, SNAPSHOT: core.snapshots, COMMIT: core.commits}
+    commits = []
+    line = body.readline()
+    while line.strip() != b'end':
+        try:
+            kind, key, size = line.split()
+            storage = storages[kind]
+        except (KeyError, ValueError):
+            raise InvalidBundleError("Invalid object header.")
+        key = key.decode('ascii')
+        stored = _read_object(fs, body, storage, key, int(size))
+        if stored and kind == COMMIT:
+            commits.append(key)
+        line = body.readline()
+
+    with core.lock():
+        _check_not_checked_out(core, branches)
+        for name, tip in branches:
+            if core.is_branch(name):
+                old = core.resolve_branch(name)
+                if old and not is_ancestor(core, old, tip):
+                    raise NonFastForwardError(name)
+
+        for key in commits:
+            core.index_commit(key)
+        for name, tip in branches:
+            core.set_branch(name, tip)
+    return branches
+
+
+def _check_not_checked_out(core, branches):
+    # Updating the branch would leave the working tree outdated.
+    for name, _ in branches:
+        if core.is_checked_out(name):
+            raise BranchCheckedOutError()
+
+
+def _read_object(fs, body, storage, key, size):
+    if storage.contains(key):
+        _skip(body, size)
+        return False
+    tmp_file = storage.mktemp()
+    with fs.open(tmp_file, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            buf = body.read(min(CHUNK_SIZE, remaining))
+            if len(buf) == 0:
+                raise InvalidBundleError("Unexpected end of bundle.")
+            f.write(buf)
+            remaining -= len(buf)
+    if storage.store(tmp_file) != key:
+        raise CorruptObjectError(key)
+    return True
+
+
+def _skip(body, size):
+    remaining = size
+    while remaining > 0:
+        buf = body.read(min(CHUNK_SIZE, remaining))
+        if len(buf) == 0:
+            raise InvalidBundleError("Unexpected end of bundle.")
+        remaining -= len(buf)
+
+
+class InvalidBundleError(FridgeError):
+    pass
+
+
+class MissingPrerequisiteError(FridgeError):
+    pass
@@ -5,8 +5,11 @@ import hashlib
 import os
 import os.path
 import stat
+import string
+import uuid
 
 import fridge.fs
+from fridge import trace
 
 
 class ContentAddressableStorage(object):
@@ -28,37 +31,202 @@ class ContentAddressableStorage(object):
         """The root directory of the storage."""
         return self._root
 
-    def store(self, filepath):
+    def store(self, filepath, keep=False):
         """Stores a file in the storage.
 
-        The original file will be deleted.
+        By default, the original file will be deleted.
 
         Parameters
         ----------
         filepath : str
             The path to the file to store.
+        keep : bool, optional
+            Whether to keep the original file. It is then cloned into the
+            storage if the file system supports copy-on-write clones and
+            otherwise copied while it is hashed. Either way, the file is
+            read only once.
 
         Returns
         -------
         str
             Key to retrieve the stored file.
         """
+        if keep:
+            return self._store_copy(filepath)
         key = self._calc_checksum(filepath)
-        target_path = self.get_path(key)
-        if self._fs.exists(target_path):
+        if self._fs.exists(self.get_path(key)):
             return key
+        mode = stat.S_IMODE(self._fs.stat(filepath).st_mode)
+        self._move_into_place(filepath, key, mode)
+        return key
+
+    def _store_copy(self, filepath):
+        mode = stat.S_IMODE(self._fs.stat(filepath).st_mode)
+        reflink = getattr(self._fs, 'reflink', None)
+        if reflink is not None:
+            tmp_path = self.mktemp()
+            try:
+                reflink(filepath, tmp_path)
+            except OSError:
+                pass
+            else:
+                # The clone shares the data blocks, so hashing it reads the
+                # original data once and the key matches the stored content.
+                key = self._calc_checksum(tmp_path)
+                if self.contains(key):
+                    self._fs.unlink(tmp_path)
+                else:
+                    self._move_into_place(tmp_path, key, mode)
+                return key
+        with self._open_sequential(filepath) as f:
+            return self.store_stream(f, mode)
+
+    def _open_sequential(self, path):
+        # Reading with the sequential read path of fridge.fs keeps bulk
+        # reads from changing access times and evicting the page cache.
+        open_sequential = getattr(self._fs, 'open_sequential', None)
+        if open_sequential is None:
+            return self._fs.open(path, 'rb')
+        return open_sequential(path)
+
+    def store_stream(
+            self, stream, mode=stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH):
+        """Stores the content read from a stream.
+
+        The content is hashed while it is written to the storage, so it is
+        read only once.
+
+        Parameters
+        ----------
+        stream : :term:`file object`
+            Binary stream to read the content from until its end.
+        mode : int, optional
+            Permissions of the stored file. Write permissions will be
+            removed.
+
+        Returns
+        -------
+        str
+            Key to retrieve the stored file.
+        """
+        tmp_path = self.mktemp()
+        blocksize = self._get_blocksize(os.path.dirname(tmp_path))
+        h = hashlib.sha1()
+        with trace.span('cas.write') as span:
+            with self._fs.open(tmp_path, 'wb') as f:
+                buf = stream.read(blocksize)
+                while len(buf) > 0:
+                    h.update(buf)
+                    f.write(buf)
+                    span.add('bytes', len(buf))
+                    buf = stream.read(blocksize)
+        key = h.hexdigest()
+        if self._fs.exists(self.get_path(key)):
+            self._fs.unlink(tmp_path)
+        else:
+            self._move_into_place(tmp_path, key, mode)
+        return key
+
+    def store_buffer(
+            self, buf, mode=stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH):
+        """Stores the content of a buffer.
+
+        The content is hashed before it is written, so nothing is written
+        if the storage already contains it.
+
+        Parameters
+        ----------
+        buf : bytes-like object
+            Object supporting the buffer protocol, e.g. :class:`bytes`,
+            :class:`memoryview` or a C-contiguous NumPy array.
+        mode : int, optional
+            Permissions of the stored file. Write permissions will be
+            removed.
+
+        Returns
+        -------
+        str
+            Key to retrieve the stored file.
+        """
+        view = memoryview(buf)
+        key = hashlib.sha1(view).hexdigest()
+        if self._fs.exists(self.get_path(key)):
+            return key
+        tmp_path = self.mktemp()
+        with trace.span('cas.write'):
+            with self._fs.open(tmp_path, 'wb') as f:
+                f.write(view)
+        self._move_into_place(tmp_path, key, mode)
+        return key
+
+    def _move_into_place(self, filepath, key, mode):
+        target_path = self.get_path(key)
+        with trace.span('cas.move'):
+            try:
+                self._fs.makedirs(os.path.dirname(target_path))
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+
+            self._fs.rename(filepath, target_path)
+            store_mode = mode & (stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            self._fs.chmod(target_path, store_mode)
 
+    def contains(self, key):
+        """Checks whether a file is stored.
+
+        Parameters
+        ----------
+        key : str
+            Key of the file.
+
+        Returns
+        -------
+        bool
+            ``True`` if a file with the key is stored.
+        """
+        return self._fs.exists(self.get_path(key))
+
+    def keys(self):
+        """Iterates over the keys of all stored files.
+
+        Returns
+        -------
+        iterator
+            Keys of the stored files in no particular order.
+        """
+        if not self._fs.exists(self._root):
+            return
+        for dirpath, dirnames, filenames in self._fs.walk(self._root):
+            if dirpath == self._root:
+                dirnames[:] = [d for d in dirnames if self._is_key_dir(d)]
+                continue
+            prefix = os.path.basename(dirpath)
+            for filename in filenames:
+                yield prefix + filename
+
+    @staticmethod
+    def _is_key_dir(name):
+        return len(name) == 2 and all(c in string.hexdigits for c in name)
+
+    def mktemp(self):
+        """Creates a unique path for a temporary file within the storage.
+
+        Files written to this path can be stored with :meth:`store` without
+        copying as they reside on the same file system.
+
+        Returns
+        -------
+        str
+            Path for a temporary file. The file itself will not be created.
+        """
+        tmp_dir = os.path.join(self._root, 'tmp')
         try:
-            self._fs.makedirs(os.path.dirname(target_path))
+            self._fs.makedirs(tmp_dir)
         except OSError as err:
             if err.errno != errno.EEXIST:
                 raise
-
-        mode = stat.S_IMODE(self._fs.stat(filepath).st_mode)
-        self._fs.rename(filepath, target_path)
-        store_mode = mode & (stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
-        self._fs.chmod(target_path, store_mode)
-        return key
+        return os.path.join(tmp_dir, uuid.uuid4().hex)
 
     def get_path(self, key):
         """Get the path to a stored file.
@@ -75,17 +243,34 @@ class ContentAddressableStorage(object):
         """
         return os.path.join(self._root, key[:2], key[2:])
 
+    def checksum(self, filepath):
+        """Calculates the key a file would be stored under.
+
+        Parameters
+        ----------
+        filepath : str
+            The path to the file.
+
+        Returns
+        -------
+        str
+            Key of the file content.
+        """
+        return self._calc_checksum(filepath)
+
     def _calc_checksum(self, path):
         # We'll stick to sha1 for now. It's almost as fast as md5, while more
         # secure hash function (i.e. sha256/512) need up to twice as long. As
         # this CAS might be used with huge data, speed is important.
         blocksize = self._get_blocksize(path)
         h = hashlib.sha1()
-        with self._fs.open(path, 'rb') as f:
-            buf = b'\0'
-            while buf != b'':
-                buf = f.read(blocksize)
-                h.update(buf)
+        with trace.span('cas.hash') as span:
+            with self._open_sequential(path) as f:
+                buf = b'\0'
+                while buf != b'':
+                    buf = f.read(blocksize)
+                    h.update(buf)
+                    span.add('bytes', len(buf))
         return h.hexdigest()
 
     def _get_blocksize(self, path):
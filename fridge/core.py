@@ -1,11 +1,27 @@
+from __future__ import absolute_import
+
 import ast
+import bisect
+import collections
+import contextlib
 import errno
+import fnmatch
+import hashlib
+import mmap
+from multiprocessing.pool import ThreadPool
 import os.path
 import re
+import socket
 import stat
+import threading
+import time
 
 from fridge.cas import ContentAddressableStorage
 import fridge.fs
+from fridge.iosched import IOScheduler
+from fridge import trace
+from fridge.remote import (
+    copy_missing_objects, find_missing_objects, is_ancestor)
 from fridge.time import utc2timestamp, timestamp2utc, utc_time
 
 
@@ -67,6 +83,19 @@ class Serializable(object):
 class Stat(DataObject):
     __slots__ = ['st_mode', 'st_size', 'st_atime', 'st_mtime']
 
+    @classmethod
+    def recorded(cls, status):
+        return cls(
+            st_mode=stat.S_IFREG | stat.S_IMODE(status.st_mode),
+            st_size=status.st_size,
+            st_atime=cls.recorded_time(status.st_atime),
+            st_mtime=cls.recorded_time(status.st_mtime))
+
+    @staticmethod
+    def recorded_time(timestamp):
+        # Snapshots store times with millisecond precision.
+        return utc2timestamp(round(timestamp2utc(timestamp), 3))
+
 
 class SnapshotItem(DataObject, Serializable):
     __slots__ = ['checksum', 'path', 'status']
@@ -162,6 +191,20 @@ class Reference(DataObject, Serializable):
         return u'{t}: {r}'.format(t=self.type, r=self.ref)
 
 
+class WhenceEntry(DataObject, Serializable):
+    __slots__ = ['checksum', 'commit', 'path']
+
+    @classmethod
+    def parse(cls, serialized):
+        key, commit, path_repr = serialized.split(' ', 2)
+        return cls(key, commit, ast.literal_eval(path_repr))
+
+    def serialize(self):
+        # pylint: disable=no-member
+        return u'{key:s} {commit:s} {path!r}'.format(
+            key=self.checksum, commit=self.commit, path=self.path)
+
+
 class Diff(object):
     def __init__(self):
         self.removed = []
@@ -170,16 +213,43 @@ class Diff(object):
 
 
 class FridgeCore(object):
+    COPY = u'copy'
+    HARDLINK = u'hard'
+    SYMLINK = u'sym'
+    AUTO = u'auto'
+    LINK_MODES = (COPY, HARDLINK, SYMLINK, AUTO)
+
+    SNAPSHOT_CACHE_SIZE = 2
+    LOCK_TIMEOUT = 60.
+
     def __init__(
             self, path, fs=fridge.fs, cas_factory=ContentAddressableStorage):
         self._path = path
         self._fs = fs
-        self._blobs = cas_factory(os.path.join(path, '.fridge', 'blobs'), fs)
-        self._snapshots = cas_factory(os.path.join(
-            path, '.fridge', 'snapshots'), fs)
-        self._commits = cas_factory(os.path.join(
-            path, '.fridge', 'commits'), fs)
-        self._branch_dir = os.path.join(self._path, '.fridge', 'branches')
+        self._cas_factory = cas_factory
+        self._fridge_dir = os.path.join(path, '.fridge')
+        self._common_dir = self._read_common_dir()
+        self._blobs = cas_factory(
+            os.path.join(self._common_dir, 'blobs'), fs)
+        self._snapshots = cas_factory(
+            os.path.join(self._common_dir, 'snapshots'), fs)
+        self._commits = cas_factory(
+            os.path.join(self._common_dir, 'commits'), fs)
+        self._branch_dir = os.path.join(self._common_dir, 'branches')
+        self._lock_path = os.path.join(self._common_dir, 'lock')
+        self._lock_depth = 0
+        self._packed_branches_path = os.path.join(
+            self._common_dir, 'packed-branches')
+        self._packed_names = None
+        self._packed_commits = None
+        self._packed_signature = None
+        self._loose_branches = None
+        self._whence_dir = os.path.join(self._common_dir, 'whence')
+        self._remote_dir = os.path.join(self._common_dir, 'remotes')
+        self._partial_path = os.path.join(self._common_dir, 'partial')
+        self._sparse_path = os.path.join(self._fridge_dir, 'sparse')
+        self._promisor = None
+        self._snapshot_cache = collections.OrderedDict()
 
     @classmethod
     def init(cls, path, fs=fridge.fs, cas_factory=ContentAddressableStorage):
@@ -189,77 +259,602 @@ class FridgeCore(object):
         obj.set_head(Reference(Reference.BRANCH, u'master'))
         return obj
 
-    def add_blob(self, path):
-        key = self._blobs.store(path)
+    @classmethod
+    def init_worktree(
+            cls, path, common_dir, fs=fridge.fs,
+            cas_factory=ContentAddressableStorage):
+        fridge_dir = os.path.join(path, '.fridge')
+        fs.makedirs(fridge_dir)
+        with fs.open(os.path.join(fridge_dir, 'commondir'), 'w') as f:
+            f.write(u'{}'.format(os.path.relpath(common_dir, fridge_dir)))
+        # The common directory lists the worktrees to find the branches
+        # checked out in them.
+        worktrees_dir = os.path.join(common_dir, 'worktrees')
+        try:
+            fs.makedirs(worktrees_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        name = hashlib.sha1(
+            os.path.abspath(fridge_dir).encode('utf-8')).hexdigest()
+        with fs.open(os.path.join(worktrees_dir, name), 'w') as f:
+            f.write(u'{}'.format(os.path.relpath(fridge_dir, worktrees_dir)))
+        return cls(path, fs, cas_factory)
+
+    @classmethod
+    def clone(
+            cls, source, path, fs=fridge.fs,
+            cas_factory=ContentAddressableStorage, partial=False):
+        try:
+            fs.makedirs(path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        obj = cls.init(path, fs, cas_factory)
+        obj.set_remote(u'origin', source)
+        remote = obj.open_remote(u'origin')
+
+        obj.copy_objects(remote.commits, obj.commits, remote.commits.keys())
+        obj.copy_objects(
+            remote.snapshots, obj.snapshots, remote.snapshots.keys())
+        if partial:
+            with fs.open(obj._partial_path, 'w') as f:
+                f.write(u'origin')
+        else:
+            obj.copy_objects(remote.blobs, obj.blobs, remote.blobs.keys())
+        obj._copy_whence_index(remote)
+
+        for name in remote.list_branches():
+            obj.set_branch(name, remote.resolve_branch(name))
+        obj.set_head(remote.get_head())
+        return obj
+
+    def _copy_whence_index(self, remote):
+        # pylint: disable=protected-access
+        if not self._fs.exists(remote._whence_dir):
+            return
+        self._fs.makedirs(self._whence_dir)
+        for _, _, filenames in self._fs.walk(remote._whence_dir):
+            for filename in filenames:
+                self._fs.copy(
+                    os.path.join(remote._whence_dir, filename),
+                    os.path.join(self._whence_dir, filename))
+            break
+
+    def _read_common_dir(self):
+        path = os.path.join(self._fridge_dir, 'commondir')
+        if not self._fs.exists(path):
+            return os.path.normpath(self._fridge_dir)
+        with self._fs.open(path, 'r') as f:
+            return os.path.normpath(
+                os.path.join(self._fridge_dir, f.read().strip()))
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def common_dir(self):
+        return self._common_dir
+
+    @property
+    def blobs(self):
+        return self._blobs
+
+    @property
+    def snapshots(self):
+        return self._snapshots
+
+    @property
+    def commits(self):
+        return self._commits
+
+    def set_remote(self, name, path):
+        try:
+            self._fs.makedirs(self._remote_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        if not os.path.isabs(path):
+            path = os.path.relpath(path, self._common_dir)
+        with self._fs.open(os.path.join(self._remote_dir, name), 'w') as f:
+            f.write(u'{}'.format(path))
+
+    def get_remote(self, name):
+        remote_path = os.path.join(self._remote_dir, name)
+        if not self._fs.exists(remote_path):
+            raise UnknownRemoteError(name)
+        with self._fs.open(remote_path, 'r') as f:
+            return os.path.normpath(
+                os.path.join(self._common_dir, f.read().strip()))
+
+    def list_remotes(self):
+        if not self._fs.exists(self._remote_dir):
+            return []
+        for _, _, filenames in self._fs.walk(self._remote_dir):
+            return sorted(filenames)
+
+    def open_remote(self, name):
+        return type(self)(self.get_remote(name), self._fs, self._cas_factory)
+
+    def is_partial(self):
+        return self._fs.exists(self._partial_path)
+
+    def set_sparse_patterns(self, patterns):
+        if len(patterns) == 0:
+            if self._fs.exists(self._sparse_path):
+                self._fs.unlink(self._sparse_path)
+            return
+        with self._fs.open(self._sparse_path, 'w') as f:
+            f.write(u''.join(u'{}\n'.format(p) for p in patterns))
+
+    def get_sparse_patterns(self):
+        if not self._fs.exists(self._sparse_path):
+            return []
+        with self._fs.open(self._sparse_path, 'r') as f:
+            return [line.strip() for line in f.read().split('\n')
+                    if line.strip()]
+
+    def copy_objects(self, source, target, keys):
+        for key in keys:
+            if target.contains(key):
+                continue
+            tmp_file = target.mktemp()
+            self._fs.copy(source.get_path(key), tmp_file)
+            stored_key = target.store(tmp_file)
+            if stored_key != key:
+                raise CorruptObjectError(key)
+
+    def add_blob(self, path, keep=False):
+        key = self._blobs.store(path, keep)
         return key
 
+    def add_blob_from_stream(self, stream, mode=0o444):
+        return self._blobs.store_stream(stream, mode)
+
+    def add_blob_from_buffer(self, buf, mode=0o444):
+        return self._blobs.store_buffer(buf, mode)
+
     @staticmethod
     def serialize_snapshot(snapshot):
         return u'\n'.join(item.serialize() for item in snapshot)
 
+    @trace.traced('core.add_snapshot')
     def add_snapshot(self, snapshot):
-        tmp_file = os.path.join(self._path, '.fridge', 'tmp')
+        # Sorted snapshots allow to look up paths by binary search.
+        snapshot = sorted(snapshot, key=lambda item: item.path)
+        tmp_file = self._snapshots.mktemp()
         with self._fs.open(tmp_file, 'w') as f:
             f.write(self.serialize_snapshot(snapshot))
-        return self._snapshots.store(tmp_file)
+        key = self._snapshots.store(tmp_file)
+        self._cache_snapshot(key, snapshot)
+        return key
+
+    def _cache_snapshot(self, key, snapshot):
+        # Commands read the head snapshot repeatedly and commit needs the
+        # new and the parent snapshot.
+        self._snapshot_cache.pop(key, None)
+        self._snapshot_cache[key] = snapshot
+        while len(self._snapshot_cache) > self.SNAPSHOT_CACHE_SIZE:
+            self._snapshot_cache.popitem(last=False)
 
-    def add_commit(self, snapshot_key, message):
+    @trace.traced('core.add_commit')
+    def add_commit(self, snapshot_key, message, parent=None):
         # pylint: disable=no-member
-        commit = self.resolve_ref(self.get_head())
-        c = Commit(utc_time(), snapshot_key, message, commit)
-        tmp_file = os.path.join(self._path, '.fridge', 'tmp')
+        if parent is None:
+            parent = self.resolve_ref(self.get_head())
+        c = Commit(utc_time(), snapshot_key, message, parent)
+        tmp_file = self._commits.mktemp()
         with self._fs.open(tmp_file, 'w') as f:
             f.write(c.serialize())
-        return self._commits.store(tmp_file)
+        key = self._commits.store(tmp_file)
+        self.index_commit(key, c)
+        return key
+
+    @trace.traced('core.index_commit')
+    def index_commit(self, key, commit=None):
+        # Only (blob, path) pairs not already in the parent are indexed, so
+        # that every entry names the commit introducing the blob at a path.
+        if commit is None:
+            commit = self.read_commit(key)
+        known = set()
+        if commit.parent:
+            parent = self.read_commit(commit.parent)
+            known = set((item.checksum, item.path)
+                        for item in self.read_snapshot(parent.snapshot))
+
+        snapshot = self.read_snapshot(commit.snapshot)
+
+        buckets = {}
+        for item in snapshot:
+            if (item.checksum, item.path) not in known:
+                buckets.setdefault(item.checksum[:2], []).append(
+                    WhenceEntry(item.checksum, key, item.path))
+        if len(buckets) == 0:
+            return
+
+        with self.lock():
+            try:
+                self._fs.makedirs(self._whence_dir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            for bucket, entries in buckets.items():
+                with self._fs.open(os.path.join(self._whence_dir, bucket),
+                                   'a') as f:
+                    f.write(u''.join(e.serialize() + u'\n' for e in entries))
+
+    def whence(self, key):
+        path = os.path.join(self._whence_dir, key[:2])
+        if not self._fs.exists(path):
+            return []
+        with self._fs.open(path, 'r') as f:
+            lines = f.read().split('\n')
+        # The last line is empty or still being appended by index_commit.
+        return [WhenceEntry.parse(line) for line in lines[:-1]
+                if line.split(' ', 1)[0] == key]
+
+    def checksum(self, path):
+        return self._blobs.checksum(path)
 
     def is_commit(self, key):
         return self._fs.exists(self._commits.get_path(key))
 
     @staticmethod
     def parse_snapshot(serialized_snapshot):
+        # An empty snapshot serializes to an empty string.
         return [SnapshotItem.parse(line)
-                for line in serialized_snapshot.split('\n')]
+                for line in serialized_snapshot.split('\n') if line]
+
+    @staticmethod
+    def find_snapshot_item(snapshot, path):
+        path = os.path.join(os.curdir, os.path.normpath(path))
+        lo, hi = 0, len(snapshot)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if snapshot[mid].path < path:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(snapshot) and snapshot[lo].path == path:
+            return snapshot[lo]
+        # Snapshots written before they were sorted need a linear search.
+        for item in snapshot:
+            if item.path == path:
+                return item
+        raise UnknownPathError(path)
+
+    def read_snapshot_item(self, key, path):
+        # Only the items on the path of a binary search over the serialized
+        # snapshot are parsed.
+        snapshot = self._snapshot_cache.get(key)
+        if snapshot is not None:
+            return self.find_snapshot_item(snapshot, path)
+        path = os.path.join(os.curdir, os.path.normpath(path))
+        with self._fs.open(self._snapshots.get_path(key), 'rb') as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (AttributeError, EnvironmentError, TypeError, ValueError):
+                # Files without descriptor (like in MemoryFS) and empty files
+                # cannot be mapped.
+                data = f.read()
+        lo, hi = 0, len(data)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = data.rfind(b'\n', 0, mid) + 1
+            end = data.find(b'\n', mid)
+            if end < 0:
+                end = len(data)
+            item = SnapshotItem.parse(data[start:end].decode('utf-8'))
+            if item.path == path:
+                return item
+            elif item.path < path:
+                lo = end + 1
+            else:
+                hi = start
+        # Snapshots written before they were sorted are searched for the
+        # serialized path.
+        needle = u' {!r}'.format(path).encode('utf-8')
+        end = 0
+        while True:
+            start = data.find(needle, end)
+            if start < 0:
+                raise UnknownPathError(path)
+            end = start + len(needle)
+            if end == len(data) or data[end:end + 1] == b'\n':
+                return SnapshotItem.parse(data[data.rfind(
+                    b'\n', 0, start) + 1:end].decode('utf-8'))
 
     def read_snapshot(self, key):
-        with self._fs.open(self._snapshots.get_path(key)) as f:
-            return self.parse_snapshot(f.read())
+        snapshot = self._snapshot_cache.get(key)
+        if snapshot is None:
+            with self._fs.open(self._snapshots.get_path(key)) as f:
+                snapshot = self.parse_snapshot(f.read())
+        self._cache_snapshot(key, snapshot)
+        # Callers may modify the returned list.
+        return list(snapshot)
 
     def read_commit(self, key):
         with self._fs.open(self._commits.get_path(key)) as f:
             return Commit.parse(f.read())
 
     def set_head(self, head):
-        path = os.path.join(self._path, '.fridge', 'head')
-        with self._fs.open(path, 'w') as f:
+        # Other worktrees read the head to find checked out branches.
+        path = os.path.join(self._fridge_dir, 'head')
+        with self._fs.open(path + '.tmp', 'w') as f:
             f.write(head.serialize())
+        self._fs.replace(path + '.tmp', path)
 
     def get_head(self):
-        path = os.path.join(self._path, '.fridge', 'head')
+        path = os.path.join(self._fridge_dir, 'head')
         with self._fs.open(path, 'r') as f:
             return Reference.parse(f.read())
 
     def get_head_key(self):
         return self.resolve_ref(self.get_head())
 
-    def set_branch(self, name, commit):
+    def _list_worktree_dirs(self):
+        yield self._common_dir
+        worktrees_dir = os.path.join(self._common_dir, 'worktrees')
+        if not self._fs.exists(worktrees_dir):
+            return
+        for _, _, filenames in self._fs.walk(worktrees_dir):
+            for filename in sorted(filenames):
+                with self._fs.open(
+                        os.path.join(worktrees_dir, filename), 'r') as f:
+                    yield os.path.normpath(
+                        os.path.join(worktrees_dir, f.read().strip()))
+            break
+
+    def is_checked_out(self, name):
+        branch = Reference(Reference.BRANCH, name)
+        for fridge_dir in self._list_worktree_dirs():
+            path = os.path.join(fridge_dir, 'head')
+            # Deleted worktrees are ignored.
+            if not self._fs.exists(path):
+                continue
+            with self._fs.open(path, 'r') as f:
+                if Reference.parse(f.read()) == branch:
+                    return True
+        return False
+
+    def advance_head(self, commit):
+        head = self.get_head()
+        if head.type == Reference.COMMIT:
+            head.ref = commit
+            self.set_head(head)
+        elif head.type == Reference.BRANCH:
+            self.set_branch(head.ref, commit)
+        else:
+            raise AssertionError("Invalid head type '{t}'.".format(
+                t=head.type))
+
+    @contextlib.contextmanager
+    def lock(self, timeout=LOCK_TIMEOUT):
+        # Serializes updates of branches and the whence index between
+        # processes. Creating a directory is atomic on all file systems. The
+        # lock is reentrant within the same instance.
+        if self._lock_depth == 0:
+            with trace.span('core.lock') as span:
+                deadline = time.time() + timeout
+                delay = 0.001
+                while not self._try_lock():
+                    if self._break_stale_lock():
+                        span.add('broken')
+                        continue
+                    if time.time() > deadline:
+                        owner = self._read_lock_owner()
+                        raise LockTimeoutError(
+                            "Timed out waiting for the lock {path} held by "
+                            "{owner}. If no fridge process is running, "
+                            "remove the directory {path} to clear the "
+                            "lock.".format(
+                                path=self._lock_path,
+                                owner="process {} on {}".format(*owner)
+                                if owner else "an unknown process"))
+                    span.add('retries')
+                    time.sleep(delay)
+                    delay = min(2 * delay, 0.1)
+            # Other processes may have changed the branches meanwhile.
+            self._loose_branches = None
+        self._lock_depth += 1
+        try:
+            yield
+        finally:
+            self._lock_depth -= 1
+            if self._lock_depth == 0:
+                self._fs.unlink(os.path.join(self._lock_path, 'owner'))
+                self._fs.rmdir(self._lock_path)
+
+    def _try_lock(self):
         try:
-            self._fs.makedirs(self._branch_dir)
+            self._fs.mkdir(self._lock_path)
         except OSError as e:
             if e.errno != errno.EEXIST:
                 raise
-        path = os.path.join(self._branch_dir, name)
-        with self._fs.open(path, 'w') as f:
-            f.write(Branch(commit).serialize())
+            return False
+        with self._fs.open(os.path.join(self._lock_path, 'owner'), 'w') as f:
+            f.write(u'{pid} {host}\n'.format(
+                pid=os.getpid(), host=socket.gethostname()))
+        return True
+
+    def _read_lock_owner(self):
+        try:
+            with self._fs.open(
+                    os.path.join(self._lock_path, 'owner'), 'r') as f:
+                pid, host = f.read().split()
+            return int(pid), host
+        except (IOError, OSError, ValueError):
+            # The owner has not written its pid yet or released the lock.
+            return None
+
+    @staticmethod
+    def _is_running(pid):
+        try:
+            os.kill(pid, 0)
+        except OSError as e:
+            return e.errno != errno.ESRCH
+        return True
+
+    def _break_stale_lock(self):
+        owner = self._read_lock_owner()
+        if owner is None or owner[1] != socket.gethostname() or (
+                self._is_running(owner[0])):
+            return False
+        # Breaking the lock is serialized, so a lock taken after another
+        # process broke the stale one is not broken again.
+        breaking_path = self._lock_path + '.break'
+        try:
+            self._fs.mkdir(breaking_path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            return False
+        try:
+            if self._read_lock_owner() != owner:
+                return False
+            self._fs.unlink(os.path.join(self._lock_path, 'owner'))
+            self._fs.rmdir(self._lock_path)
+            return True
+        finally:
+            self._fs.rmdir(breaking_path)
+
+    @staticmethod
+    def is_valid_branch_name(name):
+        # Branch names are file names in the branches directory and fields
+        # separated by whitespace in the packed branches.
+        return (len(name) > 0 and os.pardir not in name and
+                name != os.curdir and '/' not in name and
+                os.sep not in name and
+                not any(c.isspace() or c == '\0' for c in name))
+
+    def set_branch(self, name, commit):
+        with self.lock():
+            try:
+                self._fs.makedirs(self._branch_dir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            # Readers do not take the lock and must not see partial files.
+            tmp_file = os.path.join(self._common_dir, 'branch.tmp')
+            with self._fs.open(tmp_file, 'w') as f:
+                f.write(Branch(commit).serialize())
+            self._fs.replace(tmp_file, os.path.join(self._branch_dir, name))
+        if self._loose_branches is not None:
+            self._loose_branches.add(name)
+
+    def _packed_branches_signature(self):
+        if not self._fs.exists(self._packed_branches_path):
+            return None
+        status = self._fs.stat(self._packed_branches_path)
+        # Packing replaces the file, which changes its inode.
+        return (getattr(status, 'st_ino', None), status.st_mtime,
+                status.st_size)
+
+    def _load_branches(self, revalidate=False):
+        # Returns whether the branches were (re)loaded. With revalidate, the
+        # cache is reloaded if another process packed the branches.
+        if self._loose_branches is not None and not (
+                revalidate and self._packed_branches_signature() !=
+                self._packed_signature):
+            return False
+
+        self._scan_loose_branches()
+        self._packed_signature = self._packed_branches_signature()
+        self._packed_names = []
+        self._packed_commits = []
+        if self._packed_signature is not None:
+            with self._fs.open(self._packed_branches_path, 'r') as f:
+                for line in f.read().split('\n'):
+                    if line != '':
+                        name, commit = line.rsplit(' ', 1)
+                        self._packed_names.append(name)
+                        self._packed_commits.append(commit)
+        return True
+
+    def _scan_loose_branches(self):
+        # Loose branches overlay the packed ones. Only their names are kept
+        # in memory as they might get updated by other worktrees.
+        self._loose_branches = set()
+        if self._fs.exists(self._branch_dir):
+            for _, _, filenames in self._fs.walk(self._branch_dir):
+                self._loose_branches.update(filenames)
+                break
+
+    def _find_packed_branch(self, name):
+        i = bisect.bisect_left(self._packed_names, name)
+        if i < len(self._packed_names) and self._packed_names[i] == name:
+            return i
+        return None
+
+    def _is_loose_branch(self, name):
+        if name not in self._loose_branches:
+            if not self._fs.exists(os.path.join(self._branch_dir, name)):
+                return False
+            self._loose_branches.add(name)
+        return True
+
+    def _has_branch(self, name):
+        return (self._find_packed_branch(name) is not None or
+                self._is_loose_branch(name))
 
     def is_branch(self, name):
+        self._load_branches()
+        if self._has_branch(name):
+            return True
+        # Another process may have packed the branch meanwhile.
+        return self._load_branches(revalidate=True) and self._has_branch(name)
+
+    def _resolve_branch(self, name):
+        # Another process may have written a loose branch overriding the
+        # packed one since the names were loaded.
+        i = self._find_packed_branch(name)
         branch_path = os.path.join(self._branch_dir, name)
-        return self._fs.exists(branch_path)
+        try:
+            with self._fs.open(branch_path, 'r') as f:
+                # pylint: disable=no-member
+                commit = Branch.parse(f.read()).commit
+        except (IOError, OSError) as e:
+            if i is None or e.errno != errno.ENOENT:
+                raise
+            return self._packed_commits[i]
+        self._loose_branches.add(name)
+        return commit
 
     def resolve_branch(self, name):
-        branch_path = os.path.join(self._branch_dir, name)
-        with self._fs.open(branch_path, 'r') as f:
-            # pylint: disable=no-member
-            return Branch.parse(f.read()).commit
+        self._load_branches()
+        try:
+            return self._resolve_branch(name)
+        except (IOError, OSError) as e:
+            # Another process may have packed the loose branch meanwhile.
+            if e.errno != errno.ENOENT or not self._load_branches(
+                    revalidate=True):
+                raise
+            return self._resolve_branch(name)
+
+    def list_branches(self):
+        if not self._load_branches(revalidate=True):
+            self._scan_loose_branches()
+        names = set(self._packed_names)
+        names.update(self._loose_branches)
+        return sorted(names)
+
+    def pack_branches(self):
+        with self.lock():
+            branches = [(name, self.resolve_branch(name))
+                        for name in self.list_branches()]
+            tmp_file = self._packed_branches_path + '.tmp'
+            with self._fs.open(tmp_file, 'w') as f:
+                f.write(u''.join(
+                    u'{n} {c}\n'.format(n=n, c=c) for n, c in branches))
+            self._fs.replace(tmp_file, self._packed_branches_path)
+
+            for name in self._loose_branches:
+                self._fs.unlink(os.path.join(self._branch_dir, name))
+            self._loose_branches = set()
+            self._packed_signature = self._packed_branches_signature()
+            self._packed_names = [n for n, _ in branches]
+            self._packed_commits = [c for _, c in branches]
 
     def resolve_ref(self, ref):
         if ref.type == Reference.COMMIT:
@@ -267,22 +862,180 @@ class FridgeCore(object):
         elif ref.type == Reference.BRANCH:
             return self.resolve_branch(ref.ref)
 
-    def checkout_blob(self, key, path):
-        source_path = self._blobs.get_path(key)
-        self._fs.copy(source_path, path)
+    def _get_promisor(self):
+        if self._promisor is None:
+            with self._fs.open(self._partial_path, 'r') as f:
+                self._promisor = self.open_remote(f.read().strip())
+        return self._promisor
+
+    @trace.traced('core.prefetch_blobs')
+    def prefetch_blobs(self, keys):
+        if not self.is_partial():
+            return
+        missing = [k for k in set(keys) if not self._blobs.contains(k)]
+        if len(missing) > 0:
+            promisor = self._get_promisor()
+            promisor.prefetch_blobs(missing)
+            self.copy_objects(promisor.blobs, self._blobs, missing)
+
+    def get_blob_path(self, key):
+        path = self._blobs.get_path(key)
+        if not self._fs.exists(path) and self.is_partial():
+            self.prefetch_blobs([key])
+        return path
+
+    def open_blob(self, key, mode='rb'):
+        return self._fs.open(self.get_blob_path(key), mode)
+
+    def read_blob(self, key):
+        with self.open_blob(key) as f:
+            return f.read()
+
+    def map_blob(self, key):
+        with self.open_blob(key) as f:
+            try:
+                return memoryview(
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            except (AttributeError, EnvironmentError, TypeError, ValueError):
+                # Files without descriptor (like in MemoryFS) and empty files
+                # cannot be mapped.
+                return memoryview(f.read())
+
+    def checkout_blob(self, key, path, link=COPY):
+        source_path = self.get_blob_path(key)
+        if link != self.COPY:
+            # Links replace existing files like copies overwrite them.
+            try:
+                self._fs.unlink(path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+        if link == self.AUTO:
+            try:
+                self._fs.link(source_path, path)
+                return self.HARDLINK
+            except OSError:
+                link = self.COPY
+
+        if link == self.COPY:
+            # Writing through a link would modify the stored blob.
+            if self.is_linked(key, path):
+                self._fs.unlink(path)
+            self._fs.copy(source_path, path)
+        elif link == self.HARDLINK:
+            self._fs.link(source_path, path)
+        elif link == self.SYMLINK:
+            self._fs.symlink(os.path.relpath(
+                source_path, os.path.dirname(path) or os.curdir), path)
+        else:
+            raise ValueError("Invalid link mode '{m}'.".format(m=link))
+        return link
+
+    def is_linked(self, key, path):
+        return self._fs.exists(path) and self._fs.samefile(
+            self._blobs.get_path(key), path)
+
+
+class Transaction(object):
+    def __init__(self, fridge_core, branch, fs=fridge.fs):
+        self._core = fridge_core
+        self._fs = fs
+        self._branch = branch
+        self._check_not_checked_out()
+        self._parent = self._tip()
+        self._items = {}
+        if self._parent:
+            commit = fridge_core.read_commit(self._parent)
+            self._items = dict(
+                (item.path, item)
+                for item in fridge_core.read_snapshot(commit.snapshot))
+
+    def _check_not_checked_out(self):
+        # Updating the branch would leave the working tree outdated.
+        if self._core.is_checked_out(self._branch):
+            raise BranchCheckedOutError()
+
+    def _tip(self):
+        if self._core.is_branch(self._branch):
+            return self._core.resolve_branch(self._branch)
+        return u''
+
+    @staticmethod
+    def _snapshot_path(path):
+        parts = [p for p in path.replace(os.sep, '/').split('/')
+                 if p not in ('', os.curdir)]
+        # Paths must stay inside of the worktree.
+        if os.path.isabs(path) or len(parts) == 0 or os.pardir in parts:
+            raise InvalidPathError(path)
+        return os.path.join(os.curdir, *parts)
+
+    def add(self, path, buf, mode=0o644):
+        path = self._snapshot_path(path)
+        key = self._core.add_blob_from_buffer(buf, mode)
+        now = utc2timestamp(utc_time())
+        size = self._fs.stat(self._core.blobs.get_path(key)).st_size
+        status = Stat(
+            st_mode=stat.S_IFREG | stat.S_IMODE(mode), st_size=size,
+            st_atime=now, st_mtime=now)
+        self._items[path] = SnapshotItem(key, path, status)
+        return key
+
+    def remove(self, path):
+        del self._items[self._snapshot_path(path)]
+
+    def commit(self, message=u''):
+        snapshot = [self._items[path] for path in sorted(self._items)]
+        snapshot_key = self._core.add_snapshot(snapshot)
+        with self._core.lock():
+            self._check_not_checked_out()
+            if self._tip() != self._parent:
+                raise NonFastForwardError()
+            key = self._core.add_commit(snapshot_key, message, self._parent)
+            self._core.set_branch(self._branch, key)
+        self._parent = key
+        return key
 
 
 class Fridge(object):
-    def __init__(self, fridge_core, fs=fridge.fs):
+    def __init__(self, fridge_core, fs=fridge.fs, scheduler=None):
         self._core = fridge_core
         self._fs = fs
+        if scheduler is None:
+            scheduler = IOScheduler(fs)
+        self._scheduler = scheduler
+        self._root = os.path.normpath(fridge_core.path)
+        self._link_lock = threading.Lock()
 
     def _list_files(self):
-        for dirpath, dirnames, filenames in self._fs.walk('.'):
+        for dirpath, dirnames, filenames in self._fs.walk(self._root):
             if '.fridge' in dirnames:
+                if dirpath != self._root:
+                    # Nested worktree with its own head.
+                    del dirnames[:]
+                    continue
                 dirnames.remove('.fridge')
+            reldir = os.curdir + dirpath[len(self._root):]
             for filename in filenames:
-                yield os.path.join(dirpath, filename)
+                yield os.path.join(reldir, filename)
+
+    def _worktree_path(self, path):
+        return os.path.normpath(os.path.join(self._root, path))
+
+    def _makedirs(self, path, created):
+        if not path or path in created:
+            return
+        try:
+            self._fs.makedirs(path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        created.add(path)
+
+    def _read_commit_snapshot(self, key):
+        if key is None or key == '':
+            return []
+        commit = self._core.read_commit(key)
+        return self._core.read_snapshot(commit.snapshot)
 
     def refparse(self, ref):
         potential_types = []
@@ -298,64 +1051,391 @@ class Fridge(object):
         else:
             return Reference(potential_types[0], ref)
 
-    def commit(self, message=""):
-        if self.is_clean():
+    @trace.traced('commit')
+    def commit(self, message="", jobs=None):
+        # A single walk detects the changes. The modified files are copied
+        # into the storage, so nothing needs to be checked out afterwards.
+        # The walk produces the files to store while the scheduler stores
+        # them on each device.
+        in_sparse = self._sparse_filter()
+        head_items = dict(
+            (item.path, item) for item in self._read_commit_snapshot(
+                self._core.get_head_key()))
+        # Files outside of the sparse patterns are not in the working tree.
+        snapshot = [item for item in head_items.values()
+                    if not in_sparse(item.path)]
+        num_outside = len(snapshot)
+        num_tracked = len(head_items) - num_outside
+        unmodified = []
+
+        def scan():
+            # Unmodified files bypass the queues of the scheduler.
+            for path in self._list_files():
+                if not in_sparse(path):
+                    continue
+                wt_path = self._worktree_path(path)
+                item = head_items.get(path)
+                status = self._fs.stat(wt_path)
+                if item is not None and self._is_unmodified_file(
+                        wt_path, status, item):
+                    unmodified.append(item)
+                else:
+                    # The status is recorded as parsed from the snapshot to
+                    # compare equal to it in later processes.
+                    yield SnapshotItem(None, path, Stat.recorded(status))
+
+        def store(item):
+            item.checksum = self._core.add_blob(
+                self._worktree_path(item.path), keep=True)
+            return item
+
+        with trace.span('commit.store') as span:
+            for item in self._scheduler.imap(
+                    store, scan(), lambda item: self._worktree_path(
+                        item.path), jobs, 'store', 'scan'):
+                snapshot.append(item)
+                span.add('files')
+                span.add('bytes', item.status.st_size)
+        if len(snapshot) == num_outside and len(unmodified) == num_tracked:
             raise NothingToCommitError()
+        snapshot.extend(unmodified)
 
-        snapshot = []
-        for path in self._list_files():
-            stat = self._fs.stat(path)
-            checksum = self._core.add_blob(path)
-            snapshot.append(SnapshotItem(checksum, path, stat))
         snapshot_hash = self._core.add_snapshot(snapshot)
-        commit_hash = self._core.add_commit(snapshot_hash, message)
-
-        head = self._core.get_head()
-        if head.type == Reference.COMMIT:
-            head.ref = commit_hash
-            self._core.set_head(head)
-        elif head.type == Reference.BRANCH:
-            self._core.set_branch(head.ref, commit_hash)
-        else:
-            raise AssertionError("Invalid head type '{t}'.".format(
-                t=head.type))
-
-        self.checkout()
+        with self._core.lock():
+            commit_hash = self._core.add_commit(snapshot_hash, message)
+            self._core.advance_head(commit_hash)
 
     def branch(self, name):
-        if self._core.is_branch(name):
-            raise BranchExistsError()
-        self._core.set_branch(name, self._core.get_head_key())
+        with self._core.lock():
+            if self._core.is_branch(name):
+                raise BranchExistsError()
+            self._core.set_branch(name, self._core.get_head_key())
         self._core.set_head(Reference(Reference.BRANCH, name))
 
-    def checkout(self, ref=None):
+    @trace.traced('checkout')
+    def checkout(self, ref=None, link=FridgeCore.COPY):
         head_key = self._core.get_head_key()
         if ref is None:
             key = head_key
         else:
             ref = self.refparse(ref)
-            self._core.set_head(ref)
+            if ref.type == Reference.BRANCH and ref != self._core.get_head(
+                    ) and self._core.is_checked_out(ref.ref):
+                raise BranchCheckedOutError()
             key = self._core.resolve_ref(ref)
 
-        commit = self._core.read_commit(key)
-        head_commit = self._core.read_commit(head_key)
+        self._switch(
+            self._read_commit_snapshot(head_key),
+            self._read_commit_snapshot(key), link)
+        # The head changes only after the files were switched.
+        if ref is not None:
+            self._core.set_head(ref)
+
+    def _sparse_filter(self, patterns=None):
+        if patterns is None:
+            patterns = self._core.get_sparse_patterns()
+        if len(patterns) == 0:
+            return lambda path: True
+        # A pattern also matches everything below a matching directory.
+        patterns = [p.strip('/') for p in patterns]
+        patterns += [p + '/*' for p in patterns]
+
+        def in_sparse(path):
+            path = os.path.normpath(path).replace(os.sep, '/')
+            return any(fnmatch.fnmatch(path, p) for p in patterns)
+        return in_sparse
+
+    def set_sparse(self, patterns):
+        snapshot = self._read_commit_snapshot(self._core.get_head_key())
+        was_in_sparse = self._sparse_filter()
+        in_sparse = self._sparse_filter(patterns)
+        leaving = [
+            item for item in snapshot
+            if was_in_sparse(item.path) and not in_sparse(item.path)]
+        # Files leaving the sparse set are deleted, which would lose their
+        # local changes.
+        self._check_local_changes(set(item.path for item in leaving))
+        self._core.set_sparse_patterns(patterns)
+        self._replace(
+            leaving,
+            [item for item in snapshot
+             if in_sparse(item.path) and not was_in_sparse(item.path)])
+
+    def _switch(self, head_snapshot, snapshot, link=FridgeCore.COPY):
+        in_sparse = self._sparse_filter()
+        old_items = dict(
+            (item.path, item) for item in head_snapshot
+            if in_sparse(item.path))
+        # Files already in the requested state are left untouched.
+        kept = set(
+            item.path for item in snapshot
+            if item.path in old_items and self._can_keep(
+                old_items[item.path], item, link))
+        self._replace(
+            [item for path, item in old_items.items() if path not in kept],
+            [item for item in snapshot
+             if in_sparse(item.path) and item.path not in kept], link)
+
+    def _can_keep(self, old_item, item, link):
+        if old_item.checksum != item.checksum or not self._is_unmodified(
+                old_item.status, item):
+            return False
+        path = self._worktree_path(item.path)
+        if self._core.is_linked(item.checksum, path):
+            return link != FridgeCore.COPY and self._is_unmodified_link(
+                self._fs.stat(path), item)
+        if link != FridgeCore.COPY or not self._fs.exists(path):
+            return False
+        return self._is_unmodified(self._fs.stat(path), item)
+
+    def _is_unmodified_file(self, path, status, item):
+        if self._is_unmodified(status, item):
+            return True
+        return self._core.is_linked(
+            item.checksum, path) and self._is_unmodified_link(status, item)
 
-        snapshot = self._core.read_snapshot(commit.snapshot)
-        head_snapshot = self._core.read_snapshot(head_commit.snapshot)
+    @staticmethod
+    def _is_unmodified(status, item):
+        return (status.st_size == item.status.st_size and
+                status.st_mode == item.status.st_mode and
+                Fridge._is_same_time(status.st_mtime, item.status.st_mtime))
 
+    @staticmethod
+    def _is_unmodified_link(status, item):
+        # Links have the read-only mode of the stored blob.
+        return (status.st_size == item.status.st_size and
+                Fridge._is_same_time(status.st_mtime, item.status.st_mtime))
+
+    @staticmethod
+    def _is_same_time(a, b):
+        return a == b or Stat.recorded_time(a) == Stat.recorded_time(b)
+
+    def _replace(self, old_items, new_items, link=FridgeCore.COPY):
         # FIXME do not delete or overwrite non-restorable files
-        for item in head_snapshot:
+        with trace.span('checkout.remove', files=len(old_items)):
+            for item in old_items:
+                try:
+                    self._fs.unlink(self._worktree_path(item.path))
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+
+        self._core.prefetch_blobs(item.checksum for item in new_items)
+        with trace.span('checkout.write', files=len(new_items)) as span:
+            created_dirs = set()
+            self._scheduler.map(
+                lambda item: self._checkout_item(item, link, created_dirs),
+                new_items,
+                lambda item: self._core.get_blob_path(item.checksum))
+            span.add('bytes', sum(item.status.st_size for item in new_items))
+
+    def _checkout_item(self, item, link, created_dirs):
+        path = self._worktree_path(item.path)
+        self._makedirs(os.path.dirname(path), created_dirs)
+        if link == FridgeCore.COPY:
+            self._core.checkout_blob(item.checksum, path, link)
+        else:
+            with self._link_lock:
+                link = self._link_item(item, path, link)
+        # Links share the status of the stored blob which must stay
+        # read-only.
+        if link == FridgeCore.COPY:
+            self._fs.chmod(path, stat.S_IMODE(item.status.st_mode))
+            self._fs.utime(path, (item.status.st_atime, item.status.st_mtime))
+
+    def _link_item(self, item, path, link):
+        # The modification time of the blob is set to that of the item to
+        # detect changes through the link. Items sharing the blob with
+        # another modification time are copied instead.
+        blob_status = self._fs.stat(self._core.get_blob_path(item.checksum))
+        if getattr(blob_status, 'st_nlink', 1) > 1 and not (
+                self._is_same_time(
+                    blob_status.st_mtime, item.status.st_mtime)):
+            link = FridgeCore.COPY
+        link = self._core.checkout_blob(item.checksum, path, link)
+        if link != FridgeCore.COPY:
+            self._fs.utime(path, (item.status.st_atime, item.status.st_mtime))
+        return link
+
+    def _resolve(self, ref):
+        if ref is None:
+            return self._core.get_head_key()
+        return self._core.resolve_ref(self.refparse(ref))
+
+    def _read_commit_item(self, key, path):
+        if key is None or key == '':
+            raise UnknownPathError(path)
+        commit = self._core.read_commit(key)
+        return self._core.read_snapshot_item(commit.snapshot, path)
+
+    def get_item(self, ref, path):
+        return self._read_commit_item(self._resolve(ref), path)
+
+    @trace.traced('restore')
+    def restore(self, ref, paths):
+        key = self._resolve(ref)
+        items = [self._read_commit_item(key, path) for path in paths]
+        self._core.prefetch_blobs(item.checksum for item in items)
+        created_dirs = set()
+        for item in items:
+            # Copying onto a hard link or read-only file would write through
+            # it or fail.
             try:
-                self._fs.unlink(item.path)
+                self._fs.unlink(self._worktree_path(item.path))
             except OSError as e:
                 if e.errno != errno.ENOENT:
                     raise
+            self._checkout_item(item, FridgeCore.COPY, created_dirs)
+
+    def add_worktree(self, path, ref):
+        ref = self.refparse(ref)
+        with self._core.lock():
+            if ref.type == Reference.BRANCH and self._core.is_checked_out(
+                    ref.ref):
+                raise BranchCheckedOutError()
+            core = type(self._core).init_worktree(
+                path, self._core.common_dir, self._fs)
+            core.set_head(ref)
+        worktree = Fridge(core, self._fs)
+        worktree.checkout()
+        return worktree
+
+    def whence(self, path_or_key):
+        path = self._worktree_path(path_or_key)
+        if self._fs.exists(path):
+            key = self._core.checksum(path)
+        else:
+            key = path_or_key
+        return self._core.whence(key)
 
-        for item in snapshot:
-            self._core.checkout_blob(item.checksum, item.path)
-            self._fs.chmod(item.path, stat.S_IMODE(item.status.st_mode))
-            self._fs.utime(
-                item.path, (item.status.st_atime, item.status.st_mtime))
+    @classmethod
+    def clone(cls, source, path, fs=fridge.fs, partial=False):
+        core = FridgeCore.clone(source, path, fs, partial=partial)
+        obj = cls(core, fs)
+        obj.checkout()
+        return obj
+
+    def _head_branch(self, branch):
+        if branch is not None:
+            return branch
+        head = self._core.get_head()
+        if head.type != Reference.BRANCH:
+            raise DetachedHeadError()
+        return head.ref
+
+    @staticmethod
+    def _transfer(source, target, source_branch, target_branch, jobs,
+                  progress):
+        tip = source.resolve_branch(source_branch)
+        old = ''
+        if target.is_branch(target_branch):
+            old = target.resolve_branch(target_branch)
+        if old and not is_ancestor(source, old, tip):
+            raise NonFastForwardError()
+
+        missing = find_missing_objects(source, tip, target.commits.contains)
+        copy_missing_objects(
+            source, target, missing, jobs=jobs, progress=progress,
+            blobs=not target.is_partial())
+        with target.lock():
+            current = ''
+            if target.is_branch(target_branch):
+                current = target.resolve_branch(target_branch)
+            if current != old:
+                # The branch was updated concurrently.
+                raise NonFastForwardError()
+            for key in reversed(missing.commits):
+                target.index_commit(key)
+            target.set_branch(target_branch, tip)
+        return old, tip
+
+    @trace.traced('push')
+    def push(self, remote=u'origin', branch=None, jobs=4, progress=None):
+        branch = self._head_branch(branch)
+        target = self._core.open_remote(remote)
+        # Updating the branch would leave the remote working tree outdated.
+        if target.is_checked_out(branch):
+            raise BranchCheckedOutError()
+        self._transfer(self._core, target, branch, branch, jobs, progress)
+
+    @trace.traced('pull')
+    def pull(self, remote=u'origin', branch=None, jobs=4, progress=None):
+        branch = self._head_branch(branch)
+        source = self._core.open_remote(remote)
+        checked_out = self._core.get_head() == Reference(
+            Reference.BRANCH, branch)
+        if checked_out:
+            current = u''
+            if self._core.is_branch(branch):
+                current = self._core.resolve_branch(branch)
+            self._check_local_changes(self._affected_paths(
+                self._read_commit_snapshot(current),
+                source.read_snapshot(source.read_commit(
+                    source.resolve_branch(branch)).snapshot)))
+        old, tip = self._transfer(
+            source, self._core, branch, branch, jobs, progress)
+        if checked_out:
+            # Only files changed by the update are replaced, so local
+            # changes of other files are kept.
+            head_snapshot = self._read_commit_snapshot(old)
+            snapshot = self._read_commit_snapshot(tip)
+            affected = self._affected_paths(head_snapshot, snapshot)
+            self._switch(
+                [item for item in head_snapshot if item.path in affected],
+                [item for item in snapshot if item.path in affected])
+
+    @staticmethod
+    def _affected_paths(head_snapshot, snapshot):
+        old_items = dict((item.path, item) for item in head_snapshot)
+        new_items = dict((item.path, item) for item in snapshot)
+        return set(
+            path for path in set(old_items).union(new_items)
+            if old_items.get(path) != new_items.get(path))
+
+    def _check_local_changes(self, affected):
+        d = self.diff()
+        changed = sorted(set(d.added + d.removed + d.updated).intersection(
+            os.path.relpath(path) for path in affected))
+        if len(changed) > 0:
+            raise LocalChangesError(
+                "Local changes would be overwritten: {}".format(
+                    ', '.join(changed)))
+
+    def iter_files(
+            self, ref=None, pattern=None, prefetch=8, workers=4,
+            max_bytes=256 * 1024 * 1024, by_location=False):
+        # Blobs are read ahead by a thread pool. The read-ahead is limited to
+        # prefetch files and max_bytes, but includes at least one file.
+        items = self._read_commit_snapshot(self._resolve(ref))
+        if pattern is not None:
+            items = [item for item in items if fnmatch.fnmatch(
+                os.path.normpath(item.path), pattern)]
+        self._core.prefetch_blobs(item.checksum for item in items)
+        if by_location:
+            items.sort(key=lambda item: getattr(self._fs.stat(
+                self._core.get_blob_path(item.checksum)), 'st_ino', 0))
+
+        pool = ThreadPool(workers)
+        try:
+            queue = collections.deque()
+            queued_bytes = 0
+            for item in items:
+                size = item.status.st_size
+                while len(queue) > 0 and (
+                        len(queue) >= prefetch or
+                        queued_bytes + size > max_bytes):
+                    done, result = queue.popleft()
+                    queued_bytes -= done.status.st_size
+                    yield done.path, result.get(), done.status
+                queue.append((item, pool.apply_async(
+                    self._core.read_blob, (item.checksum,))))
+                queued_bytes += size
+            while len(queue) > 0:
+                done, result = queue.popleft()
+                yield done.path, result.get(), done.status
+        finally:
+            pool.close()
+            pool.join()
 
     def log(self):
         head = self._core.get_head_key()
@@ -365,30 +1445,27 @@ class Fridge(object):
             commits.append((key, self._core.read_commit(key)))
         return commits
 
+    @trace.traced('diff')
     def diff(self):
-        head_key = self._core.get_head_key()
-        if head_key == '':
-            snapshot = []
-        else:
-            commit = self._core.read_commit(head_key)
-            snapshot = self._core.read_snapshot(commit.snapshot)
+        in_sparse = self._sparse_filter()
+        snapshot = [
+            item for item in self._read_commit_snapshot(
+                self._core.get_head_key()) if in_sparse(item.path)]
 
         d = Diff()
         for item in snapshot:
-            if self._fs.exists(item.path):
+            path = self._worktree_path(item.path)
+            if self._fs.exists(path):
                 # FIXME possibility for strict check via SHA or compare
-                stat = self._fs.stat(item.path)
-                eq_size = stat.st_size == item.status.st_size
-                eq_mtime = stat.st_mtime == item.status.st_mtime
-                eq_mode = stat.st_mode == item.status.st_mode
-                if not (eq_size and eq_mtime and eq_mode):
+                if not self._is_unmodified_file(
+                        path, self._fs.stat(path), item):
                     d.updated.append(os.path.relpath(item.path))
             else:
                 d.removed.append(os.path.relpath(item.path))
 
-        known_files = [item.path for item in snapshot]
+        known_files = set(item.path for item in snapshot)
         for path in self._list_files():
-            if path not in known_files:
+            if path not in known_files and in_sparse(path):
                 d.added.append(os.path.relpath(path))
 
         return d
@@ -420,3 +1497,39 @@ class NothingToCommitError(FridgeError):
 
 class UnknownReferenceError(FridgeReferenceError):
     pass
+
+
+class UnknownRemoteError(FridgeError):
+    pass
+
+
+class BranchCheckedOutError(FridgeError):
+    pass
+
+
+class DetachedHeadError(FridgeError):
+    pass
+
+
+class NonFastForwardError(FridgeError):
+    pass
+
+
+class UnknownPathError(FridgeError):
+    pass
+
+
+class CorruptObjectError(FridgeError):
+    pass
+
+
+class LockTimeoutError(FridgeError):
+    pass
+
+
+class InvalidPathError(FridgeError):
+    pass
+
+
+class LocalChangesError(FridgeError):
+    pass
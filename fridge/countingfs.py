@@ -0,0 +1,139 @@
+"""Provides a file system wrapper counting operations and transferred bytes.
+
+Wrapping the ``fs`` object passed to :class:`fridge.core.FridgeCore` and
+:class:`fridge.core.Fridge` shows how much I/O an operation causes, so tests
+can assert I/O budgets for hot paths.
+"""
+
+import collections
+import threading
+
+
+_STRING_TYPES = (str, type(u''))
+
+
+class CountingFS(object):
+    """File system wrapper counting the calls of each function.
+
+    Besides the number of calls per function name, the counts include
+    ``'open_r'`` and ``'open_w'`` for files opened for reading and writing,
+    ``'bytes_read'`` and ``'bytes_written'`` for opened files,
+    ``'bytes_copied'`` for :meth:`copy` and ``'walk_dirs'`` for the
+    directories generated by :meth:`walk`.
+
+    The counts are safe to update from concurrent threads.
+
+    Parameters
+    ----------
+    fs : obj
+        Object providing file system functions to wrap.
+
+    Attributes
+    ----------
+    counts : :class:`collections.Counter`
+        Counts of calls and bytes.
+    paths : set
+        Paths passed to any counted function.
+    """
+    def __init__(self, fs):
+        self._fs = fs
+        self.counts = collections.Counter()
+        self.paths = set()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Resets all counts."""
+        with self._lock:
+            self.counts.clear()
+            self.paths.clear()
+
+    def _count(self, name, paths):
+        with self._lock:
+            self.counts[name] += 1
+            self.paths.update(paths)
+
+    def _add(self, name, amount):
+        with self._lock:
+            self.counts[name] += amount
+
+    def __getattr__(self, name):
+        func = getattr(self._fs, name)
+
+        def counted(*args, **kwargs):
+            self._count(
+                name, [a for a in args if isinstance(a, _STRING_TYPES)])
+            return func(*args, **kwargs)
+        return counted
+
+    def open(self, path, mode='r'):
+        """Opens a file and counts the bytes read from or written to it."""
+        self._count('open', [path])
+        if any(flag in mode for flag in 'wa+'):
+            self._add('open_w', 1)
+        else:
+            self._add('open_r', 1)
+        return _CountingFile(self._fs.open(path, mode), self._add)
+
+    def open_sequential(self, path):
+        """Opens a file for sequential reading and counts the bytes read.
+
+        Falls back to :meth:`open` if the wrapped file system does not
+        provide the function.
+        """
+        self._count('open_sequential', [path])
+        self._add('open_r', 1)
+        open_sequential = getattr(self._fs, 'open_sequential', None)
+        if open_sequential is None:
+            f = self._fs.open(path, 'rb')
+        else:
+            f = open_sequential(path)
+        return _CountingFile(f, self._add)
+
+    def copy(self, src, dest):
+        """Copies a file and counts the copied bytes."""
+        self._count('copy', [src, dest])
+        self._add('bytes_copied', self._fs.stat(src).st_size)
+        return self._fs.copy(src, dest)
+
+    def walk(self, path, topdown=True):
+        """Walks a directory tree and counts the generated directories."""
+        self._count('walk', [path])
+        for entry in self._fs.walk(path, topdown):
+            self._add('walk_dirs', 1)
+            yield entry
+
+
+class _CountingFile(object):
+    def __init__(self, f, add):
+        self._f = f
+        self._add = add
+
+    def read(self, *args):
+        data = self._f.read(*args)
+        self._add('bytes_read', len(data))
+        return data
+
+    def readline(self, *args):
+        data = self._f.readline(*args)
+        self._add('bytes_read', len(data))
+        return data
+
+    def write(self, data):
+        self._add('bytes_written', len(data))
+        return self._f.write(data)
+
+    def __iter__(self):
+        line = self.readline()
+        while line:
+            yield line
+            line = self.readline()
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        self._f.__enter__()
+        return self
+
+    def __exit__(self, err_type, value, traceback):
+        return self._f.__exit__(err_type, value, traceback)
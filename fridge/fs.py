@@ -1,10 +1,170 @@
 """Provides the default Python implementation of file system access functions.
 """
-from os import (chmod, makedirs, mkdir, rename, rmdir, stat, statvfs, unlink,
-    utime, walk)
-from os.path import exists
+import errno
+import io
+import os
+import sys
+from os import (chmod, link, makedirs, mkdir, rename, rmdir, stat, statvfs,
+    symlink, unlink, utime, walk)
+from os.path import exists, samefile
 from shutil import copy
+try:
+    from os import replace
+except ImportError:
+    # Renaming replaces an existing file atomically on POSIX systems.
+    from os import rename as replace
 try:
     from builtins import open
 except ImportError:
     from __builtin__ import open
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# Linux ioctl sharing the data blocks of two files on file systems with
+# copy-on-write support like Btrfs and XFS.
+_FICLONE = 0x40049409
+
+
+def reflink(src, dest):
+    """Clones a file without copying its data.
+
+    The clone shares the data blocks of `src` until either file is modified.
+
+    Parameters
+    ----------
+    src : str
+        Path of the file to clone.
+    dest : str
+        Path of the clone. It must not exist.
+
+    Raises
+    ------
+    OSError
+        If the platform or the file system does not support clones.
+    """
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(
+            errno.EOPNOTSUPP, 'Cloning files is not supported.', src)
+    with open(src, 'rb') as s:
+        with open(dest, 'xb' if sys.version_info[0] >= 3 else 'wb') as d:
+            try:
+                fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+            except EnvironmentError as e:
+                d.close()
+                unlink(dest)
+                raise OSError(e.errno, e.strerror, src)
+
+
+# Bytes to read ahead of a queued file and to consume before dropping the
+# consumed range from the page cache.
+READAHEAD_BYTES = 2 * 1024 * 1024
+_DROP_BYTES = 8 * 1024 * 1024
+
+
+def _fadvise(fd, offset, length, advice_name):
+    # Advice is only a hint and unavailable on some platforms and in
+    # Python 2.
+    advice = getattr(os, advice_name, None)
+    if advice is not None and hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, offset, length, advice)
+        except OSError:
+            pass
+
+
+def open_sequential(path):
+    """Opens a file to read it once from start to end.
+
+    The file is opened with ``O_NOATIME`` where permitted, so reading does
+    not change its access time. The kernel is advised to read ahead
+    aggressively and ranges already read are dropped from the page cache,
+    so reading huge files does not evict the cached data of other
+    processes.
+
+    Parameters
+    ----------
+    path : str
+        Path of the file.
+
+    Returns
+    -------
+    :term:`file object`
+        Unbuffered binary file object.
+    """
+    flags = os.O_RDONLY | getattr(os, 'O_BINARY', 0)
+    fd = None
+    noatime = getattr(os, 'O_NOATIME', 0)
+    if noatime:
+        try:
+            fd = os.open(path, flags | noatime)
+        except OSError as e:
+            # Only the owner of a file may use O_NOATIME.
+            if e.errno != errno.EPERM:
+                raise
+    if fd is None:
+        fd = os.open(path, flags)
+    _fadvise(fd, 0, 0, 'POSIX_FADV_SEQUENTIAL')
+    return _SequentialFile(io.FileIO(fd, 'rb'))
+
+
+def readahead(path, length=READAHEAD_BYTES):
+    """Advises the kernel to read the beginning of a file into the cache.
+
+    Errors are ignored as this is only a hint.
+
+    Parameters
+    ----------
+    path : str
+        Path of the file.
+    length : int, optional
+        Number of bytes to read ahead.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, 'O_NOATIME', 0))
+    except OSError:
+        return
+    try:
+        _fadvise(fd, 0, length, 'POSIX_FADV_WILLNEED')
+    finally:
+        os.close(fd)
+
+
+class _SequentialFile(object):
+    def __init__(self, f):
+        self._f = f
+        self._offset = 0
+        self._dropped = 0
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self._offset += len(data)
+        if self._offset - self._dropped >= _DROP_BYTES:
+            self._drop()
+        return data
+
+    def _drop(self, length=None):
+        if length is None:
+            length = self._offset - self._dropped
+        _fadvise(self._f.fileno(), self._dropped, length,
+                 'POSIX_FADV_DONTNEED')
+        self._dropped = self._offset
+
+    def close(self):
+        if not self._f.closed:
+            # A length of zero drops everything up to the end of the file
+            # including pages read ahead.
+            self._drop(0)
+        self._f.close()
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, err_type, value, traceback):
+        self.close()
+        return False
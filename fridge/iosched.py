@@ -0,0 +1,422 @@
+"""Provides an I/O scheduler adapting concurrency and order to the devices.
+
+Rotational disks are fastest with few concurrent requests in on-disk order,
+while solid-state drives and network file systems need many concurrent
+requests to reach their throughput. The scheduler groups tasks by the
+device holding their file and runs each group with a policy for its kind of
+device::
+
+    scheduler = IOScheduler()
+    checksums = scheduler.map(calc_checksum, paths)
+
+Tasks produced while the files are accessed, for example by a directory
+walk, are scheduled with :meth:`IOScheduler.imap` instead.
+
+Devices are identified by the ``st_dev`` of the directory containing a file.
+Whether a device is rotational is read from
+``/sys/dev/block/<major>:<minor>/queue/rotational`` on Linux. Devices without
+this information, like those of network, RAM-based or in-memory file
+systems, use the policy for unknown devices.
+"""
+
+from __future__ import absolute_import
+
+import collections
+import os
+import os.path
+import threading
+import timeit
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import fridge.fs
+from fridge.pipeline import (
+    DEFAULT_DEPTH, END, Pipeline, Stage, StageStats, Stopped,
+    get_until_stopped, put_until_stopped)
+from fridge import trace
+
+
+class DevicePolicy(object):
+    """Policy for accessing the files of a device.
+
+    Parameters
+    ----------
+    workers : int
+        Number of tasks to run concurrently.
+    sort_by_inode : bool, optional
+        Whether to run the tasks in order of inode numbers, which mostly
+        follows the on-disk order of files.
+    depth : int, optional
+        Number of tasks queued for the workers.
+    readahead : bool, optional
+        Whether to advise the kernel to read ahead the files of queued
+        tasks. Requires a ``readahead(path)`` function of the file system.
+    """
+    def __init__(self, workers, sort_by_inode=False, depth=DEFAULT_DEPTH,
+                 readahead=False):
+        self.workers = workers
+        self.sort_by_inode = sort_by_inode
+        self.depth = depth
+        self.readahead = readahead
+
+
+ROTATIONAL = DevicePolicy(1, sort_by_inode=True, depth=4, readahead=True)
+SOLID_STATE = DevicePolicy(16)
+
+
+def is_rotational(device, sys_root='/sys'):
+    """Checks whether a block device is rotational.
+
+    Parameters
+    ----------
+    device : int
+        Device number as in ``st_dev``.
+    sys_root : str, optional
+        Mount point of sysfs.
+
+    Returns
+    -------
+    bool or None
+        Whether the device is rotational or ``None`` if unknown.
+    """
+    path = os.path.join(sys_root, 'dev', 'block', '{major}:{minor}'.format(
+        major=os.major(device), minor=os.minor(device)))
+    # Partitions have the queue attributes in the directory of their disk.
+    for dev_dir in (path, os.path.join(path, os.pardir)):
+        try:
+            with open(os.path.join(dev_dir, 'queue', 'rotational')) as f:
+                return f.read().strip() == '1'
+        except EnvironmentError:
+            continue
+    return None
+
+
+class IOScheduler(object):
+    """Schedules file operations according to the devices of the files.
+
+    Parameters
+    ----------
+    fs : obj, optional
+        Object providing file system functions.
+    rotational : :class:`DevicePolicy`, optional
+        Policy for rotational devices.
+    solid_state : :class:`DevicePolicy`, optional
+        Policy for non-rotational devices.
+    unknown : :class:`DevicePolicy`, optional
+        Policy for devices of unknown kind. Defaults to `solid_state`.
+    sys_root : str, optional
+        Mount point of sysfs.
+    """
+    def __init__(
+            self, fs=fridge.fs, rotational=ROTATIONAL,
+            solid_state=SOLID_STATE, unknown=None, sys_root='/sys'):
+        self._fs = fs
+        self._rotational = rotational
+        self._solid_state = solid_state
+        self._unknown = solid_state if unknown is None else unknown
+        self._sys_root = sys_root
+        self._dir_devices = {}
+        self._policies = {}
+
+    def device_of(self, path):
+        """Returns the device of a file.
+
+        Parameters
+        ----------
+        path : str
+            Path of the file. It does not need to exist, but its directory
+            does.
+
+        Returns
+        -------
+        int or None
+            Device number or ``None`` if the file system does not provide
+            it.
+        """
+        dirname = os.path.dirname(path) or os.curdir
+        if dirname not in self._dir_devices:
+            self._dir_devices[dirname] = getattr(
+                self._fs.stat(dirname), 'st_dev', None)
+        return self._dir_devices[dirname]
+
+    def policy(self, device):
+        """Returns the policy of a device.
+
+        Parameters
+        ----------
+        device : int or None
+            Device number as returned by :meth:`device_of`.
+
+        Returns
+        -------
+        :class:`DevicePolicy`
+            The policy.
+        """
+        if device not in self._policies:
+            rotational = None
+            if device is not None:
+                rotational = is_rotational(device, self._sys_root)
+            if rotational is None:
+                self._policies[device] = self._unknown
+            elif rotational:
+                self._policies[device] = self._rotational
+            else:
+                self._policies[device] = self._solid_state
+        return self._policies[device]
+
+    def map(self, func, tasks, path=lambda task: task, workers=None):
+        """Applies a function to each task.
+
+        Tasks of different devices run concurrently. Each device runs its
+        tasks according to its policy. A span named ``'iosched.device'``
+        with the statistics of the :class:`fridge.pipeline.Pipeline` is
+        traced per device.
+
+        Parameters
+        ----------
+        func : callable
+            Function to apply to each task.
+        tasks : sequence
+            Tasks to apply the function to.
+        path : callable, optional
+            Function returning the path of the file accessed by a task. By
+            default, the tasks are paths.
+        workers : int, optional
+            Number of concurrent tasks per device overriding the policies.
+
+        Returns
+        -------
+        list
+            Results of the function in the order of `tasks`.
+        """
+        tasks = list(tasks)
+        groups = collections.OrderedDict()
+        for i, task in enumerate(tasks):
+            groups.setdefault(self.device_of(path(task)), []).append(i)
+
+        results = [None] * len(tasks)
+        errors = []
+
+        def run_group(device, indices, parent=None):
+            policy = self.policy(device)
+            if policy.sort_by_inode:
+                indices.sort(key=lambda i: getattr(
+                    self._fs.stat(path(tasks[i])), 'st_ino', 0))
+            num_workers, readahead = _device_settings(
+                self._fs, policy, workers)
+
+            def queue_tasks():
+                # The next files are read while a worker processes the
+                # current one.
+                for i in indices:
+                    if readahead is not None:
+                        readahead(path(tasks[i]))
+                    yield i
+
+            stages = Pipeline([Stage(
+                'io', lambda i: (i, func(tasks[i])), num_workers)],
+                              policy.depth)
+            try:
+                with trace.attach(parent):
+                    with trace.span(
+                            'iosched.device', device=device,
+                            workers=num_workers, tasks=len(indices),
+                            sorted=policy.sort_by_inode) as span:
+                        for i, result in stages.run(
+                                queue_tasks(), 'tasks'):
+                            results[i] = result
+                        stages.add_stats(span)
+            except Exception as e:  # pylint: disable=broad-except
+                errors.append(e)
+
+        if len(groups) == 1:
+            run_group(*list(groups.items())[0])
+        else:
+            threads = [threading.Thread(
+                target=run_group, args=(device, indices, trace.current()))
+                       for device, indices in groups.items()]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        if len(errors) > 0:
+            raise errors[0]
+        return results
+
+    def imap(self, func, tasks, path=lambda task: task, workers=None,
+             name='io', source_name='tasks'):
+        """Applies a function to each task while the tasks are produced.
+
+        Unlike :meth:`map`, the tasks are consumed from an iterable as they
+        are produced, for example by a directory walk, and the results are
+        returned as soon as they are available. Each device has a bounded
+        queue, so a slow device blocks the production of tasks instead of
+        letting the queue grow. Since the tasks are not known in advance,
+        they are not sorted by inode.
+
+        A span named ``'iosched.dispatch'`` with the counters
+        ``<source_name>.items``, ``<source_name>.busy`` and
+        ``<source_name>.blocked`` of the producer and a span named
+        ``'iosched.device'`` with the statistics of the
+        :class:`fridge.pipeline.Pipeline` per device are traced.
+
+        Parameters
+        ----------
+        func : callable
+            Function to apply to each task.
+        tasks : iterable
+            Tasks to apply the function to.
+        path : callable, optional
+            Function returning the path of the file accessed by a task. By
+            default, the tasks are paths.
+        workers : int, optional
+            Number of concurrent tasks per device overriding the policies.
+        name : str, optional
+            Name of the function in the statistics.
+        source_name : str, optional
+            Name of the producer of the tasks in the statistics.
+
+        Returns
+        -------
+        generator
+            Results of the function in the order of completion.
+        """
+        return _StreamingMap(
+            self, self._fs, Stage(name, func, workers), path).run(
+                tasks, source_name)
+
+
+def _device_settings(fs, policy, workers):
+    # Returns the number of workers and the read-ahead function of a device.
+    num_workers = policy.workers if workers is None else workers
+    readahead = None
+    if policy.readahead:
+        readahead = getattr(fs, 'readahead', None)
+    return num_workers, readahead
+
+
+class _StreamingMap(object):
+    # A run of IOScheduler.imap. The dispatcher thread distributes the tasks
+    # to a thread per device, which passes them through a pipeline into the
+    # shared output queue.
+
+    def __init__(self, scheduler, fs, stage, path):
+        self._scheduler = scheduler
+        self._fs = fs
+        self._stage = stage
+        self._path = path
+        self._stop = threading.Event()
+        self._errors = []
+        self._output = queue.Queue(DEFAULT_DEPTH)
+        self._parent = None
+
+    def run(self, tasks, source_name):
+        self._parent = trace.current()
+        dispatcher = threading.Thread(
+            target=self._dispatch, args=(tasks, source_name))
+        dispatcher.daemon = True
+        dispatcher.start()
+        try:
+            while True:
+                try:
+                    result = get_until_stopped(self._output, self._stop)
+                except Stopped:
+                    break
+                if result is END:
+                    break
+                yield result
+        finally:
+            self._stop.set()
+            dispatcher.join()
+        if len(self._errors) > 0:
+            raise self._errors[0]
+
+    def _fail(self, error):
+        self._errors.append(error)
+        self._stop.set()
+
+    def _dispatch(self, tasks, source_name):
+        inputs = {}
+        threads = []
+        stats = StageStats(source_name)
+        try:
+            with trace.attach(self._parent):
+                with trace.span('iosched.dispatch') as span:
+                    iterator = iter(tasks)
+                    while True:
+                        start = timeit.default_timer()
+                        try:
+                            task = next(iterator)
+                        except StopIteration:
+                            break
+                        device = self._scheduler.device_of(self._path(task))
+                        stats.busy += timeit.default_timer() - start
+                        stats.items += 1
+                        if device not in inputs:
+                            inputs[device] = self._start_device(
+                                device, threads)
+                        stats.blocked += put_until_stopped(
+                            inputs[device], task, self._stop)
+                    for input_queue in inputs.values():
+                        put_until_stopped(input_queue, END, self._stop)
+                    for counter in ('items', 'busy', 'blocked'):
+                        span.add(source_name + '.' + counter,
+                                 getattr(stats, counter))
+        except Stopped:
+            pass
+        except Exception as e:  # pylint: disable=broad-except
+            self._fail(e)
+        for thread in threads:
+            thread.join()
+        try:
+            put_until_stopped(self._output, END, self._stop)
+        except Stopped:
+            pass
+
+    def _start_device(self, device, threads):
+        input_queue = queue.Queue(self._scheduler.policy(device).depth)
+        thread = threading.Thread(
+            target=self._run_device, args=(device, input_queue))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+        return input_queue
+
+    def _queued_tasks(self, input_queue, readahead):
+        # A stopped run ends the tasks, so that the pipeline of the device
+        # finishes.
+        while True:
+            try:
+                task = get_until_stopped(input_queue, self._stop)
+            except Stopped:
+                return
+            if task is END:
+                return
+            if readahead is not None:
+                readahead(self._path(task))
+            yield task
+
+    def _run_device(self, device, input_queue):
+        num_workers, readahead = _device_settings(
+            self._fs, self._scheduler.policy(device), self._stage.workers)
+        stages = Pipeline(
+            [Stage(self._stage.name, self._stage.func, num_workers)],
+            self._scheduler.policy(device).depth)
+        try:
+            with trace.attach(self._parent):
+                with trace.span(
+                        'iosched.device', device=device,
+                        workers=num_workers, sorted=False) as span:
+                    for result in stages.run(
+                            self._queued_tasks(input_queue, readahead),
+                            'queue'):
+                        put_until_stopped(self._output, result, self._stop)
+                    stages.add_stats(span)
+                    span.add('tasks', stages.stats[0].items)
+        except Stopped:
+            pass
+        except Exception as e:  # pylint: disable=broad-except
+            self._fail(e)
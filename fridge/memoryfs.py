@@ -172,6 +172,10 @@ class MemoryFile(MemoryFSNode):
     def flush(self):
         """Flushes the written data to :attr:`content`."""
         self._delegate.flush()
+        read_only = 'r' in self._mode and not any(
+            m in self._mode for m in 'wa+')
+        if read_only:
+            return
         if 'b' in self._mode:
             self.content = self._delegate.getvalue()
         else:
@@ -233,7 +237,7 @@ class MemoryFS(MemoryFSNode):
         if dirname in node.children:
             raise OSError(errno.EEXIST, 'Directory exists already.', path)
 
-        node.children[dirname] = MemoryFS(self)
+        node.children[dirname] = MemoryFS(node)
 
     def makedirs(self, path):
         """Creates a directory with all intermediate directories recursively.
@@ -333,6 +337,24 @@ class MemoryFS(MemoryFSNode):
         dest_node.children[dest_base] = src_node.children[src_base]
         del src_node.children[src_base]
 
+    def replace(self, src, dest):
+        """Renames a file replacing an existing destination.
+
+        Parameters
+        ----------
+        src : str
+            Source path.
+        dest : str
+            Destination path.
+
+        See also
+        --------
+        os.replace
+        """
+        if self.exists(dest):
+            self.unlink(dest)
+        self.rename(src, dest)
+
     def rmdir(self, path):
         # TODO documentation
         split_path = self._split_whole_path(path)
@@ -375,6 +397,33 @@ class MemoryFS(MemoryFSNode):
         # would allow to differentiate between the two.
         dest_node.children[dest_base] = src_node
 
+    def link(self, src, link_name):
+        """Create a hard link.
+
+        Raises :class:`OSError` if `link_name` exists already.
+
+        Parameters
+        ----------
+        src : str
+            Path of the file to link.
+        link_name : str
+            Path/name of the link.
+
+        See also
+        --------
+        os.link
+        """
+        src_node = self.get_node(self._split_whole_path(src))
+
+        dest_split = self._split_whole_path(link_name)
+        dest_base = dest_split.pop()
+        dest_node = self.get_node(dest_split)
+
+        if dest_base in dest_node.children:
+            raise OSError(errno.EEXIST, 'File exists already.', link_name)
+
+        dest_node.children[dest_base] = src_node
+
     def open(self, path, mode='r'):
         """Opens the file for reading or writing.
 
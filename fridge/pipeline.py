@@ -0,0 +1,325 @@
+"""Provides a pipeline of concurrent stages connected by bounded queues.
+
+Each stage runs in its own worker threads, so a stage waiting for I/O does
+not stall the others. The bounded queues limit the number of items in
+flight: a slow stage blocks the stages before it (backpressure) instead of
+letting its input grow without bounds::
+
+    pipeline = Pipeline([Stage('stat', os.stat), Stage('size', size, 4)])
+    for result in pipeline.run(paths):
+        ...
+
+The statistics collected for each stage show which stage limits the
+throughput: it is busy most of the time, while the stages before it are
+blocked and the stages after it are starved.
+"""
+
+from __future__ import absolute_import
+
+import threading
+import timeit
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from fridge import trace
+
+
+DEFAULT_DEPTH = 64
+
+# Interval in seconds in which blocked threads check for a stop.
+_POLL_INTERVAL = 0.1
+
+# Marks the end of the items in a queue.
+END = object()
+
+
+class Stopped(Exception):
+    """Raised by threads blocked on a queue when they are stopped."""
+
+
+def put_until_stopped(output, item, stop):
+    """Puts an item into a bounded queue unless stopped.
+
+    Parameters
+    ----------
+    output : :class:`queue.Queue`
+        Queue to put the item into.
+    item : obj
+        Item to put.
+    stop : :class:`threading.Event`
+        Event stopping the wait for space in the queue.
+
+    Returns
+    -------
+    float
+        Seconds spent waiting for space in the queue.
+
+    Raises
+    ------
+    Stopped
+        If `stop` is set while waiting.
+    """
+    start = timeit.default_timer()
+    while True:
+        try:
+            output.put(item, timeout=_POLL_INTERVAL)
+            return timeit.default_timer() - start
+        except queue.Full:
+            if stop.is_set():
+                raise Stopped()
+
+
+def get_until_stopped(input_queue, stop):
+    """Gets an item from a queue unless stopped.
+
+    Parameters
+    ----------
+    input_queue : :class:`queue.Queue`
+        Queue to get the item from.
+    stop : :class:`threading.Event`
+        Event stopping the wait for an item.
+
+    Returns
+    -------
+    obj
+        The item.
+
+    Raises
+    ------
+    Stopped
+        If `stop` is set while waiting.
+    """
+    while True:
+        try:
+            return input_queue.get(timeout=_POLL_INTERVAL)
+        except queue.Empty:
+            if stop.is_set():
+                raise Stopped()
+
+
+class Stage(object):
+    """Stage of a :class:`Pipeline`.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage used in the statistics.
+    func : callable
+        Function called with each input item and returning the output item.
+    workers : int, optional
+        Number of threads processing items concurrently. With more than one
+        worker, the order of items is not preserved.
+    depth : int, optional
+        Capacity of the input queue of the stage. Defaults to the depth of
+        the pipeline.
+    """
+    def __init__(self, name, func, workers=1, depth=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.depth = depth
+
+
+class StageStats(object):
+    """Statistics of a pipeline stage.
+
+    Times are summed over all workers of the stage.
+
+    Attributes
+    ----------
+    name : str
+        Name of the stage.
+    items : int
+        Number of processed items.
+    busy : float
+        Seconds spent processing items.
+    blocked : float
+        Seconds spent waiting for space in the queue of the next stage.
+    starved : float
+        Seconds spent waiting for input items.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.
+        self.blocked = 0.
+        self.starved = 0.
+
+    def merge(self, other):
+        """Adds the statistics of another worker of the same stage."""
+        self.items += other.items
+        self.busy += other.busy
+        self.blocked += other.blocked
+        self.starved += other.starved
+
+    def throughput(self, seconds):
+        """Returns the processed items per second within a duration."""
+        return self.items / seconds if seconds > 0 else 0.
+
+
+class Pipeline(object):
+    """Pipeline of stages connected by bounded queues.
+
+    Parameters
+    ----------
+    stages : sequence of :class:`Stage`
+        Stages through which each item is passed in order.
+    depth : int, optional
+        Default capacity of the queues between stages.
+
+    Attributes
+    ----------
+    stats : list of :class:`StageStats`
+        Statistics of the last run. The first entry belongs to the source.
+    """
+    def __init__(self, stages, depth=DEFAULT_DEPTH):
+        self._stages = list(stages)
+        self._depth = depth
+        self.stats = []
+        self._stop = threading.Event()
+        self._error = None
+        self._lock = threading.Lock()
+
+    def run(self, source, source_name='source'):
+        """Passes items through the stages.
+
+        The source is consumed in a separate thread. If any stage raises an
+        exception, the pipeline stops and the exception is raised by the
+        returned generator.
+
+        Parameters
+        ----------
+        source : iterable
+            Input items of the first stage.
+        source_name : str, optional
+            Name of the source in the statistics.
+
+        Returns
+        -------
+        generator
+            Output items of the last stage.
+        """
+        self._stop.clear()
+        self._error = None
+        self.stats = [StageStats(source_name)] + [
+            StageStats(stage.name) for stage in self._stages]
+        queues = [queue.Queue(
+            stage.depth if stage.depth is not None else self._depth)
+                  for stage in self._stages]
+        queues.append(queue.Queue(self._depth))
+        parent = trace.current()
+
+        threads = [threading.Thread(
+            target=self._produce, args=(source, queues[0], parent))]
+        for i, stage in enumerate(self._stages):
+            remaining = [stage.workers]
+            threads.extend(threading.Thread(
+                target=self._work,
+                args=(stage, self.stats[i + 1], queues[i], queues[i + 1],
+                      remaining, self._stage_workers(i + 1), parent))
+                for _ in range(stage.workers))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            while True:
+                try:
+                    item = self._get(queues[-1])
+                except Stopped:
+                    break
+                if item is END:
+                    break
+                yield item
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def add_stats(self, span):
+        """Adds the statistics of the last run as counters to a span.
+
+        Parameters
+        ----------
+        span : :class:`fridge.trace.Span`
+            Span receiving the counters ``<stage>.items``, ``<stage>.busy``,
+            ``<stage>.blocked`` and ``<stage>.starved``.
+        """
+        for stats in self.stats:
+            for counter in ('items', 'busy', 'blocked', 'starved'):
+                span.add(stats.name + '.' + counter, getattr(stats, counter))
+
+    def _stage_workers(self, index):
+        if index < len(self._stages):
+            return self._stages[index].workers
+        return 1
+
+    def _produce(self, source, output, parent):
+        stats = self.stats[0]
+        try:
+            with trace.attach(parent):
+                iterator = iter(source)
+                while True:
+                    start = timeit.default_timer()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        break
+                    stats.busy += timeit.default_timer() - start
+                    stats.items += 1
+                    stats.blocked += self._put(output, item)
+            for _ in range(self._stage_workers(0)):
+                self._put(output, END)
+        except Stopped:
+            pass
+        except Exception as e:  # pylint: disable=broad-except
+            self._fail(e)
+
+    def _work(self, stage, total, input_queue, output, remaining,
+              num_receivers, parent):
+        stats = StageStats(stage.name)
+        try:
+            with trace.attach(parent):
+                while True:
+                    start = timeit.default_timer()
+                    item = self._get(input_queue)
+                    stats.starved += timeit.default_timer() - start
+                    if item is END:
+                        break
+                    start = timeit.default_timer()
+                    result = stage.func(item)
+                    stats.busy += timeit.default_timer() - start
+                    stats.items += 1
+                    stats.blocked += self._put(output, result)
+            with self._lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            # The last worker of a stage signals the end to all workers of
+            # the next stage.
+            if last:
+                for _ in range(num_receivers):
+                    self._put(output, END)
+        except Stopped:
+            pass
+        except Exception as e:  # pylint: disable=broad-except
+            self._fail(e)
+        finally:
+            with self._lock:
+                total.merge(stats)
+
+    def _fail(self, error):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._stop.set()
+
+    def _put(self, output, item):
+        return put_until_stopped(output, item, self._stop)
+
+    def _get(self, input_queue):
+        return get_until_stopped(input_queue, self._stop)
@@ -0,0 +1,164 @@
+"""Provides the transfer of history between repositories.
+
+The repository that receives objects is asked only whether it has commits
+while walking the history of the sending repository backwards. The walk
+stops at the first commit known to the receiver, which is the boundary of
+the shared history. The blobs of the boundary snapshot form the set of keys
+known to the receiver. Only objects outside of this set are copied and
+every object already present in the receiving storage is skipped, so an
+interrupted transfer resumes where it stopped.
+"""
+
+from multiprocessing.pool import ThreadPool
+
+
+class MissingObjects(object):
+    """Objects which have to be copied to transfer a commit.
+
+    Attributes
+    ----------
+    commits : list
+        Keys of the missing commits, newest first.
+    snapshots : list
+        Keys of the snapshots of the missing commits.
+    blobs : list
+        Keys of blobs referenced by the missing snapshots and not in the
+        snapshot of the boundary commit.
+    boundary : str or None
+        Key of the newest commit already known to the receiver or ``None``
+        if the histories do not share a commit.
+    """
+    def __init__(self):
+        self.commits = []
+        self.snapshots = []
+        self.blobs = []
+        self.boundary = None
+
+
+def find_missing_objects(source, tip, is_known):
+    """Determines the objects missing in a repository to have commit `tip`.
+
+    Parameters
+    ----------
+    source : :class:`fridge.core.FridgeCore`
+        Repository containing `tip` and its history.
+    tip : str
+        Key of the commit to transfer.
+    is_known : callable
+        Returns whether the receiving repository has the commit with the key
+        passed as argument (and thus its history).
+
+    Returns
+    -------
+    :class:`MissingObjects`
+        The objects missing in the receiving repository.
+    """
+    missing = MissingObjects()
+    key = tip
+    while key and not is_known(key):
+        commit = source.read_commit(key)
+        missing.commits.append(key)
+        missing.snapshots.append(commit.snapshot)
+        key = commit.parent
+    missing.boundary = key or None
+
+    known = set()
+    if missing.boundary is not None:
+        boundary = source.read_commit(missing.boundary)
+        known.update(
+            item.checksum for item in source.read_snapshot(boundary.snapshot))
+    blobs = set()
+    for snapshot in missing.snapshots:
+        blobs.update(item.checksum for item in source.read_snapshot(snapshot)
+                     if item.checksum not in known)
+    missing.blobs = sorted(blobs)
+    return missing
+
+
+def copy_missing_objects(
+        source, target, missing, jobs=4, progress=None, blobs=True):
+    """Copies the objects missing in a repository.
+
+    Blobs and snapshots are copied in parallel. Commits are copied last and
+    oldest first. Thus, a commit is only present if its complete history
+    is present as well.
+
+    Parameters
+    ----------
+    source : :class:`fridge.core.FridgeCore`
+        Repository to copy the objects from.
+    target : :class:`fridge.core.FridgeCore`
+        Repository to copy the objects to.
+    missing : :class:`MissingObjects`
+        The objects to copy.
+    jobs : int, optional
+        Number of objects to copy in parallel.
+    progress : callable, optional
+        Will be called with the number of processed objects and the total
+        number of objects after each copied object.
+    blobs : bool, optional
+        Whether to copy blobs. Partial repositories do not need them.
+    """
+    blob_keys = missing.blobs if blobs else []
+    total = len(blob_keys) + len(missing.snapshots) + len(missing.commits)
+    done = [0]
+
+    def report():
+        done[0] += 1
+        if progress is not None:
+            progress(done[0], total)
+
+    if len(blob_keys) > 0:
+        source.prefetch_blobs(blob_keys)
+
+    pool = ThreadPool(jobs)
+    try:
+        for source_storage, target_storage, keys in [
+                (source.blobs, target.blobs, blob_keys),
+                (source.snapshots, target.snapshots, missing.snapshots)]:
+            copy = _ObjectCopier(target, source_storage, target_storage)
+            for _ in pool.imap_unordered(copy, keys):
+                report()
+    finally:
+        pool.close()
+        pool.join()
+
+    for key in reversed(missing.commits):
+        target.copy_objects(source.commits, target.commits, [key])
+        report()
+
+
+class _ObjectCopier(object):
+    def __init__(self, target, source_storage, target_storage):
+        self.target = target
+        self.source_storage = source_storage
+        self.target_storage = target_storage
+
+    def __call__(self, key):
+        self.target.copy_objects(
+            self.source_storage, self.target_storage, [key])
+
+
+def is_ancestor(core, ancestor, descendant):
+    """Checks whether a commit is an ancestor of another commit.
+
+    Parameters
+    ----------
+    core : :class:`fridge.core.FridgeCore`
+        Repository containing the history of `descendant`.
+    ancestor : str
+        Key of the potential ancestor.
+    descendant : str
+        Key of the descendant commit.
+
+    Returns
+    -------
+    bool
+        ``True`` if `ancestor` is `descendant` or one of its ancestors.
+    """
+    key = descendant
+    while key:
+        if key == ancestor:
+            return True
+        key = core.read_commit(key).parent
+    return False
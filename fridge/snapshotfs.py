@@ -0,0 +1,157 @@
+"""Provides a read-only view of a commit with functions resembling those of
+:mod:`fridge.fs`.
+
+Paths are resolved through the snapshot of the commit and file content is
+read directly from the blob storage, so historical versions can be read
+without a checkout.
+"""
+
+import errno
+import os.path
+import stat
+
+from fridge.core import Stat
+import fridge.fs
+from fridge.time import utc2timestamp
+
+
+class SnapshotFS(object):
+    """Read-only file system view of a commit.
+
+    Parameters
+    ----------
+    core : :class:`fridge.core.FridgeCore`
+        Repository containing the commit.
+    commit_key : str
+        Key of the commit to provide the view of.
+    fs : obj, optional
+        Object providing file system functions to access the repository.
+    """
+    def __init__(self, core, commit_key, fs=fridge.fs):
+        self._core = core
+        self._fs = fs
+        commit = core.read_commit(commit_key)
+        timestamp = utc2timestamp(commit.timestamp)
+        self._dir_status = Stat(
+            st_mode=stat.S_IFDIR | 0o555, st_size=0, st_atime=timestamp,
+            st_mtime=timestamp)
+
+        self._files = {}
+        self._dirs = {os.curdir: ([], [])}
+        for item in core.read_snapshot(commit.snapshot):
+            path = os.path.normpath(item.path)
+            self._files[path] = item
+            parent, name = self._split(path)
+            self._add_dir(parent)[1].append(name)
+
+    def _add_dir(self, path):
+        if path not in self._dirs:
+            self._dirs[path] = ([], [])
+            parent, name = self._split(path)
+            self._add_dir(parent)[0].append(name)
+        return self._dirs[path]
+
+    @staticmethod
+    def _split(path):
+        parent, name = os.path.split(path)
+        return parent or os.curdir, name
+
+    def exists(self, path):
+        """Checks whether a path exists in the snapshot.
+
+        Parameters
+        ----------
+        path : str
+            Path relative to the root of the snapshot.
+
+        Returns
+        -------
+        bool
+            ``True`` if `path` is a file or directory in the snapshot.
+        """
+        path = os.path.normpath(path)
+        return path in self._files or path in self._dirs
+
+    def stat(self, path):
+        """Returns the status of a file or directory.
+
+        Files have the status recorded in the snapshot. Directories are
+        read-only and have the time of the commit.
+
+        Parameters
+        ----------
+        path : str
+            Path relative to the root of the snapshot.
+
+        Returns
+        -------
+        :class:`fridge.core.Stat`
+            Status of `path`.
+        """
+        normpath = os.path.normpath(path)
+        if normpath in self._files:
+            return self._files[normpath].status
+        if normpath in self._dirs:
+            return self._dir_status
+        raise OSError(errno.ENOENT, 'No such file or directory.', path)
+
+    def open(self, path, mode='r'):
+        """Opens a file for reading.
+
+        The file is read directly from the blob storage.
+
+        Parameters
+        ----------
+        path : str
+            Path relative to the root of the snapshot.
+        mode : str, optional
+            Open mode as for :func:`io.open`. Only reading is supported.
+
+        Returns
+        -------
+        :term:`file object`
+            Opened file object.
+        """
+        if any(flag in mode for flag in 'wax+'):
+            raise OSError(errno.EROFS, 'Read-only file system.', path)
+        normpath = os.path.normpath(path)
+        if normpath in self._dirs:
+            raise OSError(errno.EISDIR, 'Is a directory.', path)
+        try:
+            item = self._files[normpath]
+        except KeyError:
+            raise OSError(errno.ENOENT, 'No such file or directory.', path)
+        return self._fs.open(self._core.get_blob_path(item.checksum), mode)
+
+    def walk(self, path=os.curdir, topdown=True):
+        """Generates the file names in a directory tree.
+
+        Parameters
+        ----------
+        path : str, optional
+            Directory to walk relative to the root of the snapshot.
+        topdown : bool, optional
+            Whether to generate a directory before its subdirectories.
+
+        Returns
+        -------
+        generator
+            Tuples ``(dirpath, dirnames, filenames)`` as generated by
+            :func:`os.walk`.
+
+        See also
+        --------
+        os.walk
+        """
+        normpath = os.path.normpath(path)
+        if normpath not in self._dirs:
+            return
+        dirnames, filenames = self._dirs[normpath]
+        dirnames = sorted(dirnames)
+        if topdown:
+            yield path, dirnames, sorted(filenames)
+        for name in dirnames:
+            for entry in self.walk(os.path.join(path, name), topdown):
+                yield entry
+        if not topdown:
+            yield path, dirnames, sorted(filenames)
@@ -0,0 +1,132 @@
+from io import BytesIO
+import os.path
+import stat
+import tarfile
+
+import pytest
+
+from fridge.archive import (
+    import_archive, InvalidArchiveError, snapshot_path, write_archive)
+from fridge.core import BranchCheckedOutError, Fridge, FridgeCore
+from fridge.fstest import write_file
+from fridge.memoryfs import MemoryFS
+
+
+@pytest.fixture
+def fs():
+    return MemoryFS()
+
+
+@pytest.fixture
+def fridge_core(fs):
+    return FridgeCore.init(os.curdir, fs)
+
+
+@pytest.fixture
+def fridge(fridge_core, fs):
+    return Fridge(fridge_core, fs)
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_write_archive(fs, fridge, fridge_core, compress):
+    fs.mkdir('dir')
+    write_file(fs, os.path.join('dir', 'file1'), u'content1')
+    write_file(fs, 'file2', u'content2')
+    write_file(fs, 'same', u'content2')
+    fs.chmod('file2', stat.S_IRUSR)
+    fs.utime('file2', (1.5, 2.25))
+    fridge.commit()
+    working_tree = [(path, fs.stat(path)) for path in [
+        os.path.join('dir', 'file1'), 'file2', 'same']]
+
+    out = BytesIO()
+    write_archive(
+        fridge_core, fridge_core.get_head_key(), out, compress=compress,
+        fs=fs)
+    assert fs.exists('file2')
+
+    out.seek(0)
+    with tarfile.open(fileobj=out, mode='r:*') as tar:
+        names = sorted(tar.getnames())
+        assert names == ['dir/file1', 'file2', 'same']
+        for path, status in working_tree:
+            info = tar.getmember('/'.join(path.split(os.sep)))
+            assert info.mode == stat.S_IMODE(status.st_mode)
+            assert info.mtime == status.st_mtime
+            assert float(info.pax_headers['atime']) == status.st_atime
+            with fs.open(path, 'rb') as f:
+                assert tar.extractfile(info).read() == f.read()
+        assert tar.getmember('file2').isreg()
+        assert tar.getmember('same').isreg()
+
+
+def create_tar(members):
+    out = BytesIO()
+    with tarfile.open(fileobj=out, mode='w', format=tarfile.PAX_FORMAT) as tar:
+        for name, content in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            info.mode = 0o640
+            info.mtime = 2.5
+            tar.addfile(info, BytesIO(content))
+    out.seek(0)
+    return out
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_import_archive_roundtrip(fs, fridge, fridge_core, compress):
+    fs.mkdir('dir')
+    write_file(fs, os.path.join('dir', 'file1'), u'content1')
+    write_file(fs, 'file2', u'content2')
+    write_file(fs, 'same', u'content2')
+    fs.chmod('file2', stat.S_IRUSR)
+    fs.utime('file2', (1.5, 2.25))
+    fridge.commit()
+    head = fridge_core.get_head_key()
+    out = BytesIO()
+    write_archive(fridge_core, head, out, compress=compress, fs=fs)
+
+    out.seek(0)
+    key = import_archive(fridge_core, out, u'imported', u'msg')
+    commit = fridge_core.read_commit(key)
+    assert fridge_core.resolve_branch(u'imported') == key
+    assert commit.parent is None
+    assert commit.message == u'msg'
+    by_path = lambda item: item.path
+    assert sorted(
+        fridge_core.read_snapshot(commit.snapshot), key=by_path) == sorted(
+            fridge_core.read_snapshot(fridge_core.read_commit(head).snapshot),
+            key=by_path)
+    assert fridge_core.get_head_key() == head
+
+
+def test_import_archive_uses_branch_tip_as_parent(fridge_core):
+    first = import_archive(
+        fridge_core, create_tar([('a', b'1')]), u'data')
+    second = import_archive(
+        fridge_core, create_tar([('./b/c', b'2')]), u'data')
+    assert fridge_core.read_commit(second).parent == first
+    snapshot = fridge_core.read_snapshot(
+        fridge_core.read_commit(second).snapshot)
+    assert [item.path for item in snapshot] == [
+        os.path.join(os.curdir, 'b', 'c')]
+    item = snapshot[0]
+    assert stat.S_IMODE(item.status.st_mode) == 0o640
+    assert item.status.st_size == 1
+    assert item.status.st_mtime == item.status.st_atime == 2.5
+
+
+def test_import_archive_refuses_checked_out_branch(fridge, fridge_core):
+    fridge.branch(u'data')
+    with pytest.raises(BranchCheckedOutError):
+        import_archive(fridge_core, create_tar([('a', b'1')]), u'data')
+
+
+@pytest.mark.parametrize('name', ['../escape', 'a/../../b', '', '.'])
+def test_snapshot_path_rejects_names_outside_root(name):
+    with pytest.raises(InvalidArchiveError):
+        snapshot_path(name)
+
+
+def test_snapshot_path_ignores_leading_slash():
+    assert snapshot_path('/a//b') == os.path.join(os.curdir, 'a', 'b')
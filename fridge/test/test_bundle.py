@@ -0,0 +1,126 @@
+from io import BytesIO
+import os.path
+
+import pytest
+
+from fridge.bundle import (
+    InvalidBundleError, MissingPrerequisiteError, create_bundle, unbundle)
+from fridge.core import (
+    BranchCheckedOutError, CorruptObjectError, Fridge, FridgeCore, Reference)
+from fridge.fstest import write_file
+from fridge.memoryfs import MemoryFS
+
+
+@pytest.fixture
+def fs():
+    return MemoryFS()
+
+
+@pytest.fixture
+def source(fs):
+    fs.mkdir('source')
+    return Fridge(FridgeCore.init('source', fs), fs)
+
+
+@pytest.fixture
+def target(fs):
+    fs.mkdir('target')
+    core = FridgeCore.init('target', fs)
+    # The bundled branches must not be checked out in the target.
+    core.set_head(Reference(Reference.BRANCH, u'local'))
+    return core
+
+
+def commit_file(fs, fridge, name, content):
+    write_file(fs, os.path.join('source', name), content)
+    fridge.commit()
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_bundle_roundtrip(fs, source, target, compress):
+    commit_file(fs, source, 'file1', u'content1')
+    commit_file(fs, source, 'file2', u'content2')
+    core = FridgeCore('source', fs)
+
+    bundle = BytesIO()
+    create_bundle(core, bundle, ['master'], compress=compress, fs=fs)
+    bundle.seek(0)
+    assert unbundle(target, bundle, fs=fs) == [
+        ('master', core.get_head_key())]
+
+    assert target.resolve_branch('master') == core.get_head_key()
+    for key, commit in source.log():
+        assert target.read_commit(key) == commit
+        for item in target.read_snapshot(commit.snapshot):
+            assert target.blobs.contains(item.checksum)
+    assert target.whence(item.checksum) == core.whence(item.checksum)
+
+
+def test_incremental_bundle(fs, source, target):
+    commit_file(fs, source, 'file1', u'content1')
+    core = FridgeCore('source', fs)
+    base = core.get_head_key()
+    bundle = BytesIO()
+    create_bundle(core, bundle, ['master'], fs=fs)
+    bundle.seek(0)
+    unbundle(target, bundle, fs=fs)
+
+    commit_file(fs, source, 'file2', u'content2')
+    bundle = BytesIO()
+    create_bundle(core, bundle, ['master'], bases=[base], fs=fs)
+    assert b'content1' not in bundle.getvalue()
+    assert b'content2' in bundle.getvalue()
+    bundle.seek(0)
+    unbundle(target, bundle, fs=fs)
+    assert target.resolve_branch('master') == core.get_head_key()
+
+
+def test_unbundle_requires_prerequisites(fs, source, target):
+    commit_file(fs, source, 'file1', u'content1')
+    core = FridgeCore('source', fs)
+    base = core.get_head_key()
+    commit_file(fs, source, 'file2', u'content2')
+    bundle = BytesIO()
+    create_bundle(core, bundle, ['master'], bases=[base], fs=fs)
+    bundle.seek(0)
+    with pytest.raises(MissingPrerequisiteError):
+        unbundle(target, bundle, fs=fs)
+
+
+def test_unbundle_detects_corruption(fs, source, target):
+    commit_file(fs, source, 'file1', u'content1')
+    core = FridgeCore('source', fs)
+    bundle = BytesIO()
+    create_bundle(core, bundle, ['master'], fs=fs)
+    with pytest.raises(CorruptObjectError):
+        unbundle(target, BytesIO(
+            bundle.getvalue().replace(b'content1', b'CONTENT1')), fs=fs)
+    assert target.resolve_branch('master') == ''
+
+
+def test_unbundle_rejects_invalid_bundles(target, fs):
+    with pytest.raises(InvalidBundleError):
+        unbundle(target, BytesIO(b'not a bundle\n'), fs=fs)
+
+
+@pytest.mark.parametrize('name', [
+    u'../escape', u'a/b', u'..', u'.', u'a b', u''])
+def test_unbundle_rejects_invalid_branch_names(target, fs, name):
+    bundle = BytesIO(u'fridge-bundle 1 none\nbranch {} {}\n\nend\n'.format(
+        u'0' * 64, name).encode('utf-8'))
+    with pytest.raises(InvalidBundleError, match='branch name'):
+        unbundle(target, bundle, fs=fs)
+    assert target.list_branches() == [u'master']
+
+
+def test_unbundle_refuses_checked_out_branch(fs, source, target):
+    commit_file(fs, source, 'file1', u'content1')
+    core = FridgeCore('source', fs)
+    bundle = BytesIO()
+    create_bundle(core, bundle, ['master'], fs=fs)
+    target.set_head(Reference(Reference.BRANCH, u'master'))
+    bundle.seek(0)
+    with pytest.raises(BranchCheckedOutError):
+        unbundle(target, bundle, fs=fs)
+    assert target.resolve_branch('master') == ''
+    assert not target.commits.contains(core.get_head_key())
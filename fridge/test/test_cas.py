@@ -1,3 +1,6 @@
+from io import BytesIO
+import stat
+
 import pytest
 
 from fridge.cas import ContentAddressableStorage
@@ -45,6 +48,34 @@ class TestContentAddressableStorage(object):
         cas.store('testfile')
         assert not fs.exists('testfile')
 
+    def test_keeps_file_if_requested(self, fs, cas):
+        write_file(fs, 'testfile', u'dummy content')
+        fs.chmod('testfile', stat.S_IRWXU)
+        key = cas.store('testfile', keep=True)
+        assert_file_content_equal(fs, cas.get_path(key), u'dummy content')
+        assert stat.S_IMODE(fs.stat(cas.get_path(key)).st_mode) == (
+            stat.S_IRUSR)
+        write_file(fs, 'testfile', u'replaced content')
+        assert_file_content_equal(fs, cas.get_path(key), u'dummy content')
+        assert cas.store('testfile', keep=True) != key
+        assert len(list(cas.keys())) == 2
+
+    def test_reads_files_sequentially_if_supported(self, fs):
+        opened = []
+
+        class SequentialFS(MemoryFS):
+            def open_sequential(self, path):
+                opened.append(path)
+                return self.open(path, 'rb')
+
+        fs = SequentialFS()
+        cas = ContentAddressableStorage('cas', fs)
+        write_file(fs, 'file1', u'content1')
+        write_file(fs, 'file2', u'content2')
+        cas.store('file1')
+        cas.store('file2', keep=True)
+        assert opened == ['file1', 'file2']
+
     def test_writing_original_files_keeps_stored_file_unchanged(self, fs):
         write_file(fs, 'testfile', u'dummy content')
 
@@ -55,3 +86,36 @@ class TestContentAddressableStorage(object):
         write_file(fs, 'testfile', u'replaced content')
         cas = ContentAddressableStorage('cas', fs=fs)
         assert_file_content_equal(fs, cas.get_path(key), u'dummy content')
+
+    def test_keys(self, fs, cas):
+        write_file(fs, 'file1', u'content1')
+        write_file(fs, 'file2', u'content2')
+        keys = set([cas.store('file1'), cas.store('file2')])
+        write_file(fs, cas.mktemp(), u'temporary')
+        assert set(cas.keys()) == keys
+        assert all(cas.contains(key) for key in keys)
+        assert not cas.contains(40 * '0')
+
+    def test_mktemp_returns_unique_paths(self, fs, cas):
+        path = cas.mktemp()
+        write_file(fs, path)
+        assert cas.mktemp() != path
+
+    def test_store_stream(self, fs, cas):
+        key = cas.store_stream(BytesIO(b'dummy content'), stat.S_IRWXU)
+        assert_file_content_equal(fs, cas.get_path(key), u'dummy content')
+        assert stat.S_IMODE(fs.stat(cas.get_path(key)).st_mode) == (
+            stat.S_IRUSR)
+        write_file(fs, 'testfile', u'dummy content')
+        assert cas.store('testfile') == key
+        assert cas.store_stream(BytesIO(b'dummy content')) == key
+        assert list(cas.keys()) == [key]
+
+    def test_store_buffer(self, fs, cas):
+        key = cas.store_buffer(memoryview(b'dummy content'), stat.S_IRWXU)
+        assert_file_content_equal(fs, cas.get_path(key), u'dummy content')
+        assert stat.S_IMODE(fs.stat(cas.get_path(key)).st_mode) == (
+            stat.S_IRUSR)
+        assert cas.store_stream(BytesIO(b'dummy content')) == key
+        assert cas.store_buffer(bytearray(b'dummy content')) == key
+        assert list(cas.keys()) == [key]
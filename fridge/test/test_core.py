@@ -1,13 +1,19 @@
 import os.path
+import socket
 import stat
+import subprocess
+import sys
 
 from mock import MagicMock
 import pytest
 
 from fridge.core import (
-    AmbiguousReferenceError, Branch, BranchExistsError, Commit, DataObject,
-    Fridge, FridgeCore, NothingToCommitError, Reference, SnapshotItem,
-    UnknownReferenceError, Stat)
+    AmbiguousReferenceError, Branch, BranchCheckedOutError, BranchExistsError,
+    Commit, DataObject, Fridge, FridgeCore, InvalidPathError,
+    LocalChangesError, LockTimeoutError, NonFastForwardError,
+    NothingToCommitError, Reference, SnapshotItem,
+    Transaction, UnknownPathError, UnknownReferenceError, UnknownRemoteError,
+    Stat, WhenceEntry)
 from fridge.fstest import write_file
 from fridge.memoryfs import MemoryFS
 
@@ -132,6 +138,13 @@ def test_reference_with_branch_serialization_roundtrip():
     assert a == b
 
 
+def test_whence_entry_serialization_roundtrip():
+    a = WhenceEntry('key', 'commit', ' some \n /weird \t path ')
+    ser = a.serialize()
+    b = WhenceEntry.parse(ser)
+    assert a == b
+
+
 class TestFridgeCore(object):
     def _create_snapshot(self):
         return [
@@ -149,6 +162,100 @@ class TestFridgeCore(object):
         parsed = FridgeCore.parse_snapshot(serialized)
         assert snapshot == parsed
 
+    def test_empty_snapshot_roundtrip(self, fs, fridge_core):
+        assert FridgeCore.serialize_snapshot([]) == ''
+        assert FridgeCore.parse_snapshot('') == []
+        key = fridge_core.add_snapshot([])
+        assert FridgeCore(os.curdir, fs).read_snapshot(key) == []
+
+    def test_sparse_patterns(self, fs, fridge_core):
+        assert fridge_core.get_sparse_patterns() == []
+        fridge_core.set_sparse_patterns(['a/*', 'b'])
+        assert FridgeCore(os.curdir, fs).get_sparse_patterns() == [
+            'a/*', 'b']
+        fridge_core.set_sparse_patterns([])
+        assert fridge_core.get_sparse_patterns() == []
+
+    def test_lock(self, fs, fridge_core):
+        other = FridgeCore(os.curdir, fs)
+        with fridge_core.lock():
+            with fridge_core.lock():
+                pass
+            with pytest.raises(LockTimeoutError):
+                with other.lock(timeout=0.01):
+                    pass
+        with other.lock():
+            pass
+
+    def test_lock_timeout_names_owner(self, fs, fridge_core):
+        with fridge_core.lock():
+            with pytest.raises(LockTimeoutError) as excinfo:
+                with FridgeCore(os.curdir, fs).lock(timeout=0.01):
+                    pass
+        message = str(excinfo.value)
+        assert 'process {}'.format(os.getpid()) in message
+        assert 'remove the directory' in message
+
+    def test_breaks_lock_of_dead_process(self, fs, fridge_core):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        lock_path = os.path.join('.fridge', 'lock')
+        fs.mkdir(lock_path)
+        write_file(fs, os.path.join(lock_path, 'owner'), u'{} {}\n'.format(
+            process.pid, socket.gethostname()))
+        with fridge_core.lock(timeout=0.01):
+            assert fs.exists(lock_path)
+        assert not fs.exists(lock_path)
+
+        fs.mkdir(lock_path)
+        write_file(fs, os.path.join(lock_path, 'owner'), u'{} {}\n'.format(
+            process.pid, 'other-host'))
+        with pytest.raises(LockTimeoutError):
+            with fridge_core.lock(timeout=0.01):
+                pass
+
+    def test_commits_use_unique_temporary_files(self, fs, fridge_core):
+        s = self._create_snapshot()
+        fs.mkdir(os.path.join('.fridge', 'tmp'))
+        fridge_core.add_commit(fridge_core.add_snapshot(s), 'msg')
+        assert fs.exists(os.path.join('.fridge', 'tmp'))
+
+    def test_add_snapshot_sorts_by_path(self, fridge_core):
+        s = self._create_snapshot()
+        key = fridge_core.add_snapshot(list(reversed(s)))
+        assert fridge_core.read_snapshot(key) == s
+
+    @pytest.mark.parametrize('path', ['a', './b', 'c/../b'])
+    def test_find_snapshot_item(self, path):
+        for s in [self._create_snapshot(),
+                  list(reversed(self._create_snapshot()))]:
+            s = [SnapshotItem(i.checksum, os.path.join(os.curdir, i.path),
+                              i.status) for i in s]
+            item = FridgeCore.find_snapshot_item(s, path)
+            assert item.path == os.path.join(
+                os.curdir, os.path.normpath(path))
+        with pytest.raises(UnknownPathError):
+            FridgeCore.find_snapshot_item(s, 'c')
+
+    def test_read_snapshot_item(self, fs, fridge_core):
+        snapshot = [SnapshotItem(
+            'key{}'.format(i), os.path.join(os.curdir, 'f{}'.format(i)),
+            create_file_status()) for i in range(20)]
+        key = fridge_core.add_snapshot(snapshot)
+        unsorted_key = fridge_core.snapshots.store_buffer(
+            FridgeCore.serialize_snapshot(reversed(snapshot)).encode())
+        for k in (key, unsorted_key):
+            core = FridgeCore(os.curdir, fs)
+            core.read_snapshot = MagicMock()
+            for item in snapshot:
+                assert core.read_snapshot_item(k, item.path) == item
+            with pytest.raises(UnknownPathError):
+                core.read_snapshot_item(k, 'f')
+            assert not core.read_snapshot.called
+        empty_key = fridge_core.add_snapshot([])
+        with pytest.raises(UnknownPathError):
+            FridgeCore(os.curdir, fs).read_snapshot_item(empty_key, 'f0')
+
     def test_add_blob_and_checkout_blob(self, fs, fridge_core):
         write_file(fs, 'path', u'content')
         key = fridge_core.add_blob('path')
@@ -192,6 +299,13 @@ class TestFridgeCore(object):
         assert fridge.get_head() == Reference(Reference.COMMIT, u'ab12cd')
         assert fridge.get_head_key() == u'ab12cd'
 
+    def test_set_head_replaces_head_file(self, fs, fridge_core):
+        fs.replace = MagicMock(wraps=fs.replace)
+        fridge_core.set_head(Reference(Reference.COMMIT, u'ab12cd'))
+        fs.replace.assert_called_once_with(
+            os.path.join('.', '.fridge', 'head.tmp'),
+            os.path.join('.', '.fridge', 'head'))
+
     def test_setting_and_getting_branch(self, fs):
         fridge = FridgeCore.init(os.curdir, fs)
         fridge.set_branch('test_branch', u'ab12cd')
@@ -201,6 +315,165 @@ class TestFridgeCore(object):
         assert fridge.is_branch('test_branch')
         assert fridge.resolve_branch('test_branch') == u'ab12cd'
 
+    def test_set_branch_replaces_branch_file(self, fs, fridge_core):
+        fridge_core.set_branch('test_branch', u'ab12cd')
+        fs.replace = MagicMock(wraps=fs.replace)
+        fridge_core.set_branch('test_branch', u'ef34ab')
+        fs.replace.assert_called_once_with(
+            os.path.join('.fridge', 'branch.tmp'),
+            os.path.join('.fridge', 'branches', 'test_branch'))
+        assert FridgeCore(os.curdir, fs).resolve_branch('test_branch') == (
+            u'ef34ab')
+
+    def test_list_branches(self, fs, fridge_core):
+        fridge_core.set_branch('b', u'ab12cd')
+        fridge_core.set_branch('a', u'ef34')
+        assert fridge_core.list_branches() == ['a', 'b', 'master']
+
+    def test_packed_branches(self, fs, fridge_core):
+        for i in range(10):
+            fridge_core.set_branch('branch{}'.format(i), u'{}'.format(i))
+        fridge_core.pack_branches()
+        assert not fs.exists(os.path.join('.fridge', 'branches', 'branch0'))
+
+        fridge = FridgeCore(os.curdir, fs)
+        assert fridge.is_branch('branch3')
+        assert not fridge.is_branch('branch')
+        assert fridge.resolve_branch('branch3') == u'3'
+        assert fridge.resolve_branch('master') == u''
+
+        fridge.set_branch('branch3', u'ab12cd')
+        fridge.set_branch('new', u'ef34')
+        fridge = FridgeCore(os.curdir, fs)
+        assert fridge.resolve_branch('branch3') == u'ab12cd'
+        assert fridge.resolve_branch('new') == u'ef34'
+        assert fridge.list_branches() == sorted(
+            ['branch{}'.format(i) for i in range(10)] + ['master', 'new'])
+
+        fridge.pack_branches()
+        fridge = FridgeCore(os.curdir, fs)
+        assert fridge.resolve_branch('branch3') == u'ab12cd'
+        assert fridge.resolve_branch('new') == u'ef34'
+
+    def test_sees_branches_packed_by_other_instance(self, fs, fridge_core):
+        fridge_core.set_branch('loose', u'ab12')
+        other = FridgeCore(os.curdir, fs)
+        assert other.resolve_branch('loose') == u'ab12'
+        assert not other.is_branch('new')
+
+        fridge_core.set_branch('new', u'cd34')
+        fridge_core.pack_branches()
+        assert other.resolve_branch('loose') == u'ab12'
+        assert other.is_branch('new')
+        assert other.resolve_branch('new') == u'cd34'
+        assert other.list_branches() == ['loose', 'master', 'new']
+
+    def test_sees_loose_branches_of_other_instance(self, fs, fridge_core):
+        fridge_core.set_branch('master', u'c1')
+        fridge_core.pack_branches()
+        other = FridgeCore(os.curdir, fs)
+        assert other.resolve_branch('master') == u'c1'
+
+        fridge_core.set_branch('master', u'c2')
+        fridge_core.set_branch('new', u'c3')
+        assert other.resolve_branch('master') == u'c2'
+        assert other.list_branches() == ['master', 'new']
+        assert other.resolve_branch('new') == u'c3'
+
+    def test_remotes(self, fs, fridge_core):
+        fs.mkdir('origin')
+        fridge_core.set_remote('origin', 'origin')
+        assert FridgeCore(os.curdir, fs).get_remote('origin') == 'origin'
+        with pytest.raises(UnknownRemoteError):
+            fridge_core.get_remote('unknown')
+
+    @pytest.mark.parametrize('partial', [False, True])
+    def test_clone(self, fs, partial):
+        fs.mkdir('origin')
+        origin = FridgeCore.init('origin', fs)
+        write_file(fs, 'file', u'content')
+        key = origin.add_blob('file')
+        snapshot = [SnapshotItem(key, 'file', create_file_status())]
+        commit = origin.add_commit(origin.add_snapshot(snapshot), 'msg')
+        origin.set_branch('master', commit)
+
+        clone = FridgeCore.clone('origin', 'clone', fs, partial=partial)
+        assert clone.resolve_branch('master') == commit
+        assert clone.get_head() == Reference(Reference.BRANCH, 'master')
+        assert clone.read_snapshot(clone.read_commit(commit).snapshot) == (
+            snapshot)
+        assert clone.whence(key) == origin.whence(key)
+        assert clone.is_partial() == partial
+        assert clone.blobs.contains(key) != partial
+
+        clone.checkout_blob(key, 'checkout')
+        assert fs.get_node(['checkout']).content.decode() == u'content'
+        assert clone.blobs.contains(key)
+
+    def test_partial_clone_prefetches_blobs(self, fs):
+        fs.mkdir('origin')
+        origin = Fridge(FridgeCore.init('origin', fs), fs)
+        write_file(fs, os.path.join('origin', 'file1'), u'content1')
+        write_file(fs, os.path.join('origin', 'file2'), u'content2')
+        origin.commit()
+
+        clone = FridgeCore.clone('origin', 'clone', fs, partial=True)
+        snapshot = clone.read_snapshot(clone.read_commit(
+            clone.get_head_key()).snapshot)
+        assert not any(clone.blobs.contains(i.checksum) for i in snapshot)
+        clone.prefetch_blobs(item.checksum for item in snapshot)
+        assert all(clone.blobs.contains(i.checksum) for i in snapshot)
+
+    @pytest.mark.parametrize('link', [
+        FridgeCore.HARDLINK, FridgeCore.SYMLINK, FridgeCore.AUTO])
+    def test_checkout_blob_as_link(self, fs, fridge_core, link):
+        write_file(fs, 'file', u'content')
+        key = fridge_core.add_blob('file')
+        assert fridge_core.checkout_blob(key, 'file', link) != FridgeCore.COPY
+        assert fridge_core.is_linked(key, 'file')
+
+    def test_checkout_blob_copy_breaks_link(self, fs, fridge_core):
+        write_file(fs, 'file', u'content')
+        key = fridge_core.add_blob('file')
+        fridge_core.checkout_blob(key, 'file', FridgeCore.HARDLINK)
+        fridge_core.checkout_blob(key, 'file', FridgeCore.COPY)
+        assert not fridge_core.is_linked(key, 'file')
+        write_file(fs, 'file', u'changed')
+        fridge_core.checkout_blob(key, 'file2')
+        assert fs.get_node(['file2']).content.decode() == u'content'
+
+    def test_worktree_shares_object_store(self, fs, fridge_core):
+        fridge_core.set_branch('test_branch', u'ab12cd')
+        worktree = FridgeCore.init_worktree('wt', fridge_core.common_dir, fs)
+        worktree.set_head(Reference(Reference.COMMIT, u'ef34'))
+
+        assert not fs.exists(os.path.join('wt', '.fridge', 'blobs'))
+        assert worktree.common_dir == fridge_core.common_dir
+        assert worktree.resolve_branch('test_branch') == u'ab12cd'
+        assert fridge_core.get_head() == Reference(Reference.BRANCH, 'master')
+
+        write_file(fs, 'file', u'content')
+        key = worktree.add_blob('file')
+        assert fs.exists(os.path.join('.fridge', 'blobs', key[:2], key[2:]))
+
+    def test_whence_indexes_introducing_commits(self, fs, fridge_core):
+        s1 = self._create_snapshot()
+        c1 = fridge_core.add_commit(fridge_core.add_snapshot(s1), 'msg1')
+        fridge_core.set_branch('master', c1)
+        s2 = s1 + [SnapshotItem('a1b2', 'c', create_file_status())]
+        c2 = fridge_core.add_commit(fridge_core.add_snapshot(s2), 'msg2')
+
+        assert fridge_core.whence('cd34') == [WhenceEntry('cd34', c1, 'b')]
+        assert fridge_core.whence('a1b2') == [
+            WhenceEntry('a1b2', c1, 'a'), WhenceEntry('a1b2', c2, 'c')]
+        assert fridge_core.whence('ef56') == []
+
+    def test_whence_skips_partial_and_prefix_entries(self, fs, fridge_core):
+        fs.makedirs(os.path.join('.fridge', 'whence'))
+        with fs.open(os.path.join('.fridge', 'whence', 'ab'), 'w') as f:
+            f.write(u"ab12 c1 './a'\nab123 c1 './b'\nab12 c2 './")
+        assert fridge_core.whence('ab12') == [WhenceEntry('ab12', 'c1', './a')]
+
     def test_checkout_blob_on_checkedout(self, fs, fridge_core):
         write_file(fs, 'mockfile', u'content')
         key = fridge_core.add_blob('mockfile')
@@ -208,6 +481,97 @@ class TestFridgeCore(object):
         fridge_core.checkout_blob(key, 'mockfile')
         assert fs.get_node(['mockfile']).content.decode() == u'content'
 
+    def test_add_blob_from_buffer(self, fs, fridge_core):
+        write_file(fs, 'mockfile', u'content')
+        key = fridge_core.add_blob_from_buffer(bytearray(b'content'))
+        assert fridge_core.add_blob('mockfile') == key
+        assert fridge_core.blobs.contains(key)
+
+    def test_open_blob(self, fs, fridge_core):
+        write_file(fs, 'mockfile', u'content')
+        key = fridge_core.add_blob('mockfile')
+        with fridge_core.open_blob(key) as f:
+            assert f.read() == b'content'
+
+    def test_map_blob_falls_back_to_reading(self, fs, fridge_core):
+        write_file(fs, 'mockfile', u'content')
+        key = fridge_core.add_blob('mockfile')
+        assert fridge_core.map_blob(key).tobytes() == b'content'
+
+    @pytest.mark.parametrize('content', [b'content', b''])
+    def test_map_blob(self, tmpdir, content):
+        core = FridgeCore.init(str(tmpdir))
+        key = core.add_blob_from_buffer(content)
+        view = core.map_blob(key)
+        assert view.readonly
+        assert view.tobytes() == content
+
+
+class TestTransaction(object):
+    def test_commit_builds_on_branch(self, fs, fridge, fridge_core):
+        write_file(fs, 'a', u'a')
+        write_file(fs, 'b', u'b')
+        fridge.commit()
+        fridge.branch('data')
+        fridge.checkout('master')
+        head = fridge_core.get_head_key()
+
+        transaction = Transaction(fridge_core, 'data', fs)
+        key_c = transaction.add(
+            os.path.join('dir', 'c'), memoryview(b'cc'), 0o600)
+        transaction.remove('b')
+        key = transaction.commit(u'msg')
+
+        assert fridge_core.resolve_branch('data') == key
+        assert fridge_core.get_head_key() == head
+        commit = fridge_core.read_commit(key)
+        assert commit.parent == head
+        assert commit.message == u'msg'
+        snapshot = fridge_core.read_snapshot(commit.snapshot)
+        assert [item.path for item in snapshot] == [
+            os.path.join(os.curdir, 'a'),
+            os.path.join(os.curdir, 'dir', 'c')]
+        assert snapshot[1].checksum == key_c
+        assert snapshot[1].status.st_size == 2
+        assert stat.S_IMODE(snapshot[1].status.st_mode) == 0o600
+
+    def test_commit_creates_branch(self, fs, fridge_core):
+        transaction = Transaction(fridge_core, 'data', fs)
+        transaction.add('a', b'a')
+        key = transaction.commit()
+        assert fridge_core.resolve_branch('data') == key
+        assert fridge_core.read_commit(key).parent is None
+
+    def test_commit_fails_if_branch_moved(self, fs, fridge_core):
+        transaction = Transaction(fridge_core, 'data', fs)
+        other = Transaction(fridge_core, 'data', fs)
+        other.add('a', b'a')
+        other.commit()
+        transaction.add('b', b'b')
+        with pytest.raises(NonFastForwardError):
+            transaction.commit()
+
+    def test_refuses_checked_out_branch(self, fs, fridge_core):
+        with pytest.raises(BranchCheckedOutError):
+            Transaction(fridge_core, 'master', fs)
+
+        transaction = Transaction(fridge_core, 'data', fs)
+        transaction.add('a', b'a')
+        fridge_core.set_head(Reference(Reference.BRANCH, 'data'))
+        with pytest.raises(BranchCheckedOutError):
+            transaction.commit()
+        assert not fridge_core.is_branch('data')
+
+    @pytest.mark.parametrize('path', [
+        os.path.abspath('a'), os.path.join(os.pardir, 'a'),
+        os.path.join('dir', os.pardir, os.pardir, 'a'), os.curdir, ''])
+    def test_rejects_paths_outside_of_worktree(self, fs, fridge_core, path):
+        transaction = Transaction(fridge_core, 'data', fs)
+        with pytest.raises(InvalidPathError):
+            transaction.add(path, b'a')
+        with pytest.raises(InvalidPathError):
+            transaction.remove(path)
+
 
 class TestFridge(object):
     def test_commit_and_checkout(self, fridge, fs):
@@ -219,6 +583,46 @@ class TestFridge(object):
         assert fs.get_node(['mockfile']).content.decode() == u'content'
         assert fs.stat('mockfile') == status
 
+    @pytest.mark.parametrize('link', [
+        FridgeCore.HARDLINK, FridgeCore.SYMLINK, FridgeCore.AUTO])
+    def test_checkout_with_links(self, fridge, fridge_core, fs, link):
+        write_file(fs, 'mockfile', u'content')
+        fridge.commit()
+        item = fridge_core.read_snapshot(fridge_core.read_commit(
+            fridge_core.get_head_key()).snapshot)[0]
+
+        fridge.checkout(link=link)
+        assert fridge_core.is_linked(item.checksum, 'mockfile')
+        assert fridge.is_clean()
+
+        write_file(fs, 'other', u'other')
+        fridge.commit()
+        snapshot = fridge_core.read_snapshot(fridge_core.read_commit(
+            fridge_core.get_head_key()).snapshot)
+        assert item in snapshot
+        assert fridge_core.is_linked(item.checksum, 'mockfile')
+
+        fridge.checkout()
+        assert not fridge_core.is_linked(item.checksum, 'mockfile')
+        assert fs.stat('mockfile') == item.status
+
+    @pytest.mark.parametrize('link', FridgeCore.LINK_MODES)
+    def test_checkout_replaces_untracked_files(
+            self, fridge, fridge_core, fs, link):
+        write_file(fs, 'a', u'a')
+        fridge.commit()
+        fridge.branch('b2')
+        write_file(fs, 'b', u'b')
+        fridge.commit()
+        fridge.checkout('master')
+        write_file(fs, 'b', u'untracked')
+
+        fridge.checkout('b2', link=link)
+        assert fridge_core.get_head() == Reference(Reference.BRANCH, 'b2')
+        with fs.open('b') as f:
+            assert f.read() == u'b'
+        assert fridge.is_clean()
+
     def test_commits_only_if_dirty(self, fridge, fs):
         with pytest.raises(NothingToCommitError):
             fridge.commit()
@@ -226,6 +630,50 @@ class TestFridge(object):
         fridge.commit()
         with pytest.raises(NothingToCommitError):
             fridge.commit()
+        fs.unlink('file')
+        fridge.commit()
+        with pytest.raises(NothingToCommitError):
+            fridge.commit()
+
+    def test_commit_is_clean_in_new_instance(self, fridge, fs):
+        write_file(fs, 'file', u'content')
+        fs.utime('file', (1500000000.1234567, 1500000000.9876543))
+        fridge.commit()
+        fridge = Fridge(FridgeCore(os.curdir, fs), fs)
+        assert fridge.is_clean()
+        with pytest.raises(NothingToCommitError):
+            fridge.commit()
+
+    @pytest.mark.parametrize('link', [
+        FridgeCore.HARDLINK, FridgeCore.SYMLINK, FridgeCore.AUTO])
+    def test_detects_changes_through_links(self, fridge, fs, link):
+        write_file(fs, 'mockfile', u'content')
+        fridge.commit()
+        fridge.checkout(link=link)
+        assert fridge.is_clean()
+        fs.chmod('mockfile', 0o644)
+        write_file(fs, 'mockfile', u'CONTENT')
+        assert fridge.diff().updated == ['mockfile']
+
+    def test_copies_blobs_linked_with_other_mtime(self, tmpdir):
+        fridge_core = FridgeCore.init(str(tmpdir))
+        fridge = Fridge(fridge_core)
+        for name, mtime in (('a', 1e9), ('b', 2e9)):
+            tmpdir.join(name).write('content')
+            os.utime(str(tmpdir.join(name)), (mtime, mtime))
+        fridge.commit()
+        fridge.checkout(link=FridgeCore.HARDLINK)
+        key = fridge.get_item(None, 'a').checksum
+        assert sorted(fridge_core.is_linked(key, str(tmpdir.join(name)))
+                      for name in ('a', 'b')) == [False, True]
+        assert fridge.is_clean()
+
+    def test_commit_leaves_working_files_in_place(self, fridge, fs):
+        write_file(fs, 'file', u'content')
+        node = fs.get_node(['file'])
+        fridge.commit()
+        assert fs.get_node(['file']) is node
+        assert fridge.is_clean()
 
     def test_log(self):
         commits = [
@@ -242,6 +690,134 @@ class TestFridge(object):
 
         assert commits == Fridge(core_mock, fs).log()
 
+    @pytest.mark.parametrize('prefetch,max_bytes', [(8, 1024), (1, 1024), (
+        8, 1)])
+    def test_iter_files(self, fridge, fs, prefetch, max_bytes):
+        fs.mkdir('dir')
+        write_file(fs, os.path.join('dir', 'a.dat'), u'a')
+        write_file(fs, 'b.dat', u'bb')
+        write_file(fs, 'c.txt', u'ccc')
+        fridge.commit()
+        fridge.branch('other')
+        write_file(fs, 'b.dat', u'new')
+        fridge.commit()
+
+        files = list(fridge.iter_files(
+            'master', prefetch=prefetch, max_bytes=max_bytes))
+        assert [(path, data) for path, data, _ in files] == [
+            (os.path.join(os.curdir, 'b.dat'), b'bb'),
+            (os.path.join(os.curdir, 'c.txt'), b'ccc'),
+            (os.path.join(os.curdir, 'dir', 'a.dat'), b'a')]
+        assert files[1][2].st_size == 3
+
+        files = fridge.iter_files(pattern='*.dat', by_location=True)
+        assert sorted((path, data) for path, data, _ in files) == [
+            (os.path.join(os.curdir, 'b.dat'), b'new'),
+            (os.path.join(os.curdir, 'dir', 'a.dat'), b'a')]
+
+    def test_sparse_checkout(self, fridge, fridge_core, fs):
+        fs.makedirs(os.path.join('results', 'summary'))
+        summary = os.path.join('results', 'summary', 'file')
+        write_file(fs, summary, u'summary')
+        write_file(fs, os.path.join('results', 'raw'), u'raw')
+        write_file(fs, 'other', u'other')
+        fridge.commit()
+
+        fridge.set_sparse(['results/summary'])
+        assert fs.exists(summary)
+        assert not fs.exists(os.path.join('results', 'raw'))
+        assert not fs.exists('other')
+        assert fridge.is_clean()
+
+        write_file(fs, summary, u'new summary')
+        write_file(fs, 'ignored', u'outside of patterns')
+        fridge.commit()
+        snapshot = fridge_core.read_snapshot(fridge_core.read_commit(
+            fridge_core.get_head_key()).snapshot)
+        assert [item.path for item in snapshot] == [
+            os.path.join(os.curdir, p) for p in [
+                'other', os.path.join('results', 'raw'), summary]]
+
+        fs.unlink(summary)
+        fridge.checkout()
+        with fs.open(summary) as f:
+            assert f.read() == u'new summary'
+        assert not fs.exists('other')
+
+        fs.unlink('ignored')
+        fridge.set_sparse([])
+        with fs.open('other') as f:
+            assert f.read() == u'other'
+        assert fridge.is_clean()
+
+    def test_sparse_checkout_keeps_local_changes(
+            self, fridge, fridge_core, fs):
+        fs.mkdir('keep')
+        fs.mkdir('drop')
+        write_file(fs, os.path.join('keep', 'a'), u'a')
+        write_file(fs, os.path.join('drop', 'b'), u'b')
+        fridge.commit()
+
+        write_file(fs, os.path.join('drop', 'b'), u'changed')
+        with pytest.raises(LocalChangesError):
+            fridge.set_sparse(['keep'])
+        assert fridge_core.get_sparse_patterns() == []
+        with fs.open(os.path.join('drop', 'b')) as f:
+            assert f.read() == u'changed'
+
+        fridge.commit()
+        fridge.set_sparse(['keep'])
+        assert not fs.exists(os.path.join('drop', 'b'))
+
+    def test_restore(self, fridge, fs):
+        fs.mkdir('dir')
+        write_file(fs, os.path.join('dir', 'file'), u'old')
+        write_file(fs, 'other', u'old')
+        fridge.commit()
+        fridge.branch('new')
+        write_file(fs, os.path.join('dir', 'file'), u'new')
+        write_file(fs, 'other', u'new')
+        fridge.commit()
+        fs.unlink(os.path.join('dir', 'file'))
+        fs.rmdir('dir')
+
+        fridge.restore('master', [os.path.join('dir', 'file')])
+        with fs.open(os.path.join('dir', 'file')) as f:
+            assert f.read() == u'old'
+        with fs.open('other') as f:
+            assert f.read() == u'new'
+        assert fridge.get_item(None, 'other').status.st_size == 3
+        with pytest.raises(UnknownPathError):
+            fridge.restore('master', ['missing'])
+
+    def test_restore_replaces_links_and_read_only_files(self, tmpdir):
+        fridge = Fridge(FridgeCore.init(str(tmpdir)))
+        tmpdir.join('file').write('old')
+        fridge.commit()
+        tmpdir.join('file').remove()
+        tmpdir.join('other').write('new')
+        os.link(str(tmpdir.join('other')), str(tmpdir.join('file')))
+        fridge.restore(None, ['file'])
+        assert tmpdir.join('file').read() == 'old'
+        assert tmpdir.join('other').read() == 'new'
+
+        tmpdir.join('file').write('changed')
+        tmpdir.join('file').chmod(stat.S_IRUSR)
+        fridge.restore(None, ['file'])
+        assert tmpdir.join('file').read() == 'old'
+
+    def test_whence(self, fridge, fridge_core, fs):
+        write_file(fs, 'mockfile', u'content')
+        fridge.commit()
+        key = fridge_core.get_head_key()
+        write_file(fs, 'other', u'other')
+        fridge.commit()
+
+        entries = fridge.whence('mockfile')
+        assert [(e.commit, e.path) for e in entries] == [
+            (key, os.path.join(os.curdir, 'mockfile'))]
+        assert fridge.whence(entries[0].checksum) == entries
+
     def test_refparse_commit(self, fridge, fridge_core, fs):
         write_file(fs, 'mockfile')
         fridge.commit()
@@ -277,6 +853,126 @@ class TestFridge(object):
         with pytest.raises(BranchExistsError):
             fridge.branch('branch')
 
+    def test_add_worktree(self, fridge, fridge_core, fs):
+        write_file(fs, 'mockfile', u'content')
+        fs.mkdir('dir')
+        write_file(fs, os.path.join('dir', 'nested'), u'nested')
+        fridge.commit()
+        fridge.branch('exp')
+
+        worktree = fridge.add_worktree('wt', 'master')
+        assert fs.get_node(['wt', 'mockfile']).content.decode() == u'content'
+        assert fs.get_node(['wt', 'dir', 'nested']).content.decode() == (
+            u'nested')
+        assert worktree.is_clean()
+        assert fridge.is_clean()
+
+        write_file(fs, os.path.join('wt', 'new'), u'new')
+        worktree.commit()
+        assert fridge_core.get_head() == Reference(Reference.BRANCH, 'exp')
+        assert not fs.exists('new')
+        assert fridge_core.resolve_branch('master') != (
+            fridge_core.resolve_branch('exp'))
+
+    def test_refuses_branch_checked_out_in_other_worktree(
+            self, fridge, fridge_core, fs):
+        write_file(fs, 'mockfile', u'content')
+        fridge.commit()
+        with pytest.raises(BranchCheckedOutError):
+            fridge.add_worktree('wt', 'master')
+
+        fridge.branch('exp')
+        worktree = fridge.add_worktree('wt', 'master')
+        with pytest.raises(BranchCheckedOutError):
+            fridge.add_worktree('wt2', 'master')
+        with pytest.raises(BranchCheckedOutError):
+            fridge.checkout('master')
+        with pytest.raises(BranchCheckedOutError):
+            worktree.checkout('exp')
+        with pytest.raises(BranchCheckedOutError):
+            Transaction(fridge_core, 'master', fs)
+        worktree.checkout('master')
+
+    def test_clone(self, fridge, fs):
+        write_file(fs, 'mockfile', u'content')
+        fridge.commit()
+        clone = Fridge.clone(os.curdir, 'clone', fs, partial=True)
+        assert fs.get_node(['clone', 'mockfile']).content.decode() == (
+            u'content')
+        assert clone.is_clean()
+
+    def test_push(self, fridge, fridge_core, fs):
+        write_file(fs, 'mockfile', u'content')
+        fridge.commit()
+        clone = Fridge.clone(os.curdir, 'clone', fs)
+        with pytest.raises(BranchCheckedOutError):
+            clone.push()
+
+        clone.branch('exp')
+        write_file(fs, os.path.join('clone', 'new'), u'new')
+        clone.commit()
+        clone.push()
+        assert fridge_core.resolve_branch('exp') == FridgeCore(
+            'clone', fs).get_head_key()
+        assert fridge_core.get_head() == Reference(Reference.BRANCH, 'master')
+
+        clone2 = Fridge.clone(os.curdir, 'clone2', fs)
+        clone2.checkout('exp')
+        write_file(fs, os.path.join('clone2', 'new2'), u'new2')
+        clone2.commit()
+        write_file(fs, os.path.join('clone', 'new3'), u'new3')
+        clone.commit()
+        clone.push()
+        with pytest.raises(NonFastForwardError):
+            clone2.push()
+
+    def test_pull(self, fridge, fridge_core, fs):
+        write_file(fs, 'mockfile', u'content')
+        fridge.commit()
+        clone = Fridge.clone(os.curdir, 'clone', fs)
+
+        write_file(fs, 'new', u'new')
+        fs.unlink('mockfile')
+        fridge.commit()
+        clone.pull()
+        assert fs.get_node(['clone', 'new']).content.decode() == u'new'
+        assert not fs.exists(os.path.join('clone', 'mockfile'))
+        assert clone.is_clean()
+
+        write_file(fs, os.path.join('clone', 'new2'), u'new2')
+        clone.commit()
+        write_file(fs, 'new3', u'new3')
+        fridge.commit()
+        with pytest.raises(NonFastForwardError):
+            clone.pull()
+
+    def test_pull_refuses_to_overwrite_local_changes(
+            self, fridge, fridge_core, fs):
+        write_file(fs, 'mockfile', u'content')
+        write_file(fs, 'other', u'other')
+        fridge.commit()
+        clone = Fridge.clone(os.curdir, 'clone', fs)
+        write_file(fs, 'mockfile', u'changed')
+        write_file(fs, 'new', u'new')
+        fridge.commit()
+
+        write_file(fs, os.path.join('clone', 'mockfile'), u'local')
+        write_file(fs, os.path.join('clone', 'new'), u'untracked')
+        with pytest.raises(LocalChangesError):
+            clone.pull()
+        assert fs.get_node(['clone', 'mockfile']).content.decode() == (
+            u'local')
+        assert fs.get_node(['clone', 'new']).content.decode() == (
+            u'untracked')
+
+        fs.unlink(os.path.join('clone', 'new'))
+        clone.checkout()
+        write_file(fs, os.path.join('clone', 'other'), u'local')
+        clone.pull()
+        assert fs.get_node(['clone', 'mockfile']).content.decode() == (
+            u'changed')
+        assert fs.get_node(['clone', 'other']).content.decode() == u'local'
+
     def test_diff(self, fridge, fs):
         write_file(fs, 'remove')
         write_file(fs, 'update', u'ver1')
@@ -0,0 +1,73 @@
+import os.path
+import threading
+
+import pytest
+
+from fridge.countingfs import CountingFS
+from fridge.fstest import write_file
+from fridge.memoryfs import MemoryFS
+
+
+@pytest.fixture
+def fs():
+    return CountingFS(MemoryFS())
+
+
+def test_counts_calls_and_paths(fs):
+    fs.mkdir('dir')
+    assert fs.exists('dir')
+    assert not fs.exists('missing')
+    assert fs.counts['mkdir'] == 1
+    assert fs.counts['exists'] == 2
+    assert fs.paths == set(['dir', 'missing'])
+
+
+def test_counts_bytes(fs):
+    write_file(fs, 'file', u'content')
+    with fs.open('file', 'rb') as f:
+        assert f.read(3) == b'con'
+        assert f.read() == b'tent'
+    fs.copy('file', 'copy')
+    assert fs.counts['open'] == 2
+    assert fs.counts['open_w'] == 1
+    assert fs.counts['open_r'] == 1
+    assert fs.counts['bytes_written'] == 7
+    assert fs.counts['bytes_read'] == 7
+    assert fs.counts['bytes_copied'] == 7
+    assert fs.counts['stat'] == 0
+
+
+def test_counts_sequential_reads(fs):
+    write_file(fs, 'file', u'content')
+    with fs.open_sequential('file') as f:
+        assert f.read() == b'content'
+    assert fs.counts['open_sequential'] == 1
+    assert fs.counts['open_r'] == 1
+    assert fs.counts['bytes_read'] == 7
+
+
+def test_counts_walked_directories(fs):
+    fs.makedirs(os.path.join('a', 'b'))
+    assert len(list(fs.walk(os.curdir))) == 3
+    assert fs.counts['walk'] == 1
+    assert fs.counts['walk_dirs'] == 3
+
+
+def test_counts_concurrent_calls(fs):
+    def call_exists():
+        for _ in range(1000):
+            fs.exists('missing')
+
+    threads = [threading.Thread(target=call_exists) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fs.counts['exists'] == 8000
+
+
+def test_reset(fs):
+    fs.mkdir('dir')
+    fs.reset()
+    assert fs.counts['mkdir'] == 0
+    assert fs.paths == set()
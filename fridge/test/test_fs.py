@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+import fridge.fs
+
+
+def test_open_sequential_reads_file(tmpdir):
+    path = tmpdir.join('file')
+    path.write_binary(b'content')
+    with fridge.fs.open_sequential(str(path)) as f:
+        assert f.read(3) == b'con'
+        assert f.read() == b'tent'
+        assert f.read() == b''
+    assert f.closed
+
+
+@pytest.mark.skipif(
+    not hasattr(os, 'O_NOATIME'), reason="Requires O_NOATIME.")
+def test_open_sequential_keeps_access_time(tmpdir):
+    path = tmpdir.join('file')
+    path.write_binary(b'content')
+    # An access time before the modification time would be updated even on
+    # file systems mounted with relatime.
+    os.utime(str(path), (1000., 2000.))
+    with fridge.fs.open_sequential(str(path)) as f:
+        f.read()
+    assert os.stat(str(path)).st_atime == 1000.
+
+
+def test_readahead_ignores_errors(tmpdir):
+    path = tmpdir.join('file')
+    path.write_binary(b'content')
+    fridge.fs.readahead(str(path))
+    fridge.fs.readahead(str(tmpdir.join('missing')))
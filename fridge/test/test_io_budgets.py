@@ -0,0 +1,91 @@
+"""I/O budgets of hot paths.
+
+The budgets must not depend on the number of files in the repository if
+only a constant number of files is affected by an operation. Operations are
+measured with a fresh core, so no snapshots are cached from preparing the
+repository.
+"""
+
+import os.path
+
+import pytest
+
+from fridge.core import Fridge, FridgeCore
+from fridge.countingfs import CountingFS
+from fridge.fstest import write_file
+from fridge.memoryfs import MemoryFS
+
+
+NUM_FILES = 200
+
+
+@pytest.fixture
+def fs():
+    return CountingFS(MemoryFS())
+
+
+@pytest.fixture
+def fridge_core(fs):
+    return FridgeCore.init(os.curdir, fs)
+
+
+@pytest.fixture
+def fridge(fs, fridge_core):
+    fridge = Fridge(fridge_core, fs)
+    fs.mkdir('data')
+    for i in range(NUM_FILES):
+        write_file(fs, os.path.join('data', str(i)), u'content {}'.format(i))
+    fridge.commit()
+    return fridge
+
+
+def fresh_fridge(fs):
+    fridge = Fridge(FridgeCore(os.curdir, fs), fs)
+    fs.reset()
+    return fridge
+
+
+def snapshot_size(core):
+    return len(core.serialize_snapshot(core.read_snapshot(
+        core.read_commit(core.get_head_key()).snapshot)))
+
+
+def test_commit_of_one_changed_file(fs, fridge, fridge_core):
+    write_file(fs, os.path.join('data', '0'), u'changed')
+    fresh_fridge(fs).commit()
+    counts = fs.counts.copy()
+    size = snapshot_size(fridge_core)
+
+    # Only the changed file is hashed and stored, plus a constant number of
+    # metadata files (snapshots, commits, head and branch, whence index).
+    assert counts['rename'] == 3
+    # The changed file is stored without a checkout afterwards.
+    assert counts['copy'] == 0
+    assert counts['bytes_written'] < size + 1000
+    assert counts['open_w'] <= 6
+    assert counts['open'] <= 20
+    # The head snapshot is read once, the new snapshot hashed once when it is
+    # stored and the changed file hashed once.
+    assert counts['bytes_read'] < 2 * size + 1000
+    # Detecting changes requires a stat of each file.
+    assert counts['stat'] <= 2 * NUM_FILES + 20
+
+
+def test_checkout_reads_only_differing_blobs(fs, fridge):
+    fridge.branch('other')
+    for i in range(3):
+        write_file(fs, os.path.join('data', str(i)), u'changed')
+    fridge.commit()
+
+    fresh_fridge(fs).checkout('master')
+    assert fs.counts['copy'] == 3
+    assert fs.counts['unlink'] == 3
+    assert fs.counts['bytes_copied'] == sum(
+        len(u'content {}'.format(i)) for i in range(3))
+
+
+def test_checkout_of_head_touches_no_files(fs, fridge):
+    fresh_fridge(fs).checkout()
+    assert fs.counts['copy'] == 0
+    assert fs.counts['unlink'] == 0
+    assert fs.counts['open_w'] == 0
@@ -0,0 +1,167 @@
+import os
+import os.path
+import threading
+
+import pytest
+
+from fridge.iosched import DevicePolicy, IOScheduler, is_rotational
+from fridge.memoryfs import MemoryFS
+
+
+HDD = os.makedev(8, 0)
+HDD_PARTITION = os.makedev(8, 1)
+SSD = os.makedev(259, 0)
+
+
+@pytest.fixture
+def sys_root(tmpdir):
+    for name, rotational in [('sda', '1'), ('nvme0n1', '0')]:
+        tmpdir.join('devices', name, 'queue', 'rotational').write(
+            rotational, ensure=True)
+    tmpdir.join('devices', 'sda', 'sda1').ensure(dir=True)
+    block = tmpdir.join('dev', 'block').ensure(dir=True)
+    for device, target in [(HDD, 'sda'), (HDD_PARTITION, 'sda/sda1'),
+                           (SSD, 'nvme0n1')]:
+        name = '{}:{}'.format(os.major(device), os.minor(device))
+        block.join(name).mksymlinkto(
+            os.path.join(os.pardir, os.pardir, 'devices', target))
+    return str(tmpdir)
+
+
+class StubStat(object):
+    def __init__(self, st_dev, st_ino=0):
+        self.st_dev = st_dev
+        self.st_ino = st_ino
+
+
+class StubFS(object):
+    """Files named ``<dir>/<inode>`` with ``hdd`` and ``ssd`` as dirs."""
+    def stat(self, path):
+        dirname, name = os.path.split(path)
+        device = HDD if os.path.basename(dirname or path) == 'hdd' else SSD
+        return StubStat(device, int(name) if name.isdigit() else 0)
+
+
+def test_is_rotational(sys_root):
+    assert is_rotational(HDD, sys_root)
+    assert is_rotational(HDD_PARTITION, sys_root)
+    assert not is_rotational(SSD, sys_root)
+    assert is_rotational(os.makedev(0, 42), sys_root) is None
+
+
+def test_policies_by_device(sys_root):
+    rotational = DevicePolicy(1, sort_by_inode=True)
+    solid_state = DevicePolicy(8)
+    unknown = DevicePolicy(2)
+    scheduler = IOScheduler(
+        StubFS(), rotational, solid_state, unknown, sys_root)
+    assert scheduler.policy(HDD) is rotational
+    assert scheduler.policy(SSD) is solid_state
+    assert scheduler.policy(os.makedev(0, 42)) is unknown
+    assert scheduler.policy(None) is unknown
+
+
+def test_map_returns_results_in_order(sys_root):
+    scheduler = IOScheduler(StubFS(), sys_root=sys_root)
+    paths = ['ssd/1', 'hdd/3', 'ssd/2', 'hdd/1']
+    assert scheduler.map(lambda p: p.upper(), paths) == [
+        p.upper() for p in paths]
+
+
+def test_rotational_devices_run_sequentially_by_inode(sys_root):
+    scheduler = IOScheduler(StubFS(), sys_root=sys_root)
+    order = []
+    active = []
+    lock = threading.Lock()
+
+    def access(path):
+        with lock:
+            active.append(path)
+            assert len(active) == 1
+        order.append(path)
+        with lock:
+            active.remove(path)
+
+    scheduler.map(access, ['hdd/5', 'hdd/2', 'hdd/9', 'hdd/1'])
+    assert order == ['hdd/1', 'hdd/2', 'hdd/5', 'hdd/9']
+
+
+def test_reads_ahead_queued_files_on_rotational_devices(sys_root):
+    class ReadaheadFS(StubFS):
+        def __init__(self):
+            self.readahead_paths = []
+
+        def readahead(self, path):
+            self.readahead_paths.append(path)
+
+    fs = ReadaheadFS()
+    IOScheduler(fs, sys_root=sys_root).map(
+        lambda p: None, ['hdd/2', 'ssd/1', 'hdd/1'])
+    assert fs.readahead_paths == ['hdd/1', 'hdd/2']
+
+
+def test_map_propagates_errors(sys_root):
+    def fail(path):
+        if path == 'hdd/2':
+            raise ValueError(path)
+
+    scheduler = IOScheduler(StubFS(), sys_root=sys_root)
+    with pytest.raises(ValueError):
+        scheduler.map(fail, ['ssd/1', 'hdd/2', 'ssd/3'])
+
+
+def test_file_systems_without_devices_use_unknown_policy():
+    scheduler = IOScheduler(MemoryFS())
+    assert scheduler.device_of('file') is None
+    assert scheduler.map(len, ['a', 'bb']) == [1, 2]
+
+
+def test_imap_returns_all_results(sys_root):
+    scheduler = IOScheduler(StubFS(), sys_root=sys_root)
+    paths = ['ssd/1', 'hdd/3', 'ssd/2', 'hdd/1']
+    assert sorted(scheduler.imap(lambda p: p.upper(), iter(paths))) == sorted(
+        p.upper() for p in paths)
+
+
+def test_imap_applies_backpressure_to_tasks(sys_root):
+    policy = DevicePolicy(1, depth=2)
+    scheduler = IOScheduler(StubFS(), policy, policy, sys_root=sys_root)
+    produced = []
+    release = threading.Event()
+
+    def tasks():
+        for i in range(100):
+            produced.append(i)
+            yield 'ssd/{}'.format(i)
+
+    def access(path):
+        release.wait()
+        return path
+
+    results = scheduler.imap(access, tasks())
+    thread = threading.Thread(target=lambda: results.send(None))
+    thread.start()
+    thread.join(0.5)
+    # The worker, its input queue and the pipeline queues hold few tasks.
+    assert len(produced) < 20
+    release.set()
+    thread.join()
+    assert len(list(results)) == 99
+    assert len(produced) == 100
+
+
+def test_imap_propagates_errors(sys_root):
+    def fail(path):
+        if path == 'hdd/2':
+            raise ValueError(path)
+
+    scheduler = IOScheduler(StubFS(), sys_root=sys_root)
+    with pytest.raises(ValueError):
+        list(scheduler.imap(fail, iter(['ssd/1', 'hdd/2', 'ssd/3'])))
+
+    def failing_tasks():
+        yield 'ssd/1'
+        raise KeyError()
+
+    with pytest.raises(KeyError):
+        list(scheduler.imap(lambda p: p, failing_tasks()))
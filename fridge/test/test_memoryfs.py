@@ -118,6 +118,13 @@ class TestMemoryFS(object):
         t2 = fs.stat('file').st_mtime
         assert t1 < t2
 
+    def test_reading_keeps_modification_date(self, fs):
+        write_file(fs, 'file')
+        t = fs.stat('file').st_mtime
+        with fs.open('file', 'r') as f:
+            f.read()
+        assert fs.stat('file').st_mtime == t
+
     def test_chmod(self, fs):
         fs.mkdir('dir')
         s = stat.S_IRWXU
@@ -160,6 +167,11 @@ class TestMemoryFS(object):
         assert 'test' in fs.children
         assert 'subdir' in fs.children['test'].children
 
+    def test_mkdir_sets_parent(self, fs):
+        fs.mkdir('test')
+        fs.mkdir('test/subdir')
+        assert fs.get_node(['test', 'subdir', os.pardir]) is fs.children['test']
+
     def test_mkdir_raises_exception_if_dir_exists(self, fs):
         fs.mkdir('dir')
         with pytest.raises(OSError) as excinfo:
@@ -199,6 +211,14 @@ class TestMemoryFS(object):
         assert excinfo.value.errno == errno.EEXIST
         assert excinfo.value.filename == 'dest'
 
+    def test_replace(self, fs):
+        write_file(fs, 'src', u'new')
+        write_file(fs, 'dest', u'old')
+        instance = fs.children['src']
+        fs.replace('src', 'dest')
+        assert 'src' not in fs.children
+        assert fs.children['dest'] is instance
+
     def test_symlink(self, fs):
         fs.mkdir('sub1')
         fs.mkdir('sub2')
@@ -224,6 +244,14 @@ class TestMemoryFS(object):
         assert excinfo.value.errno == errno.EEXIST
         assert excinfo.value.filename == dest
 
+    def test_link(self, fs):
+        write_file(fs, 'src', u'dummy')
+        fs.link('src', 'dest')
+        assert fs.samefile('src', 'dest')
+        with pytest.raises(OSError) as excinfo:
+            fs.link('src', 'dest')
+        assert excinfo.value.errno == errno.EEXIST
+
     @pytest.mark.parametrize('mode', ['w', 'w+', 'a', 'a+'])
     def test_allows_writing_of_files(self, mode, fs):
         with fs.open('filename', mode) as f:
@@ -0,0 +1,110 @@
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import pytest
+
+from fridge.pipeline import (
+    Pipeline, Stage, Stopped, get_until_stopped, put_until_stopped)
+from fridge import trace
+
+
+def test_passes_items_through_stages():
+    pipeline = Pipeline([
+        Stage('double', lambda x: 2 * x), Stage('inc', lambda x: x + 1)])
+    assert list(pipeline.run(range(5))) == [1, 3, 5, 7, 9]
+
+
+def test_multiple_workers_process_all_items():
+    pipeline = Pipeline([
+        Stage('double', lambda x: 2 * x, workers=4),
+        Stage('inc', lambda x: x + 1, workers=3)], depth=2)
+    assert sorted(pipeline.run(range(100))) == [
+        2 * x + 1 for x in range(100)]
+    assert [s.items for s in pipeline.stats] == [100, 100, 100]
+
+
+def test_bounded_queues_limit_items_in_flight():
+    produced = []
+
+    def source():
+        for i in range(20):
+            produced.append(i)
+            yield i
+
+    pipeline = Pipeline([Stage('slow', lambda x: x, depth=1)], depth=1)
+    results = pipeline.run(source())
+    assert next(results) == 0
+    time.sleep(0.05)
+    # One item in each queue, one in the stage and the consumed one.
+    assert len(produced) <= 5
+    assert list(results) == list(range(1, 20))
+    assert pipeline.stats[0].blocked > 0.
+
+
+def test_collects_stats():
+    pipeline = Pipeline([Stage('sleep', lambda x: time.sleep(0.01))])
+    list(pipeline.run(range(3), 'numbers'))
+    source, stage = pipeline.stats
+    assert source.name == 'numbers'
+    assert stage.name == 'sleep'
+    assert stage.items == 3
+    assert stage.busy >= 0.03
+    assert stage.throughput(1.) == 3.
+
+
+def test_propagates_errors():
+    def fail(x):
+        if x == 3:
+            raise ValueError(x)
+        return x
+
+    num_threads = threading.active_count()
+    pipeline = Pipeline([Stage('fail', fail, workers=2)], depth=1)
+    with pytest.raises(ValueError):
+        list(pipeline.run(range(100)))
+    assert threading.active_count() == num_threads
+
+
+def test_stops_when_consumer_stops():
+    num_threads = threading.active_count()
+    pipeline = Pipeline([Stage('identity', lambda x: x)], depth=1)
+    results = pipeline.run(range(1000))
+    next(results)
+    results.close()
+    assert threading.active_count() == num_threads
+
+
+def test_nests_spans_of_workers():
+    sink = trace.MemorySink()
+    trace.set_sink(sink)
+    try:
+        def traced(x):
+            with trace.span('work'):
+                return x
+
+        with trace.span('outer') as outer:
+            list(Pipeline([Stage('traced', traced, 2)]).run(range(3)))
+    finally:
+        trace.set_sink(None)
+    work = [r for r in sink.records if r['name'] == 'work']
+    assert len(work) == 3
+    assert all(r['parent'] == outer.id for r in work)
+
+
+def test_queue_helpers_stop_waiting():
+    stop = threading.Event()
+    full = queue.Queue(1)
+    assert put_until_stopped(full, 1, stop) >= 0.
+    assert get_until_stopped(full, stop) == 1
+    put_until_stopped(full, 2, stop)
+    stop.set()
+    with pytest.raises(Stopped):
+        put_until_stopped(full, 3, stop)
+    assert get_until_stopped(full, stop) == 2
+    with pytest.raises(Stopped):
+        get_until_stopped(full, stop)
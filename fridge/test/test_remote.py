@@ -0,0 +1,102 @@
+import os.path
+
+import pytest
+
+from fridge.core import Fridge, FridgeCore
+from fridge.fstest import write_file
+from fridge.memoryfs import MemoryFS
+from fridge.remote import (
+    copy_missing_objects, find_missing_objects, is_ancestor)
+
+
+@pytest.fixture
+def fs():
+    return MemoryFS()
+
+
+@pytest.fixture
+def source(fs):
+    fs.mkdir('source')
+    return Fridge(FridgeCore.init('source', fs), fs)
+
+
+@pytest.fixture
+def target(fs):
+    fs.mkdir('target')
+    return FridgeCore.init('target', fs)
+
+
+def commit_file(fs, fridge, name, content):
+    write_file(fs, os.path.join('source', name), content)
+    fridge.commit()
+
+
+def test_find_missing_objects_without_shared_history(fs, source, target):
+    commit_file(fs, source, 'file1', u'content1')
+    commit_file(fs, source, 'file2', u'content2')
+    core = FridgeCore('source', fs)
+
+    missing = find_missing_objects(
+        core, core.get_head_key(), target.commits.contains)
+    assert missing.boundary is None
+    assert missing.commits == [key for key, _ in source.log()]
+    assert len(missing.snapshots) == 2
+    assert len(missing.blobs) == 2
+
+
+def test_find_missing_objects_stops_at_shared_history(fs, source, target):
+    core = FridgeCore('source', fs)
+    commit_file(fs, source, 'file1', u'content1')
+    shared = core.get_head_key()
+    copy_missing_objects(
+        core, target,
+        find_missing_objects(core, shared, target.commits.contains))
+    commit_file(fs, source, 'file2', u'content2')
+
+    missing = find_missing_objects(
+        core, core.get_head_key(), target.commits.contains)
+    assert missing.boundary == shared
+    assert missing.commits == [core.get_head_key()]
+    assert len(missing.blobs) == 1
+
+
+def test_copy_missing_objects(fs, source, target):
+    commit_file(fs, source, 'file1', u'content1')
+    commit_file(fs, source, 'file2', u'content2')
+    core = FridgeCore('source', fs)
+    missing = find_missing_objects(
+        core, core.get_head_key(), target.commits.contains)
+
+    progress = []
+    copy_missing_objects(
+        core, target, missing, jobs=2,
+        progress=lambda done, total: progress.append((done, total)))
+    assert progress == [(i + 1, 6) for i in range(6)]
+    assert all(target.commits.contains(k) for k in missing.commits)
+    assert all(target.snapshots.contains(k) for k in missing.snapshots)
+    assert all(target.blobs.contains(k) for k in missing.blobs)
+    assert target.read_commit(missing.commits[0]) == core.read_commit(
+        missing.commits[0])
+
+
+def test_copy_missing_objects_resumes(fs, source, target):
+    commit_file(fs, source, 'file1', u'content1')
+    core = FridgeCore('source', fs)
+    missing = find_missing_objects(
+        core, core.get_head_key(), target.commits.contains)
+    target.copy_objects(core.blobs, target.blobs, missing.blobs)
+    copied = []
+    target.copy_objects = lambda s, t, keys: copied.extend(
+        k for k in keys if not t.contains(k))
+    copy_missing_objects(core, target, missing)
+    assert copied == missing.snapshots + missing.commits
+
+
+def test_is_ancestor(fs, source):
+    commit_file(fs, source, 'file1', u'content1')
+    commit_file(fs, source, 'file2', u'content2')
+    core = FridgeCore('source', fs)
+    (head, _), (parent, _) = source.log()
+    assert is_ancestor(core, parent, head)
+    assert is_ancestor(core, head, head)
+    assert not is_ancestor(core, head, parent)
@@ -0,0 +1,78 @@
+import errno
+import os.path
+import stat
+
+import pytest
+
+from fridge.core import Fridge, FridgeCore
+from fridge.fstest import write_file
+from fridge.memoryfs import MemoryFS
+from fridge.snapshotfs import SnapshotFS
+
+
+@pytest.fixture
+def fs():
+    return MemoryFS()
+
+
+@pytest.fixture
+def fridge_core(fs):
+    return FridgeCore.init(os.curdir, fs)
+
+
+@pytest.fixture
+def snapshot_fs(fs, fridge_core):
+    fridge = Fridge(fridge_core, fs)
+    fs.makedirs(os.path.join('a', 'b'))
+    write_file(fs, os.path.join('a', 'b', 'file1'), u'content1')
+    write_file(fs, 'file2', u'old')
+    fridge.commit()
+    key = fridge_core.get_head_key()
+    write_file(fs, 'file2', u'new')
+    fridge.commit()
+    return SnapshotFS(fridge_core, key, fs)
+
+
+def test_open_reads_historical_content(fs, snapshot_fs):
+    with snapshot_fs.open('file2') as f:
+        assert f.read() == u'old'
+    with snapshot_fs.open(os.path.join('.', 'a', 'b', 'file1'), 'rb') as f:
+        assert f.read() == b'content1'
+    with fs.open('file2') as f:
+        assert f.read() == u'new'
+
+
+@pytest.mark.parametrize('path,mode,err', [
+    ('file2', 'w', errno.EROFS),
+    ('file2', 'r+', errno.EROFS),
+    ('a', 'r', errno.EISDIR),
+    ('missing', 'r', errno.ENOENT)])
+def test_open_errors(snapshot_fs, path, mode, err):
+    with pytest.raises(OSError) as excinfo:
+        snapshot_fs.open(path, mode)
+    assert excinfo.value.errno == err
+
+
+def test_exists(snapshot_fs):
+    assert snapshot_fs.exists(os.curdir)
+    assert snapshot_fs.exists('a')
+    assert snapshot_fs.exists(os.path.join('a', 'b', 'file1'))
+    assert not snapshot_fs.exists('file1')
+
+
+def test_stat(fs, snapshot_fs):
+    assert snapshot_fs.stat('file2').st_size == 3
+    assert stat.S_ISREG(snapshot_fs.stat('file2').st_mode)
+    assert stat.S_ISDIR(snapshot_fs.stat('a').st_mode)
+    with pytest.raises(OSError):
+        snapshot_fs.stat('missing')
+
+
+def test_walk(snapshot_fs):
+    join = os.path.join
+    assert list(snapshot_fs.walk()) == [
+        (os.curdir, ['a'], ['file2']),
+        (join(os.curdir, 'a'), ['b'], []),
+        (join(os.curdir, 'a', 'b'), [], ['file1'])]
+    assert list(snapshot_fs.walk('a', topdown=False)) == [
+        (join('a', 'b'), [], ['file1']), ('a', ['b'], [])]
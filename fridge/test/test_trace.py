@@ -0,0 +1,101 @@
+from io import StringIO
+import json
+import os.path
+
+import pytest
+
+from fridge.core import Fridge, FridgeCore
+from fridge.fstest import write_file
+from fridge.memoryfs import MemoryFS
+from fridge import trace
+
+
+@pytest.fixture
+def sink():
+    sink = trace.MemorySink()
+    trace.set_sink(sink)
+    yield sink
+    trace.set_sink(None)
+
+
+def test_spans_are_nested(sink):
+    with trace.span('outer', files=1) as outer:
+        with trace.span('inner') as inner:
+            inner.add('bytes', 3)
+            inner.add('bytes', 4)
+        outer.add('files')
+
+    inner_record, outer_record = sink.records
+    assert inner_record['name'] == 'inner'
+    assert inner_record['bytes'] == 7
+    assert inner_record['parent'] == outer_record['id']
+    assert outer_record['parent'] is None
+    assert outer_record['files'] == 2
+    assert outer_record['duration'] >= inner_record['duration'] >= 0.
+
+
+def test_records_errors(sink):
+    with pytest.raises(ValueError):
+        with trace.span('failing'):
+            raise ValueError()
+    assert sink.records[0]['error'] == 'ValueError'
+
+
+def test_traced(sink):
+    @trace.traced('func')
+    def func(x):
+        return 2 * x
+
+    assert func(2) == 4
+    assert [r['name'] for r in sink.records] == ['func']
+
+
+def test_disabled_tracing_uses_null_span():
+    assert trace.get_sink() is None
+    with trace.span('ignored') as span:
+        span.add('files')
+    assert trace.span('other') is span
+
+
+def test_json_lines_sink():
+    out = StringIO()
+    trace.set_sink(trace.JsonLinesSink(out))
+    try:
+        with trace.span('span', files=1):
+            pass
+    finally:
+        trace.set_sink(None)
+    record = json.loads(out.getvalue().splitlines()[0])
+    assert record['name'] == 'span'
+    assert record['files'] == 1
+
+
+def test_traces_commit_phases(sink):
+    fs = MemoryFS()
+    fridge = Fridge(FridgeCore.init(os.curdir, fs), fs)
+    write_file(fs, 'file', u'content')
+    fridge.commit()
+
+    by_id = dict((r['id'], r) for r in sink.records)
+    commit = [r for r in sink.records if r['name'] == 'commit'][0]
+    children = [r['name'] for r in sink.records
+                if r['parent'] == commit['id']]
+    assert children == [
+        'commit.store', 'core.add_snapshot', 'core.lock', 'core.add_commit']
+    store = [r for r in sink.records if r['name'] == 'commit.store'][0]
+    assert store['files'] == 1
+    assert store['bytes'] == len(u'content')
+    dispatch = [r for r in sink.records if r['name'] == 'iosched.dispatch'][0]
+    assert dispatch['parent'] == store['id']
+    assert dispatch['scan.items'] == 1
+    device = [r for r in sink.records if r['name'] == 'iosched.device'][0]
+    assert device['parent'] == store['id']
+    assert device['store.items'] == 1
+    hashing = [r for r in sink.records if r['name'] == 'cas.write'][0]
+    assert hashing['parent'] == device['id']
+    ancestors = []
+    record = hashing
+    while record['parent'] is not None:
+        record = by_id[record['parent']]
+        ancestors.append(record['name'])
+    assert ancestors == ['iosched.device', 'commit.store', 'commit']
@@ -0,0 +1,74 @@
+import os.path
+import stat
+
+import pytest
+
+from fridge.core import Fridge, FridgeCore
+from fridge.fstest import write_file
+from fridge.memoryfs import MemoryFS
+from fridge.verify import Problem, verify
+
+
+@pytest.fixture
+def fs():
+    return MemoryFS()
+
+
+@pytest.fixture
+def fridge_core(fs):
+    return FridgeCore.init(os.curdir, fs)
+
+
+@pytest.fixture
+def fridge(fridge_core, fs):
+    fridge = Fridge(fridge_core, fs)
+    write_file(fs, 'file1', u'content1')
+    write_file(fs, 'file2', u'content2')
+    fridge.commit()
+    write_file(fs, 'file2', u'changed')
+    fridge.commit()
+    return fridge
+
+
+def head_snapshot(core):
+    return core.read_commit(core.get_head_key()).snapshot
+
+
+def test_consistent_repository(fridge, fridge_core):
+    assert verify(fridge_core) == []
+
+
+def test_detects_corrupt_blob(fridge, fridge_core, fs):
+    key = fridge_core.checksum('file1')
+    path = fridge_core.blobs.get_path(key)
+    fs.chmod(path, stat.S_IRUSR | stat.S_IWUSR)
+    write_file(fs, path, u'corrupt')
+    assert verify(fridge_core) == [
+        Problem('blob', key, u'content does not match')]
+    assert verify(fridge_core, blobs=False) == []
+
+
+def test_detects_missing_objects(fridge, fridge_core, fs):
+    head = fridge_core.get_head_key()
+    parent = fridge_core.read_commit(head).parent
+    snapshot = head_snapshot(fridge_core)
+    fs.unlink(fridge_core.snapshots.get_path(snapshot))
+    fs.unlink(fridge_core.commits.get_path(parent))
+    fridge_core.set_branch('dangling', parent)
+
+    problems = verify(fridge_core)
+    assert Problem('commit', head, u'missing parent ' + parent) in problems
+    assert Problem(
+        'commit', head, u'missing snapshot ' + snapshot) in problems
+    assert Problem(
+        'branch', 'dangling', u'missing commit ' + parent) in problems
+    assert len(problems) == 3
+
+
+def test_detects_missing_blobs(fridge, fridge_core, fs):
+    key = fridge_core.checksum('file1')
+    fs.unlink(fridge_core.blobs.get_path(key))
+    problems = verify(fridge_core)
+    assert len(problems) == 2
+    assert all(p.message == u'missing blob ' + key for p in problems)
+    assert str(problems[0]).startswith('snapshot ')
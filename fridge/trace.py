@@ -0,0 +1,245 @@
+"""Provides tracing of nested spans to find out where time is spent.
+
+Spans measure the duration of an operation and can count quantities like
+bytes or files. A span started while another span is active in the same
+thread becomes its child. Finished spans are passed as records to the
+active sink::
+
+    sink = MemorySink()
+    set_sink(sink)
+    with span('work') as s:
+        s.add('files')
+
+Tracing is disabled while no sink is set. Then :func:`span` returns a shared
+span doing nothing, so instrumented code has negligible overhead.
+"""
+
+from __future__ import absolute_import
+
+import contextlib
+import functools
+import itertools
+import json
+import threading
+import time
+
+
+_sink = None
+_ids = itertools.count(1)
+_local = threading.local()
+
+
+def set_sink(sink):
+    """Sets the sink receiving the records of finished spans.
+
+    Parameters
+    ----------
+    sink : obj or None
+        Object with an ``emit(record)`` method or ``None`` to disable
+        tracing.
+    """
+    global _sink  # pylint: disable=global-statement
+    _sink = sink
+
+
+def get_sink():
+    """Returns the active sink.
+
+    Returns
+    -------
+    obj or None
+        The sink set with :func:`set_sink`.
+    """
+    return _sink
+
+
+def span(name, **counters):
+    """Creates a span to be used as context manager.
+
+    Parameters
+    ----------
+    name : str
+        Name of the traced operation.
+    counters
+        Initial values of counters of the span.
+
+    Returns
+    -------
+    :class:`Span`
+        The span or a span doing nothing if tracing is disabled.
+    """
+    if _sink is None:
+        return _NULL_SPAN
+    return Span(_sink, name, counters)
+
+
+def traced(name):
+    """Decorates a function to trace each call in a span.
+
+    Parameters
+    ----------
+    name : str
+        Name of the span.
+
+    Returns
+    -------
+    callable
+        The decorator.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _sink is None:
+                return func(*args, **kwargs)
+            with Span(_sink, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current():
+    """Returns the innermost active span of the calling thread.
+
+    Returns
+    -------
+    :class:`Span` or None
+        The span or ``None`` if no span is active.
+    """
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+@contextlib.contextmanager
+def attach(parent):
+    """Makes spans started in the calling thread children of a span.
+
+    Worker threads use this to nest their spans in the span of the thread
+    that started them.
+
+    Parameters
+    ----------
+    parent : :class:`Span` or None
+        Span to attach to, usually obtained with :func:`current` in another
+        thread. Nothing is attached if it is ``None``.
+    """
+    if parent is None:
+        yield
+        return
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(parent)
+    try:
+        yield
+    finally:
+        stack.remove(parent)
+
+
+class Span(object):
+    """Traced operation.
+
+    The record emitted when the span finishes contains the `name`, an
+    `id`, the `parent` id (or ``None``), the `start` time and the `duration`
+    in seconds together with the counters.
+
+    Parameters
+    ----------
+    sink : obj
+        Sink to emit the record to.
+    name : str
+        Name of the traced operation.
+    counters : dict
+        Initial values of counters.
+    """
+    def __init__(self, sink, name, counters):
+        self._sink = sink
+        self.name = name
+        self.counters = counters
+        self.id = next(_ids)
+        self.parent = None
+        self._start = None
+
+    def add(self, counter, value=1):
+        """Increases a counter of the span.
+
+        Parameters
+        ----------
+        counter : str
+            Name of the counter.
+        value : int, optional
+            Value to add.
+        """
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        if len(stack) > 0:
+            self.parent = stack[-1].id
+        stack.append(self)
+        self._start = time.time()
+        return self
+
+    def __exit__(self, err_type, value, traceback):
+        duration = time.time() - self._start
+        _local.stack.pop()
+        record = dict(self.counters)
+        record.update(
+            name=self.name, id=self.id, parent=self.parent,
+            start=self._start, duration=duration)
+        if err_type is not None:
+            record['error'] = err_type.__name__
+        self._sink.emit(record)
+        return False
+
+
+class _NullSpan(object):
+    def add(self, counter, value=1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, err_type, value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class MemorySink(object):
+    """Sink collecting the records in memory.
+
+    Attributes
+    ----------
+    records : list
+        Records of the finished spans in order of completion.
+    """
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        """Stores a record."""
+        with self._lock:
+            self.records.append(record)
+
+
+class JsonLinesSink(object):
+    """Sink writing each record as a line of JSON.
+
+    Parameters
+    ----------
+    fileobj : :term:`file object`
+        Text stream to write the records to.
+    """
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        """Writes a record."""
+        line = json.dumps(record, sort_keys=True) + u'\n'
+        with self._lock:
+            self._fileobj.write(line)
@@ -0,0 +1,84 @@
+"""Provides the verification of the consistency of a repository."""
+
+from fridge.core import DataObject, Serializable
+
+
+class Problem(DataObject):
+    """Inconsistency found in a repository.
+
+    Attributes
+    ----------
+    kind : str
+        Kind of the affected object (``'blob'``, ``'snapshot'``,
+        ``'commit'`` or ``'branch'``).
+    key : str
+        Key of the affected object or name of the branch.
+    message : str
+        Description of the problem.
+    """
+    __slots__ = ['kind', 'key', 'message']
+
+    def __str__(self):
+        # pylint: disable=no-member
+        return u'{kind} {key}: {message}'.format(
+            kind=self.kind, key=self.key, message=self.message)
+
+
+def verify(core, blobs=True):
+    """Checks the integrity of the objects and the references between them.
+
+    Parameters
+    ----------
+    core : :class:`fridge.core.FridgeCore`
+        Repository to verify.
+    blobs : bool, optional
+        Whether to verify the content of the blobs. This requires reading
+        all stored data.
+
+    Returns
+    -------
+    list
+        The found :class:`Problem` instances. An empty list means the
+        repository is consistent.
+    """
+    problems = []
+    storages = [('commit', core.commits), ('snapshot', core.snapshots)]
+    if blobs:
+        storages.append(('blob', core.blobs))
+    for kind, storage in storages:
+        for key in storage.keys():
+            if storage.checksum(storage.get_path(key)) != key:
+                problems.append(Problem(kind, key, u'content does not match'))
+
+    for name in core.list_branches():
+        key = core.resolve_branch(name)
+        if not core.is_commit(key):
+            problems.append(Problem(
+                'branch', name, u'missing commit {}'.format(key)))
+
+    snapshots = set()
+    for key in core.commits.keys():
+        try:
+            commit = core.read_commit(key)
+        except (Serializable.DeserializationError, ValueError):
+            problems.append(Problem('commit', key, u'cannot be parsed'))
+            continue
+        if commit.parent and not core.is_commit(commit.parent):
+            problems.append(Problem(
+                'commit', key, u'missing parent {}'.format(commit.parent)))
+        if not core.snapshots.contains(commit.snapshot):
+            problems.append(Problem(
+                'commit', key, u'missing snapshot {}'.format(commit.snapshot)))
+        snapshots.add(commit.snapshot)
+
+    # Partial repositories fetch blobs on demand.
+    if not core.is_partial():
+        for key in sorted(snapshots):
+            if not core.snapshots.contains(key):
+                continue
+            missing = set(item.checksum for item in core.read_snapshot(key)
+                          if not core.blobs.contains(item.checksum))
+            for checksum in sorted(missing):
+                problems.append(Problem(
+                    'snapshot', key, u'missing blob {}'.format(checksum)))
+    return problems
@@ -0,0 +1,77 @@
+import json
+import os.path
+import subprocess
+import sys
+
+
+BENCHMARKS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'benchmarks')
+
+
+def run_benchmark(script, *args):
+    return subprocess.call(
+        [sys.executable, os.path.join(BENCHMARKS, script)] + list(args),
+        cwd=BENCHMARKS)
+
+
+def test_e2e_benchmarks_store_results(tmpdir):
+    history = str(tmpdir.join('history.jsonl'))
+    assert run_benchmark(
+        'e2e.py', '--scale', 'tiny', '--history', history) == 0
+    with open(history) as f:
+        results = [json.loads(line) for line in f]
+    assert len(results) == 14
+    assert all(r['seconds'] >= 0. for r in results)
+    assert 'e2e.recommit-1%[real,tiny]' in [r['benchmark'] for r in results]
+
+
+def test_micro_benchmarks_store_results(tmpdir):
+    history = str(tmpdir.join('history.jsonl'))
+    assert run_benchmark(
+        'micro.py', '--items', '10', '--repeat', '1', '--history',
+        history, 'commit.parse', 'time.utc_time') == 0
+    with open(history) as f:
+        results = [json.loads(line) for line in f]
+    assert [r['benchmark'] for r in results] == [
+        'micro.commit.parse[10]', 'micro.time.utc_time[10]']
+
+
+def test_compare_flags_regressions(tmpdir):
+    history = tmpdir.join('history.jsonl')
+    history.write(''.join(json.dumps(r) + '\n' for r in [
+        {'revision': 'aaa', 'benchmark': 'b1', 'seconds': 1.},
+        {'revision': 'aaa', 'benchmark': 'b2', 'seconds': 1.},
+        {'revision': 'bbb', 'benchmark': 'b1', 'seconds': 1.05},
+        {'revision': 'bbb', 'benchmark': 'b2', 'seconds': 2.},
+        {'revision': 'bbb', 'benchmark': 'b2', 'seconds': 1.5}]))
+    args = ('compare.py', 'aaa', 'bbb', '--history', str(history))
+    assert run_benchmark(*args) == 1
+    assert run_benchmark(*(args + ('--threshold', '0.6'))) == 0
+
+
+def test_stress_leaves_consistent_repository(tmpdir):
+    history = str(tmpdir.join('history.jsonl'))
+    assert run_benchmark(
+        'stress.py', '-n', '3', '--operations', '10', '--files', '3',
+        '--history', history) == 0
+    with open(history) as f:
+        results = [json.loads(line) for line in f]
+    assert 'stress.lock_wait[processes=3]' in [
+        r['benchmark'] for r in results]
+
+
+def test_memory_benchmarks_check_budgets(tmpdir):
+    history = str(tmpdir.join('history.jsonl'))
+    # Two sizes let the check compare the growth per file against the
+    # budgets, which the fixed allowance of the budgets cannot hide.
+    assert run_benchmark(
+        'memory.py', '--files', '1000', '10000', '--commits', '100',
+        '--check', '--history', history) == 0
+    with open(history) as f:
+        results = [json.loads(line) for line in f]
+    assert len(results) == 8
+    assert all(r['peak_bytes'] > 0 for r in results)
+    peaks = dict((r['benchmark'], r['peak_bytes']) for r in results)
+    # The larger input exceeds the fixed allowance of 4 MiB.
+    assert peaks['memory.snapshot.read[files=10000]'] > 4 * 2 ** 20
@@ -1,9 +1,13 @@
 import errno
+import hashlib
+import io
+import json
 import os
 import os.path
 import re
 import stat
 import sys
+import tarfile
 
 import scripttest
 
@@ -39,6 +43,18 @@ def test_persists_data():
         result.files_created['somefile'].full).st_mode) == mode
 
 
+def test_commits_only_changes():
+    env = scripttest.TestFileEnvironment()
+    env.run(sys.executable, FRIDGE, 'init')
+    env.writefile('somefile', b'with some content')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'First commit.')
+    result = env.run(
+        sys.executable, FRIDGE, 'commit', '-m', 'Second commit.',
+        expect_error=True)
+    assert result.returncode == 1
+    assert 'nothing to commit' in result.stderr
+
+
 def test_has_log():
     env = scripttest.TestFileEnvironment()
     env.run(sys.executable, FRIDGE, 'init')
@@ -80,3 +96,250 @@ Date: .*
     Exp 1 commit 1
 
 """.format(hash=HASH_REGEX), result.stdout)
+
+
+def test_lists_branches():
+    env = scripttest.TestFileEnvironment()
+    env.run(sys.executable, FRIDGE, 'init')
+    env.writefile('data1', b'one')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'First commit.')
+    env.run(sys.executable, FRIDGE, 'branch', 'exp2')
+    env.run(sys.executable, FRIDGE, 'pack-refs')
+    env.run(sys.executable, FRIDGE, 'branch', 'exp1')
+    result = env.run(sys.executable, FRIDGE, 'branch', '--list')
+    assert result.stdout == '* exp1\n  exp2\n  master\n'
+
+
+def test_finds_commit_of_file():
+    env = scripttest.TestFileEnvironment()
+    env.run(sys.executable, FRIDGE, 'init')
+    env.writefile('data1', b'one')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'First commit.')
+    env.writefile('data2', b'two')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'Second commit.')
+    log = env.run(sys.executable, FRIDGE, 'log').stdout
+    first_commit = re.findall(
+        'commit ({hash})'.format(hash=HASH_REGEX), log)[-1]
+
+    result = env.run(sys.executable, FRIDGE, 'whence', 'data1')
+    assert result.stdout == '{c} data1\n'.format(c=first_commit)
+
+
+def test_checks_out_links():
+    env = scripttest.TestFileEnvironment()
+    env.run(sys.executable, FRIDGE, 'init')
+    env.writefile('data1', b'one')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'First commit.')
+    env.run(sys.executable, FRIDGE, 'checkout', '--link=hard')
+    data1 = os.path.join(env.base_path, 'data1')
+    assert os.stat(data1).st_nlink == 2
+    assert not os.stat(data1).st_mode & (
+        stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+    env.writefile('data2', b'two')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'Second commit.')
+    assert os.stat(data1).st_nlink == 2
+
+    env.run(sys.executable, FRIDGE, 'checkout', '--link=copy')
+    assert os.stat(data1).st_nlink == 1
+    with open(data1, 'ab') as f:
+        f.write(b' one')
+    env.run(sys.executable, FRIDGE, 'checkout', '--link=sym')
+    assert os.path.islink(data1)
+    with open(data1, 'rb') as f:
+        assert f.read() == b'one'
+
+
+def test_partial_clone(tmpdir):
+    env = scripttest.TestFileEnvironment()
+    env.run(sys.executable, FRIDGE, 'init')
+    env.writefile('data1', b'one')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'First commit.')
+    env.run(sys.executable, FRIDGE, 'branch', 'exp2')
+    env.writefile('data2', b'two')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'Second commit.')
+    env.run(sys.executable, FRIDGE, 'checkout', 'master')
+
+    clone_env = scripttest.TestFileEnvironment(str(tmpdir.join('clone')))
+    clone_env.run(
+        sys.executable, FRIDGE, 'clone', '--partial', env.base_path, 'clone')
+    clone_dir = os.path.join(clone_env.base_path, 'clone')
+    key = hashlib.sha1(b'two').hexdigest()
+    blob = os.path.join(clone_dir, '.fridge', 'blobs', key[:2], key[2:])
+    assert not os.path.exists(blob)
+    result = clone_env.run(
+        sys.executable, FRIDGE, 'checkout', 'exp2', cwd=clone_dir)
+    assert result.files_created['clone/data2'].bytes == 'two'
+    assert os.path.exists(blob)
+
+def test_pushes_and_pulls(tmpdir):
+    env = scripttest.TestFileEnvironment()
+    env.run(sys.executable, FRIDGE, 'init')
+    env.writefile('data1', b'one')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'First commit.')
+
+    clone_env = scripttest.TestFileEnvironment(str(tmpdir.join('clone')))
+    clone_env.run(sys.executable, FRIDGE, 'init')
+    clone_env.run(
+        sys.executable, FRIDGE, 'remote', 'add', 'upstream', env.base_path)
+    # The marker of scripttest is committed upstream and pulling would
+    # overwrite the untracked one.
+    os.unlink(os.path.join(clone_env.base_path, '.scripttest-test-dir.txt'))
+    clone_env.run(
+        sys.executable, FRIDGE, 'pull', 'upstream', 'master',
+        expect_stderr=True)
+    assert clone_env.run(
+        sys.executable, FRIDGE, 'log').stdout == env.run(
+            sys.executable, FRIDGE, 'log').stdout
+
+    clone_env.run(sys.executable, FRIDGE, 'branch', 'exp')
+    clone_env.writefile('data2', b'two')
+    clone_env.run(sys.executable, FRIDGE, 'commit', '-m', 'Second commit.')
+    clone_env.run(
+        sys.executable, FRIDGE, 'push', 'upstream', expect_stderr=True)
+    result = env.run(sys.executable, FRIDGE, 'checkout', 'exp')
+    assert result.files_created['data2'].bytes == 'two'
+
+
+def test_transfers_bundles(tmpdir):
+    env = scripttest.TestFileEnvironment()
+    env.run(sys.executable, FRIDGE, 'init')
+    env.writefile('data1', b'one')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'First commit.')
+    env.run(sys.executable, FRIDGE, 'branch', 'exp')
+    bundle_path = str(tmpdir.join('exp.bundle'))
+    env.run(sys.executable, FRIDGE, 'bundle', 'create', '--gzip',
+            bundle_path, 'exp')
+
+    other_env = scripttest.TestFileEnvironment(str(tmpdir.join('other')))
+    other_env.run(sys.executable, FRIDGE, 'init')
+    result = other_env.run(
+        sys.executable, FRIDGE, 'bundle', 'unbundle', bundle_path)
+    assert re.match('{hash} exp\n'.format(hash=HASH_REGEX), result.stdout)
+    result = other_env.run(sys.executable, FRIDGE, 'checkout', 'exp')
+    assert result.files_created['data1'].bytes == 'one'
+
+
+def test_archives_snapshots():
+    env = scripttest.TestFileEnvironment()
+    env.run(sys.executable, FRIDGE, 'init')
+    env.writefile('data1', b'one')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'First commit.')
+    result = env.run(sys.executable, FRIDGE, 'archive', 'master')
+    assert result.files_created == {}
+    with tarfile.open(
+            fileobj=io.BytesIO(result.stdout.encode('latin-1'))) as tar:
+        assert tar.extractfile('data1').read() == b'one'
+
+
+def test_cats_and_restores_files():
+    env = scripttest.TestFileEnvironment()
+    env.run(sys.executable, FRIDGE, 'init')
+    env.writefile('data1', b'one')
+    env.writefile('data2', b'two')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'First commit.')
+    env.writefile('data1', b'one one')
+    env.writefile('data2', b'two two')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'Second commit.')
+    first = re.findall(
+        r'^commit (\w+)$', env.run(sys.executable, FRIDGE, 'log').stdout,
+        re.MULTILINE)[-1]
+
+    result = env.run(sys.executable, FRIDGE, 'cat', first + ':data1')
+    assert result.stdout == 'one'
+    result = env.run(
+        sys.executable, FRIDGE, 'restore', first, '--', 'data2')
+    assert result.files_updated['data2'].bytes == 'two'
+    assert 'data1' not in result.files_updated
+
+
+def test_sparse_checkout():
+    env = scripttest.TestFileEnvironment()
+    env.run(sys.executable, FRIDGE, 'init')
+    env.writefile('results/summary/data1', b'one')
+    env.writefile('results/raw/data2', b'two')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'First commit.')
+    result = env.run(
+        sys.executable, FRIDGE, 'sparse', 'set', 'results/summary')
+    assert 'results/raw/data2' in result.files_deleted
+    result = env.run(sys.executable, FRIDGE, 'sparse', 'list')
+    assert result.stdout == 'results/summary\n'
+    result = env.run(sys.executable, FRIDGE, 'sparse', 'disable')
+    assert result.files_created['results/raw/data2'].bytes == 'two'
+
+
+def test_writes_trace():
+    env = scripttest.TestFileEnvironment()
+    repo = os.path.join(env.base_path, 'repo')
+    os.mkdir(repo)
+    env.run(sys.executable, FRIDGE, 'init', cwd=repo)
+    env.writefile('repo/data1', b'one')
+    # The trace file must not be part of the working tree.
+    result = env.run(
+        sys.executable, FRIDGE, '--trace', os.path.join(
+            env.base_path, 'trace.jsonl'), 'commit', '-m', 'First commit.',
+        cwd=repo)
+    records = [json.loads(line) for line in result.files_created[
+        'trace.jsonl'].bytes.splitlines()]
+    assert records[-1]['name'] == 'fridge commit'
+    assert 'commit.store' in [r['name'] for r in records]
+
+
+def test_verifies_repository():
+    env = scripttest.TestFileEnvironment()
+    env.run(sys.executable, FRIDGE, 'init')
+    env.writefile('data1', b'one')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'First commit.')
+    result = env.run(sys.executable, FRIDGE, 'verify')
+    assert result.stdout == ''
+
+    key = hashlib.sha1(b'one').hexdigest()
+    blob = os.path.join(
+        env.base_path, '.fridge', 'blobs', key[:2], key[2:])
+    os.chmod(blob, stat.S_IRUSR | stat.S_IWUSR)
+    with open(blob, 'wb') as f:
+        f.write(b'corrupt')
+    result = env.run(sys.executable, FRIDGE, 'verify', expect_error=True)
+    assert result.returncode == 1
+    assert result.stdout == 'blob {}: content does not match\n'.format(key)
+
+
+def test_imports_archives():
+    env = scripttest.TestFileEnvironment()
+    env.run(sys.executable, FRIDGE, 'init')
+    env.writefile('data1', b'one')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'First commit.')
+    env.run(sys.executable, FRIDGE, 'archive', 'master', '-o', 'data.tar')
+    os.remove(os.path.join(env.base_path, 'data1'))
+    with open(os.path.join(env.base_path, 'data.tar'), 'rb') as f:
+        result = env.run(
+            sys.executable, FRIDGE, 'import-tar', '-b', 'imported', '-m',
+            'Import.', '-', stdin=f.read())
+    assert result.files_created == {}
+    env.run(sys.executable, FRIDGE, 'checkout', 'imported')
+    with open(os.path.join(env.base_path, 'data1'), 'rb') as f:
+        assert f.read() == b'one'
+
+
+def test_adds_worktrees():
+    env = scripttest.TestFileEnvironment()
+    env.run(sys.executable, FRIDGE, 'init')
+    env.writefile('data1', b'one')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'Exp 1 commit 1')
+    env.run(sys.executable, FRIDGE, 'branch', 'exp2')
+    env.writefile('data1', b'one one')
+    env.run(sys.executable, FRIDGE, 'commit', '-m', 'Exp 2 commit 1')
+    result = env.run(sys.executable, FRIDGE, 'worktree', 'add', 'wt', 'master')
+
+    assert result.files_created['wt/data1'].bytes == 'one'
+    wt_fridge_dir = os.path.join(env.base_path, 'wt', '.fridge')
+    assert os.path.exists(os.path.join(wt_fridge_dir, 'commondir'))
+    assert not os.path.exists(os.path.join(wt_fridge_dir, 'blobs'))
+    result = env.run(sys.executable, FRIDGE, 'log', cwd=os.path.join(
+        env.base_path, 'wt'))
+    assert re.match(r"""commit {hash}
+Date: .*
+
+    Exp 1 commit 1
+
+""".format(hash=HASH_REGEX), result.stdout)